@@ -7,6 +7,7 @@
 # reset:                Disregard existing working directory changes; match files to remote
 # status:               Determines whether the work-tree is clean (True) or dirty (False)
 # delete:               Removes the specified branch in locl and remote repositories
+# sync-all:             Fetch, merge and push the current branch of every repository under '--repos-root'
 #       *** Options ***
 # --debug:              Enable to display log messages for development
 # --force:              Enable to disregard the initialize repository prompt
@@ -15,9 +16,14 @@
 # --remote-path:        Remote, bare repository path (origin)
 # --local-path:         Specify where to create work repo; default is current directory
 # --gitignore-path:     Location of .gitignore file to use
+# --repos-root:         Directory searched for repositories by 'sync-all'; default is '--local-path'
+# --repos:              Repository names/paths for 'sync-all' (relative to '--repos-root'); default is all found
+# --jobs:               Number of repositories 'sync-all' synchronizes at a time; default is 4
+# --retries:            Retries of a fetch/push failing with a network error, with backoff; default is 3
 
 # from typing import Dict, List, Optional, Tuple
 import argparse
+import time
 from typing import List
 
 import git_boilerplate as bp_git
@@ -99,6 +105,9 @@ class GitController(object):
 
         # ------------------------ Work Repo (local repository) ------------------------
 
+        # Answer ref/status queries from one cached snapshot; commands that change the repo refresh it
+        self.session = bp_git.open_session(ARGS.local_path)
+
         # Ensure work repo exists
         # fail when not 'push' action and repo is missing
         no_create = (ARGS.action != "push")
@@ -106,15 +115,29 @@ class GitController(object):
             ARGS.local_path, ARGS.remote_path, no_create=no_create, force=True)
         LOG.debug(f"work_repository exists: {self.work_repository.exists}")
 
+        # State saved by previous runs in '.git/'; the stale parts reload when the index, refs or config change
+        self.state = bp_git.load_state(ARGS.local_path)
+
+        # Keep 'git status' cheap on large work-trees (untracked cache, fsmonitor); no 'git' call once enabled
+        bp_git.enable_fast_status(ARGS.local_path, self.state.core if self.state is not None else None)
+
         # Set work repo's remote path to bare repo
-        remote_result = bp_git.work_remote(
-            ARGS.local_path, ARGS.remote_path, ARGS.remote_alias)
-        if not remote_result:
-            LOG.error("Error occurred updating remote path")
-            sh.fail_process()
+        if self.state is not None and self.state.remotes.get(ARGS.remote_alias) == ARGS.remote_path:
+            LOG.debug(f"remote ({ARGS.remote_alias}) is already set to {ARGS.remote_path}")
+        else:
+            remote_result = bp_git.work_remote(
+                ARGS.local_path, ARGS.remote_path, ARGS.remote_alias)
+            if not remote_result:
+                LOG.error("Error occurred updating remote path")
+                sh.fail_process()
+
+        # Neither repository changed since the last successful push: fetch/merge/push would be no-ops
+        synced = ARGS.action in ["push", "pull"] and bp_git.is_synced(
+            ARGS.local_path, self.state, ARGS.remote_path, ARGS.remote_alias, ARGS.branch)
+        LOG.debug(f"unchanged since last push: {synced}")
 
         # Fetch the latest meta data; increases '.git' directory size
-        if ARGS.action in ["push", "pull"]:
+        if ARGS.action in ["push", "pull"] and not synced:
             bp_git.work_fetch(ARGS.local_path)
 
         # Update '.gitignore' based on hash check
@@ -122,10 +145,15 @@ class GitController(object):
             file_src = ARGS.gitignore_path
             file_dest = sh.join_path(ARGS.local_path, ".gitignore")
             if sh.path_exists(file_dest, "f"):
-                hash_result = sh.match_file(file_src, file_dest)
+                if self.state is not None:
+                    hash_result = (bp_git.state_file_hash(self.state, file_src)
+                                   == bp_git.state_file_hash(self.state, file_dest))
+                else:
+                    hash_result = sh.match_file(file_src, file_dest)
                 if not hash_result:
                     LOG.debug("'.gitignore' hashes don't match, updating...")
                     update_result = sh.copy_file(file_src, file_dest)
+                    self.session.invalidate()
                     if update_result:
                         LOG.debug("'.gitignore' was successfully updated!")
                     else:
@@ -136,6 +164,7 @@ class GitController(object):
             else:
                 LOG.debug("'.gitignore' is missing, adding...")
                 add_result = sh.copy_file(file_src, file_dest)
+                self.session.invalidate()
                 if add_result:
                     LOG.debug("'.gitignore' was successfully added!")
                 else:
@@ -170,6 +199,12 @@ class GitController(object):
         LOG.debug(f"version_local_branch_exists: {version_local_branch_exists}")
         LOG.debug(f"version_remote_branch_exists: {version_remote_branch_exists}")
 
+        # Nothing to commit, merge or push
+        if synced and work_tree_is_clean:
+            LOG.info(f"'{ARGS.branch}' branch is unchanged since the last push; nothing to do")
+            bp_git.save_state(ARGS.local_path, self.state)  # keeps new file hashes
+            return
+
         # Fail early when attempting to pull/delete a dirty work-tree
         if ARGS.action in ["pull", "delete"] and not work_tree_is_clean:
             LOG.error(f"Unable to perform '{ARGS.action}' action with dirty work-tree")
@@ -353,6 +388,29 @@ class GitController(object):
                 ARGS.local_path, ARGS.branch, ARGS.remote_alias)
             LOG.debug(f"'{ARGS.remote_alias}/{ARGS.branch}' branch push has succeeded: {push_succeeded}")
             # No need to refresh metadata again; the push will update references
+            if push_succeeded:
+                bp_git.mark_synced(ARGS.local_path, self.state, ARGS.remote_path, ARGS.remote_alias, ARGS.branch)
+
+
+# Synchronizes many repositories concurrently ('sync-all' action); fails the process when any repository failed
+def sync_all():
+    """Method that synchronizes every selected repository with its remote"""
+    repos_root = sh.expand_path(ARGS.repos_root or ARGS.local_path)
+    if ARGS.repos:
+        # An absolute path replaces 'repos_root' when joined
+        repo_paths = [sh.join_path(repos_root, repo) for repo in ARGS.repos]
+    else:
+        repo_paths = bp_git.find_repositories(repos_root)
+    if not repo_paths:
+        LOG.error(f"No repositories found under {repos_root}")
+        sh.fail_process()
+    LOG.info(f"Synchronizing {len(repo_paths)} repositories ({min(ARGS.jobs, len(repo_paths))} at a time)...")
+
+    start_time = time.perf_counter()
+    results = bp_git.sync_repositories(repo_paths, ARGS.remote_alias, ARGS.jobs, ARGS.retries)
+    bp_git.log_sync_summary(LOG, results, time.perf_counter() - start_time)
+    if any(result.status == "failed" for result in results):
+        sh.fail_process()
 
 
 # ------------------------ Main program ------------------------
@@ -371,14 +429,19 @@ if __name__ == "__main__":
         """Method that parses arguments provided"""
         parser = argparse.ArgumentParser()
         parser.add_argument("action", choices=[
-                            "push", "pull", "reset", "status", "delete"])
+                            "push", "pull", "reset", "status", "delete", "sync-all"])
         parser.add_argument("--debug", action="store_true")
+        parser.add_argument("--log-path", default="")
         parser.add_argument("--force", "-f", action="store_true")
         parser.add_argument("--branch", "-b", default=master_branch)
         parser.add_argument("--remote-alias", default="origin")
         parser.add_argument("--remote-path", default="~/my_origin_repo.git")
         parser.add_argument("--local-path", default=sh.current_path())
         parser.add_argument("--gitignore-path", default="")
+        parser.add_argument("--repos-root", default="")
+        parser.add_argument("--repos", nargs="*", default=[])
+        parser.add_argument("--jobs", type=int, default=4)
+        parser.add_argument("--retries", type=int, default=3)
         return parser.parse_args()
     ARGS = parse_arguments()
 
@@ -405,8 +468,12 @@ if __name__ == "__main__":
     if ARGS.debug:
         git_logger = log.get_logger("git_boilerplate")
         git_logger.setLevel(log_level)
+    bp_git.ARGS.debug = ARGS.debug
 
-    controller = GitController()
+    if ARGS.action == "sync-all":
+        sync_all()
+    else:
+        controller = GitController()
 
     # If we get to this point, assume all went well
     LOG.debug("--------------------------------------------------------")
@@ -416,3 +483,5 @@ if __name__ == "__main__":
     # :: Usage Example ::
     # mygit push --branch="Zoolander"
     # mygit push --debug --force --branch="Zoolander" --gitignore-path="~/.gitignore"
+    # mygit sync-all --repos-root="/mnt/e/Repos" --jobs=8
+    # mygit sync-all --repos-root="/mnt/e/Repos" --repos pc-setup DMR
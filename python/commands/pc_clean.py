@@ -2,8 +2,11 @@
 """Command to backup & clean the system platform"""
 
 import argparse
-from typing import List
+import importlib.util
+import time
+from typing import Any, Callable, Dict, List, Optional
 
+import backup_boilerplate as backup
 import logging_boilerplate as log
 import shell_boilerplate as sh
 from app_backup_data import app_backups
@@ -53,6 +56,65 @@ def run_ccleaner():
     sh.log_subprocess(LOG, process, ARGS.debug)
 
 
+# Builds the work of one backup entry, run by the backup scheduler (possibly alongside other entries)
+# - with 'store', the entry is written into the content-addressed store as tree 'tree_name' instead of 'dest'
+# - with '--archive', the entry is streamed into one compressed archive next to 'dest' instead
+# - 'metrics' collects where the time goes (the store and archive modes are timed as one phase)
+def backup_task(src: str, dest: str, options: Optional[Dict[str, Any]], screenshot: Optional[str] = None,
+                store: Optional[backup.ContentStore] = None, tree_name: str = '',
+                metrics: Optional[sh.SyncMetrics] = None) -> Callable[[], bool]:
+    """Method that returns the task which backs up one entry"""
+    metrics = metrics or sh.SyncMetrics()
+    # The manifest next to 'dest' lets later runs skip scanning the backup and copy only what changed
+    sync_options = {**(options or {}), 'manifest': sh.sync_manifest_path(dest), 'workers': ARGS.copy_workers,
+                    'metrics': metrics}
+    select_options = {'ignore': sh.SYNC_IGNORE_DEFAULTS, **(options or {})}
+
+    def task() -> bool:
+        if store:
+            with metrics.phase('store'):
+                result = store.backup_tree(tree_name, src, select_options, dry_run=ARGS.test_run)
+        elif ARGS.archive:
+            with metrics.phase('archive'):
+                result = backup.write_archive(backup.archive_path(dest, ARGS.archive), src, select_options,
+                                              dry_run=ARGS.test_run)
+        elif ARGS.test_run:
+            result = sh.sync_directory(src, dest, 'diff', options=sync_options)
+        else:
+            result = sh.sync_directory(src, dest, options=sync_options)
+            with metrics.phase('cleanup'):
+                dir_removed = sh.remove_empty_directories(dest, manifest=sync_options['manifest'])
+            LOG.debug(f'empty directories removed: {dir_removed.removed}')
+        # LOG.debug(f'sync_directory result: {result}')
+
+        # Clear source screenshot directory, only once the backup holds them (never for a test run or a failure)
+        if screenshot and result and not ARGS.test_run:
+            ss_path = sh.join_path(src, screenshot)
+            sh.delete_directory(ss_path)
+        return result
+    return task
+
+
+# Keeps every entry's backup current after the batch run: changed paths are synced as they settle
+# - '--daemon' detaches through daemon_boilerplate.DaemonContext (Unix only), otherwise it runs until Ctrl+C
+def watch_backups(targets: List[backup.WatchTarget]):
+    """Method that continuously backs up changed files"""
+    watcher = backup.BackupWatcher(targets, debounce=ARGS.debounce, use_polling=ARGS.poll, dry_run=ARGS.test_run)
+    if not ARGS.daemon:
+        watcher.run_forever()
+        return
+    import daemon_boilerplate  # imported here, it needs the Unix-only 'resource' module
+
+    class BackupDaemon(daemon_boilerplate.DaemonContext):
+        def run(self):
+            watcher.run_forever()
+
+        def terminate(self, *args):
+            watcher.stop()
+            super().terminate()
+    BackupDaemon(BASENAME, ARGS.log_path).open()
+
+
 # ------------------------ Main program ------------------------
 
 def main():
@@ -60,6 +122,12 @@ def main():
     allowed_ids = ARGS.id_filter if ARGS.id_filter else ALL_IDS
     backup_root = sh.join_path('D:\\', 'OneDrive', 'Backups')
     tasks = what_to_run()
+    # Reuse file hashes from earlier runs, so files unchanged since then are not read again
+    sh.open_hash_cache()
+    jobs: List[backup.BackupJob] = []
+    targets: List[backup.WatchTarget] = []
+    # Optional content-addressed store: duplicated or unchanged files cost only a tree manifest entry
+    store = backup.ContentStore(sh.join_path(backup_root, '.store')) if ARGS.store else None
 
     # -------- Backup the system platform --------
 
@@ -75,13 +143,11 @@ def main():
             DEST = sh.join_path(backup_root, 'Apps', APP.name)
             LOG.info(f'SRC path: {SRC}')
             LOG.info(f'DEST path: {DEST}')
-            if ARGS.test_run:
-                RESULT = sh.sync_directory(SRC, DEST, 'diff', options=APP.options)
-            else:
-                RESULT = sh.sync_directory(SRC, DEST, options=APP.options)
-                DIR_REMOVED = sh.remove_empty_directories(DEST)
-                LOG.debug(f'empty directories removed: {DIR_REMOVED}')
-            # LOG.debug(f'sync_directory RESULT: {RESULT}')
+            METRICS = sh.SyncMetrics()
+            TASK = backup_task(SRC, DEST, APP.options, store=store, tree_name=f'Apps/{APP.name}', metrics=METRICS)
+            jobs.append(backup.BackupJob(APP.id, SRC, DEST, TASK, METRICS))
+            WATCH_OPTIONS = {'ignore': sh.SYNC_IGNORE_DEFAULTS, **(APP.options or {})}
+            targets.append(backup.WatchTarget(APP.id, SRC, DEST, WATCH_OPTIONS))
 
     # --- Backup important game files (screenshots, settings, addons) ---
     if 'games' in tasks:
@@ -97,24 +163,31 @@ def main():
             DEST = sh.join_path(backup_root, 'Games', GAME.name)
             LOG.info(f'SRC path: {SRC}')
             LOG.info(f'DEST path: {DEST}')
-            if ARGS.test_run:
-                RESULT = sh.sync_directory(SRC, DEST, 'diff', options=GAME.options)
-            else:
-                RESULT = sh.sync_directory(SRC, DEST, options=GAME.options)
-                DIR_REMOVED = sh.remove_empty_directories(DEST)
-                LOG.debug(f'empty directories removed: {DIR_REMOVED}')
-            # LOG.debug(f'sync_directory RESULT: {RESULT}')
-
-            # Clear source screenshot directory
-            if GAME.screenshot:
-                ss_path = sh.join_path(SRC, GAME.screenshot)
-                sh.delete_directory(ss_path)
+            METRICS = sh.SyncMetrics()
+            TASK = backup_task(SRC, DEST, GAME.options, GAME.screenshot, store=store, tree_name=f'Games/{GAME.name}',
+                               metrics=METRICS)
+            jobs.append(backup.BackupJob(GAME.id, SRC, DEST, TASK, METRICS))
+            WATCH_OPTIONS = {'ignore': sh.SYNC_IGNORE_DEFAULTS, **GAME.options}
+            targets.append(backup.WatchTarget(GAME.id, SRC, DEST, WATCH_OPTIONS))
+
+    # Entries touch disjoint trees; '--jobs' and '--device-jobs' bound how many run at once
+    start_time = time.perf_counter()
+    results = backup.run_backups(jobs, ARGS.jobs, ARGS.device_jobs)
+    backup.log_backup_summary(LOG, results, time.perf_counter() - start_time)
+    backup.log_metrics_summary(LOG, results)
+    if ARGS.metrics:
+        backup.write_metrics(ARGS.metrics, results)
 
     # --- Clean the system platform / health check ---
     if 'clean' in tasks and not ARGS.test_run:
         LOG.info('--- Cleaning system platform ---')
         run_ccleaner()
 
+    # --- Keep the backups current (mirrored backups only) ---
+    if ARGS.watch and not ARGS.store and not ARGS.archive:
+        LOG.info('--- Watching for changes ---')
+        watch_backups(targets)
+
 
 # Initialize the logger
 BASENAME = 'pc_clean'
@@ -132,7 +205,22 @@ if __name__ == '__main__':
         parser.add_argument('--only-apps', action='store_true')
         parser.add_argument('--only-games', action='store_true')
         parser.add_argument('--only-clean', action='store_true')
-        return parser.parse_args()
+        parser.add_argument('--jobs', type=int, default=1)  # backup entries run at once (up to --device-jobs per drive)
+        parser.add_argument('--device-jobs', type=int, default=1)  # per drive; raise for SSDs
+        parser.add_argument('--copy-workers', type=int, default=1)  # files copied at once per entry; raise for SSDs
+        parser.add_argument('--metrics', default='')  # append per-entry metrics to this file as JSON lines
+        parser.add_argument('--store', action='store_true')  # back up into the content-addressed store
+        parser.add_argument('--watch', action='store_true')  # keep syncing changed files after the backup
+        parser.add_argument('--debounce', type=float, default=2.0)  # seconds a source must be quiet before a sync
+        parser.add_argument('--poll', action='store_true')  # poll for changes instead of using 'watchdog'
+        parser.add_argument('--daemon', action='store_true')  # detach the watcher (Unix only)
+        parser.add_argument('--archive', nargs='?', const=backup.default_archive_format(), default='',
+                            choices=backup.ARCHIVE_FORMATS)  # one compressed archive per entry
+        args = parser.parse_args()
+        # daemon_boilerplate needs the Unix-only 'resource' module; refuse now, not after the whole batch ran
+        if args.daemon and importlib.util.find_spec('resource') is None:
+            parser.error("--daemon is not supported on this platform (no 'resource' module); use --watch")
+        return args
     ARGS = parse_arguments()
 
     # Configure the logger
@@ -152,3 +240,9 @@ if __name__ == '__main__':
     # --- Usage Example ---
     # pc_clean --filter_id=elite_dangerous --filter_id=terraria
     # pc_clean --only-apps
+    # pc_clean --only-games --jobs=4 --device-jobs=2
+    # pc_clean --only-games --store
+    # pc_clean --only-games --copy-workers=8
+    # pc_clean --only-games --watch --debounce=5
+    # pc_clean --only-apps --archive
+    # pc_clean --only-apps --archive=zip
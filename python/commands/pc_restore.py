@@ -2,8 +2,10 @@
 """Command to restore important files on the system platform"""
 
 import argparse
-from typing import List
+import time
+from typing import Any, Callable, Dict, List, Optional
 
+import backup_boilerplate as backup
 import logging_boilerplate as log
 import shell_boilerplate as sh
 from app_backup_data import app_backups
@@ -33,6 +35,37 @@ def keep_dir_name(path1: str, path2: str) -> str:
     return path2
 
 
+# Builds the work of one restore entry, run by the backup scheduler (possibly alongside other entries)
+# - with 'store', the entry is read from tree 'tree_name' of the content-addressed store instead of 'src'
+# - with '--archive', only the selected entries are extracted from the archive pc_clean wrote next to 'src'
+# - 'metrics' collects where the time goes (the store and archive modes are timed as one phase)
+def restore_task(src: str, dest: str, options: Optional[Dict[str, Any]], ignore: Optional[List[str]] = None,
+                 store: Optional[backup.ContentStore] = None, tree_name: str = '',
+                 metrics: Optional[sh.SyncMetrics] = None) -> Callable[[], bool]:
+    """Method that returns the task which restores one entry"""
+    metrics = metrics or sh.SyncMetrics()
+    # The manifest pc_clean wrote next to the backup ('src') lists it, so neither tree needs a full scan
+    sync_options = {**(options or {}), 'source_manifest': sh.sync_manifest_path(src), 'workers': ARGS.copy_workers,
+                    'metrics': metrics}
+    select_options = {'ignore': [*sh.SYNC_IGNORE_DEFAULTS, *(ignore or [])], **(options or {})}
+
+    def task() -> bool:
+        if store:
+            with metrics.phase('store'):
+                result = store.restore_tree(tree_name, dest, select_options, dry_run=ARGS.test_run)
+        elif ARGS.archive:
+            with metrics.phase('archive'):
+                result = backup.extract_archive(backup.find_archive(src) or backup.archive_path(src), dest,
+                                                select_options, dry_run=ARGS.test_run)
+        elif ARGS.test_run:
+            result = sh.sync_directory(src, dest, 'diff', options=sync_options, ignore=ignore)
+        else:
+            result = sh.sync_directory(src, dest, options=sync_options, ignore=ignore)
+        # LOG.debug(f'sync_directory result: {result}')
+        return result
+    return task
+
+
 # ------------------------ Main program ------------------------
 
 def main():
@@ -40,6 +73,8 @@ def main():
     allowed_ids = ARGS.id_filter if ARGS.id_filter else ALL_IDS
     backup_root = sh.join_path('D:\\', 'OneDrive', 'Backups')
     tasks = what_to_run()
+    jobs: List[backup.BackupJob] = []
+    store = backup.ContentStore(sh.join_path(backup_root, '.store')) if ARGS.store else None
 
     # -------- Backup the system platform --------
 
@@ -56,11 +91,9 @@ def main():
             DEST = sh.join_path(APP.root, APP.name)
             LOG.info(f'SRC path: {SRC}')
             LOG.info(f'DEST path: {DEST}')
-            if ARGS.test_run:
-                RESULT = sh.sync_directory(SRC, DEST, 'diff', options=APP.options)
-            else:
-                RESULT = sh.sync_directory(SRC, DEST, options=APP.options)
-            # LOG.debug(f'sync_directory RESULT: {RESULT}')
+            METRICS = sh.SyncMetrics()
+            TASK = restore_task(SRC, DEST, APP.options, store=store, tree_name=f'Apps/{APP.name}', metrics=METRICS)
+            jobs.append(backup.BackupJob(APP.id, SRC, DEST, TASK, METRICS))
 
     # --- Backup important game files (screenshots, settings, addons) ---
     if 'games' in tasks:
@@ -80,14 +113,21 @@ def main():
             DEST = sh.join_path(GAME.root, GAME.name)
             LOG.info(f'SRC path: {SRC}')
             LOG.info(f'DEST path: {DEST}')
-            if ARGS.test_run:
-                RESULT = sh.sync_directory(SRC, DEST, 'diff', options=GAME.options, ignore=ignore_options)
-            else:
-                RESULT = sh.sync_directory(SRC, DEST, options=GAME.options, ignore=ignore_options)
-            # LOG.debug(f'sync_directory RESULT: {RESULT}')
+            METRICS = sh.SyncMetrics()
+            TASK = restore_task(SRC, DEST, GAME.options, ignore_options, store=store, tree_name=f'Games/{GAME.name}',
+                                metrics=METRICS)
+            jobs.append(backup.BackupJob(GAME.id, SRC, DEST, TASK, METRICS))
 
             # NEVER clear source screenshot directory for restore
 
+    # Entries touch disjoint trees; '--jobs' and '--device-jobs' bound how many run at once
+    start_time = time.perf_counter()
+    results = backup.run_backups(jobs, ARGS.jobs, ARGS.device_jobs)
+    backup.log_backup_summary(LOG, results, time.perf_counter() - start_time)
+    backup.log_metrics_summary(LOG, results)
+    if ARGS.metrics:
+        backup.write_metrics(ARGS.metrics, results)
+
 
 # Initialize the logger
 BASENAME = 'pc_restore'
@@ -104,6 +144,12 @@ if __name__ == '__main__':
         parser.add_argument('--test-run', action='store_true')
         parser.add_argument('--only-apps', action='store_true')
         parser.add_argument('--only-games', action='store_true')
+        parser.add_argument('--jobs', type=int, default=1)  # restore entries run at once
+        parser.add_argument('--device-jobs', type=int, default=1)  # per drive; raise for SSDs
+        parser.add_argument('--copy-workers', type=int, default=1)  # files copied at once per entry; raise for SSDs
+        parser.add_argument('--metrics', default='')  # append per-entry metrics to this file as JSON lines
+        parser.add_argument('--store', action='store_true')  # restore from the content-addressed store
+        parser.add_argument('--archive', action='store_true')  # restore from the archives '--archive' wrote
         return parser.parse_args()
     ARGS = parse_arguments()
 
@@ -124,3 +170,6 @@ if __name__ == '__main__':
     # --- Usage Example ---
     # pc_restore --filter_id=elite_dangerous --filter_id=terraria
     # pc_restore --only-apps
+    # pc_restore --only-games --jobs=4 --device-jobs=2
+    # pc_restore --only-games --store
+    # pc_restore --only-apps --archive
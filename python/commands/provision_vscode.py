@@ -138,9 +138,12 @@ def list_extensions_unexpected(installed: List[str]) -> List[str]:
 
 
 # https://code.visualstudio.com/docs/editor/extension-marketplace#_command-line-extension-management
-def install_extension(extension_id: str) -> bool:
-    """Method that installs a VS Code extension"""
-    command: List[str] = ['code', '--install-extension', extension_id]
+# One 'code' process takes every '--install-extension' flag; separate processes would race on extensions.json
+def install_extensions(extension_ids: List[str]) -> bool:
+    """Method that installs VS Code extensions"""
+    command: List[str] = ['code']
+    for extension_id in extension_ids:
+        command.extend(['--install-extension', extension_id])
     process = sh.run_subprocess(command)
     sh.log_subprocess(LOG, process, debug=ARGS.debug)
     return process.returncode == 0
@@ -177,9 +180,9 @@ if __name__ == '__main__':
     LOG.info(f'extensions unexpected: {extensions_unexpected}')
 
     # --- Install missing extensions as needed ---
-    for extension in extensions_to_install:
-        LOG.debug(f'preparing to install "{extension}" extension...')
-        install_extension(extension)
+    if extensions_to_install:
+        LOG.debug(f'preparing to install {len(extensions_to_install)} extensions...')
+        install_extensions(extensions_to_install)
 
     # Upgrade to extensions not necessary - VS Code handles automatically
 
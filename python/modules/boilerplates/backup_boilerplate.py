@@ -0,0 +1,989 @@
+#!/usr/bin/env python
+"""Common logic for scheduling backup jobs and storing backups"""
+
+# --- Global Backup Commands ---
+# Device:           device_key
+# Scheduler:        run_backups, log_backup_summary
+# Metrics:          log_metrics_summary, write_metrics
+# Archive:          archive_path, find_archive, write_archive, extract_archive
+
+# --- ContentStore Class Commands ---
+# backup_tree, restore_tree, read_tree, put_file, collect_garbage
+
+# --- BackupWatcher Class Commands ---
+# start, stop, run_forever, queue_path, flush
+
+# :: Usage Instructions ::
+# * Wrap each backup entry in a BackupJob with its 'src', 'dest' and a 'task' to call
+# * run_backups() runs up to 'max_jobs' at once, and never more than 'device_jobs' per device (drive)
+# * The defaults (1 job, 1 per device) keep the old one-at-a-time behavior, which is safest for spinning disks
+# * ContentStore is an optional alternative to mirrored backup trees: files are split into chunks stored once
+#   by hash (shared by every tree), and each backup target only writes a tree manifest
+# * write_archive() streams a backup target into one compressed archive ('tar.zst' needs 'zstandard', else
+#   'zip'), so cloud sync uploads one file per target instead of thousands of small ones
+# * BackupWatcher keeps WatchTargets current between runs: changed paths are queued from filesystem events
+#   ('watchdog': inotify, ReadDirectoryChangesW, FSEvents; else polling) and only those paths are synced
+# * Give a BackupJob a shell_boilerplate.SyncMetrics (also passed to its sync as the 'metrics' option) and
+#   log_metrics_summary()/write_metrics() report where each target's time went
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import logging_boilerplate as log
+import shell_boilerplate as sh
+
+try:
+    import zstandard  # optional, only needed for 'tar.zst' archives
+except ImportError:
+    zstandard = None
+try:
+    import watchdog.events  # optional, BackupWatcher polls without it
+    import watchdog.observers
+except ImportError:
+    watchdog = None
+
+# ------------------------ Classes ------------------------
+
+
+@dataclass
+class BackupJob:
+    """Class model of a backup job to schedule"""
+    id: str  # name shown in the summary
+    src: str  # source path; its device counts toward the per-device limit
+    dest: str  # destination path; its device counts toward the per-device limit
+    task: Callable[[], bool]  # runs the backup, returns whether it succeeded
+    metrics: Optional[sh.SyncMetrics] = field(default=None)  # filled by the task, reported with the result
+
+
+@dataclass
+class BackupResult:
+    """Class model of a finished backup job"""
+    id: str
+    success: bool
+    seconds: float
+    error: str = field(default='')
+    metrics: Optional[sh.SyncMetrics] = field(default=None)
+
+
+@dataclass
+class WatchTarget:
+    """Class model of a directory the backup watcher keeps mirrored"""
+    id: str
+    src: str
+    dest: str
+    options: Dict[str, Any] = field(default_factory=dict)  # sync options (only, include, exclude, ignore, purge)
+
+
+# Layout under 'root':
+#   blobs/<2 hex>/<sha256>    chunk contents, written once no matter how many files share them
+#   trees/<name>.json         {'/'-separated path: [size, mtime_ns, [chunk hashes]]}, size -1 for a directory
+# - a file whose size + mtime match the previous tree only costs its manifest entry (no read, no write)
+# - chunks are fixed size, so an appended/edited large file only stores the chunks that changed position-wise
+# - blobs and trees are written to a temporary name then renamed, so concurrent jobs and crashes never leave
+#   partial files behind
+class ContentStore(object):
+    """Class of a content-addressed, deduplicating backup store"""
+
+    _VERSION = 1
+
+    def __init__(self, root: str, chunk_size: int = 4 * 1024 * 1024):
+        self.root: str = root
+        self.chunk_size: int = max(1, int(chunk_size))
+        self.blob_dir: str = os.path.join(root, 'blobs')
+        self.tree_dir: str = os.path.join(root, 'trees')
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _tree_path(self, name: str) -> str:
+        return os.path.join(self.tree_dir, *name.replace('\\', '/').split('/')) + '.json'
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    # Raises (OSError, ValueError) for a tree that exists but cannot be read: treating it as empty would drop every
+    # file it lists from the next backup, and its blobs from collect_garbage
+    def read_tree(self, name: str) -> Dict[str, List[Any]]:
+        """Method that returns the entries of a stored tree (empty when there is none)"""
+        try:
+            with open(self._tree_path(name), 'r', encoding='utf-8') as file:
+                tree = json.load(file)
+        except FileNotFoundError:
+            return {}
+        entries = tree.get('entries') if isinstance(tree, dict) and tree.get('version') == self._VERSION else None
+        if not isinstance(entries, dict):
+            raise ValueError(f'unreadable tree {name}')
+        return entries
+
+    def put_file(self, path: str) -> Tuple[List[str], int]:
+        """Method that stores a file's chunks, returning (chunk hashes, bytes written)"""
+        chunks: List[str] = []
+        written = 0
+        with open(path, 'rb') as file:
+            while True:
+                data = file.read(self.chunk_size)
+                if not data:
+                    break
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append(digest)
+                blob_path = self._blob_path(digest)
+                if not os.path.exists(blob_path):
+                    self._write_atomic(blob_path, data)
+                    written += len(data)
+        return (chunks, written)
+
+    def backup_tree(self, name: str, sourcedir: str, options: Optional[Dict[str, Any]] = None,
+                    dry_run: bool = False) -> bool:
+        """Method that backs up a directory into the store as tree 'name'"""
+        if not os.path.isdir(sourcedir):
+            LOG.error(f'Source directory does not exist: {sourcedir}')
+            return False
+        start_time = time.perf_counter()
+        try:
+            previous = self.read_tree(name)
+        except (OSError, ValueError) as e:
+            LOG.error(f'{type(e).__name__}: {e}')  # left as is, so the stored history can still be recovered
+            return False
+        entries: Dict[str, List[Any]] = {}
+        counts = {'reused': 0, 'stored': 0, 'retained': 0, 'failed': 0}
+        written = 0
+        for (rel_path, entry) in sh.select_entries(sourcedir, options or {}):
+            re_path = rel_path.replace(os.sep, '/')
+            try:
+                if entry.is_symlink():
+                    LOG.debug(f'Skipping symlink {entry.path}')
+                    continue
+                if entry.is_dir():
+                    entries[re_path] = [-1, 0, []]
+                    continue
+                file_stat = entry.stat()
+                old_entry = previous.get(re_path)
+                if old_entry and old_entry[0] == file_stat.st_size and old_entry[1] == file_stat.st_mtime_ns:
+                    entries[re_path] = old_entry
+                    counts['reused'] += 1
+                    continue
+                if dry_run:
+                    LOG.info(f'>> {re_path}')
+                    continue
+                (chunks, chunk_bytes) = self.put_file(entry.path)
+                entries[re_path] = [file_stat.st_size, file_stat.st_mtime_ns, chunks]
+                counts['stored'] += 1
+                written += chunk_bytes
+            except OSError as e:
+                LOG.error(f'{type(e).__name__}: {e}')
+                counts['failed'] += 1
+                if re_path in previous:
+                    entries[re_path] = previous[re_path]  # keep the last good copy
+        # Like the mirrored backups, entries gone from the source (e.g. the cleared Screenshots) are kept unless 'purge'
+        # is set; not under a path that is now a file
+        purge = bool((options or {}).get('purge'))
+        for re_path in sorted(set(previous) - set(entries)):
+            if purge:
+                LOG.debug(f'<< {re_path}')
+                continue
+            parents = re_path.split('/')[:-1]
+            if any(entries.get('/'.join(parents[:depth]), [-1])[0] >= 0 for depth in range(1, len(parents) + 1)):
+                continue
+            entries[re_path] = previous[re_path]
+            counts['retained'] += 1
+        if not dry_run:
+            tree = {'version': self._VERSION, 'source': sourcedir, 'entries': entries}
+            self._write_atomic(self._tree_path(name), json.dumps(tree, separators=(',', ':')).encode('utf-8'))
+        LOG.info(f"{name}: {counts['stored']} files stored ({written} new bytes), {counts['reused']} unchanged, "
+                 f"{counts['retained']} kept from earlier runs, {counts['failed']} failed in "
+                 f"{time.perf_counter() - start_time:.2f} seconds")
+        return counts['failed'] == 0
+
+    def restore_tree(self, name: str, targetdir: str, options: Optional[Dict[str, Any]] = None,
+                     dry_run: bool = False) -> bool:
+        """Method that restores tree 'name' from the store into a directory"""
+        try:
+            entries = self.read_tree(name)
+        except (OSError, ValueError) as e:
+            LOG.error(f'{type(e).__name__}: {e}')
+            return False
+        if not entries:
+            LOG.error(f'No stored tree: {name}')
+            return False
+        is_selected = sh.sync_selector(options or {})
+        counts = {'restored': 0, 'unchanged': 0, 'failed': 0}
+        for (re_path, (size, mtime_ns, chunks)) in sorted(entries.items()):
+            if not is_selected(re_path):
+                continue
+            target = os.path.join(targetdir, *re_path.split('/'))
+            try:
+                if size < 0:
+                    if not dry_run:
+                        os.makedirs(target, exist_ok=True)
+                    continue
+                try:
+                    target_stat = os.stat(target)
+                    if target_stat.st_size == size and target_stat.st_mtime_ns == mtime_ns:
+                        counts['unchanged'] += 1
+                        continue
+                except FileNotFoundError:
+                    pass
+                if dry_run:
+                    LOG.info(f'>> {re_path}')
+                    continue
+                self._restore_file(target, chunks)
+                os.utime(target, ns=(mtime_ns, mtime_ns))
+                counts['restored'] += 1
+            except (OSError, ValueError) as e:
+                LOG.error(f'{type(e).__name__}: {e}')
+                counts['failed'] += 1
+        LOG.info(f"{name}: {counts['restored']} files restored, {counts['unchanged']} unchanged, "
+                 f"{counts['failed']} failed")
+        return counts['failed'] == 0
+
+    # Chunks are verified against their hash before the file replaces the target
+    def _restore_file(self, target: str, chunks: List[str]):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(temp_path, 'wb') as file:
+                for digest in chunks:
+                    with open(self._blob_path(digest), 'rb') as blob:
+                        data = blob.read()
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise ValueError(f'corrupt blob {digest}')
+                    file.write(data)
+            os.replace(temp_path, target)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    # Only run while no backup is writing to the store; a blob written by a running backup is not referenced yet
+    # - raises before deleting anything when a tree cannot be listed or read (see read_tree)
+    def collect_garbage(self) -> int:
+        """Method that deletes blobs no stored tree references, returning how many were deleted"""
+        referenced = set()
+
+        # A tree that cannot be listed would leave its blobs unreferenced, so only a missing directory is skipped
+        def missing_ok(error: OSError):
+            if not isinstance(error, FileNotFoundError):
+                raise error
+        for (rel_path, _, entry) in sh.walk_parallel(self.tree_dir, onerror=missing_ok):
+            if entry.is_dir() or not rel_path.endswith('.json'):
+                continue
+            for (_, _, chunks) in self.read_tree(rel_path[:-5]).values():
+                referenced.update(chunks)
+        deleted = 0
+        for (_, _, entry) in sh.walk_parallel(self.blob_dir, onerror=missing_ok):
+            if not entry.is_dir() and entry.name not in referenced:
+                os.remove(entry.path)
+                deleted += 1
+        return deleted
+
+
+# Queues paths changed under each target's 'src' and, once a target has been quiet for 'debounce' seconds (or
+# has waited 'max_delay' seconds), syncs only those paths into 'dest'
+# - events come from 'watchdog' when it is installed, else from comparing (size, mtime) snapshots every
+#   'poll_interval' seconds; either way nothing else under 'src' is read
+# - a queued directory (created or moved in) is synced with everything selected below it
+# - deletions only reach 'dest' with the 'purge' option, the same as sync_directory
+# - files are copied when size or mtime differ; 'dest' manifests are not updated, so the next batch sync may
+#   copy those files once more (harmless)
+class BackupWatcher(object):
+    """Class of a continuous backup that syncs changed paths only"""
+
+    def __init__(self, targets: List[WatchTarget], debounce: float = 2.0, max_delay: float = 30.0,
+                 poll_interval: float = 10.0, use_polling: bool = False, dry_run: bool = False):
+        self.targets: Dict[str, WatchTarget] = {target.id: target for target in targets}
+        self.debounce: float = debounce
+        self.max_delay: float = max_delay
+        self.poll_interval: float = poll_interval
+        self.use_polling: bool = use_polling or not watchdog
+        self.dry_run: bool = dry_run
+        self._pending: Dict[str, set] = {}
+        self._first_event: Dict[str, float] = {}
+        self._last_event: Dict[str, float] = {}
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._observer: Any = None
+        self._poller: Optional[threading.Thread] = None
+
+    def queue_path(self, target_id: str, path: str):
+        """Method that queues a changed path (absolute, under the target's 'src') for the next sync"""
+        target = self.targets[target_id]
+        rel_path = os.path.relpath(path, target.src)
+        if rel_path == os.curdir or rel_path.startswith(os.pardir):
+            return
+        now = time.monotonic()
+        with self._condition:
+            self._pending.setdefault(target_id, set()).add(rel_path)
+            self._first_event.setdefault(target_id, now)
+            self._last_event[target_id] = now
+            self._condition.notify_all()
+
+    def start(self):
+        """Method that starts watching every target's 'src'"""
+        self._stopped.clear()
+        sources = {target_id: target.src for (target_id, target) in self.targets.items() if os.path.isdir(target.src)}
+        for target_id in sorted(set(self.targets) - set(sources)):
+            LOG.warning(f'{target_id}: source directory does not exist: {self.targets[target_id].src}')
+        if self.use_polling:
+            LOG.info(f'Polling {len(sources)} directories every {self.poll_interval} seconds')
+            self._poller = threading.Thread(target=self._poll, args=(sources,), name='backup-poller', daemon=True)
+            self._poller.start()
+            return
+        self._observer = watchdog.observers.Observer()
+        for (target_id, src) in sources.items():
+            self._observer.schedule(_WatchHandler(self, target_id), src, recursive=True)
+        self._observer.start()
+        LOG.info(f'Watching {len(sources)} directories for changes')
+
+    def stop(self):
+        """Method that stops watching; queued paths are left unsynced"""
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+
+    def run_forever(self):
+        """Method that watches and syncs until stop() is called (or the process is interrupted)"""
+        self.start()
+        try:
+            while not self._stopped.is_set():
+                target_id = self._wait_for_target()
+                if target_id:
+                    self.flush(target_id)
+        except KeyboardInterrupt:
+            LOG.info('Interrupted')
+        finally:
+            self.stop()
+
+    # Blocks until a target is due (quiet for 'debounce', or waiting for 'max_delay'), or the watcher stops
+    def _wait_for_target(self) -> str:
+        with self._condition:
+            while not self._stopped.is_set():
+                now = time.monotonic()
+                wait_time = None
+                for target_id in self._pending:
+                    due_time = min(self._last_event[target_id] + self.debounce,
+                                   self._first_event[target_id] + self.max_delay)
+                    if due_time <= now:
+                        return target_id
+                    wait_time = due_time - now if wait_time is None else min(wait_time, due_time - now)
+                self._condition.wait(wait_time)
+        return ''
+
+    def flush(self, target_id: str) -> Dict[str, int]:
+        """Method that syncs the queued paths of a target, returning counts of what was done"""
+        with self._condition:
+            rel_paths = self._pending.pop(target_id, set())
+            self._first_event.pop(target_id, None)
+            self._last_event.pop(target_id, None)
+        target = self.targets[target_id]
+        matcher = sh.sync_matcher(target.options)
+        counts = {'copied': 0, 'deleted': 0, 'unchanged': 0, 'failed': 0}
+        done = set()
+        for rel_path in sorted(rel_paths):
+            source = os.path.join(target.src, rel_path)
+            try:
+                if os.path.isdir(source):
+                    entries = [(rel_path, None)] + list(sh.select_entries(target.src, target.options, rel_path))
+                    for (entry_path, _) in entries:
+                        if entry_path not in done:
+                            done.add(entry_path)
+                            self._sync_path(target, entry_path, matcher, counts)
+                elif rel_path not in done:
+                    done.add(rel_path)
+                    self._sync_path(target, rel_path, matcher, counts)
+            except OSError as e:
+                LOG.error(f'{type(e).__name__}: {e}')
+                counts['failed'] += 1
+        LOG.info(f"{target_id}: {counts['copied']} copied, {counts['deleted']} deleted, "
+                 f"{counts['unchanged']} unchanged, {counts['failed']} failed ({len(rel_paths)} queued paths)")
+        return counts
+
+    def _sync_path(self, target: WatchTarget, rel_path: str, matcher: Any, counts: Dict[str, int]):
+        if not matcher.selected(rel_path.replace(os.sep, '/')):
+            return
+        source = os.path.join(target.src, rel_path)
+        dest = os.path.join(target.dest, rel_path)
+        try:
+            source_stat = os.stat(source)
+        except FileNotFoundError:
+            if target.options.get('purge') and os.path.lexists(dest):
+                LOG.info(f'Deleting {dest}')
+                if not self.dry_run:
+                    if os.path.isdir(dest) and not os.path.islink(dest):
+                        shutil.rmtree(dest)
+                    else:
+                        os.remove(dest)
+                counts['deleted'] += 1
+            return
+        if stat.S_ISDIR(source_stat.st_mode):
+            if not self.dry_run:
+                os.makedirs(dest, exist_ok=True)
+            return
+        try:
+            dest_stat = os.stat(dest)
+            if dest_stat.st_size == source_stat.st_size and dest_stat.st_mtime_ns == source_stat.st_mtime_ns:
+                counts['unchanged'] += 1
+                return
+        except FileNotFoundError:
+            pass
+        LOG.info(f'Copying {dest}')
+        if not self.dry_run and not sh.copy_file(source, dest):
+            counts['failed'] += 1
+            return
+        counts['copied'] += 1
+
+    # Polling fallback: compares (size, mtime) snapshots of the selected entries and queues the differences
+    def _poll(self, sources: Dict[str, str]):
+        snapshots = {target_id: self._snapshot(target_id) for target_id in sources}
+        while not self._stopped.wait(self.poll_interval):
+            for (target_id, src) in sources.items():
+                snapshot = self._snapshot(target_id)
+                previous = snapshots[target_id]
+                for rel_path in {*snapshot, *previous}:
+                    if snapshot.get(rel_path) != previous.get(rel_path):
+                        self.queue_path(target_id, os.path.join(src, rel_path))
+                snapshots[target_id] = snapshot
+
+    def _snapshot(self, target_id: str) -> Dict[str, Tuple[int, int]]:
+        target = self.targets[target_id]
+        snapshot: Dict[str, Tuple[int, int]] = {}
+        for (rel_path, entry) in sh.select_entries(target.src, target.options):
+            try:
+                file_stat = entry.stat(follow_symlinks=False)
+                snapshot[rel_path] = (-1, 0) if entry.is_dir(follow_symlinks=False) else \
+                    (file_stat.st_size, file_stat.st_mtime_ns)
+            except OSError:
+                pass
+        return snapshot
+
+
+# Forwards watchdog events to a BackupWatcher (moves queue both ends; plain opens and reads are ignored)
+class _WatchHandler(watchdog.events.FileSystemEventHandler if watchdog else object):
+    def __init__(self, watcher: BackupWatcher, target_id: str):
+        super().__init__()
+        self.watcher: BackupWatcher = watcher
+        self.target_id: str = target_id
+
+    def on_any_event(self, event: Any):
+        if event.event_type in ('opened', 'closed_no_write'):
+            return
+        self.watcher.queue_path(self.target_id, os.fsdecode(event.src_path))
+        if getattr(event, 'dest_path', ''):
+            self.watcher.queue_path(self.target_id, os.fsdecode(event.dest_path))
+
+
+# ------------------------ Global Backup Commands ------------------------
+
+# --- Device Commands ---
+
+# Identifies the device (drive) a path lives on, even when the path does not exist yet
+# - Windows uses the drive letter or UNC share; *nix uses st_dev of the nearest existing parent
+def device_key(path: str) -> str:
+    """Method that returns a key for the device a path is stored on"""
+    full_path = os.path.abspath(path)
+    if sh.system_platform() == 'windows':
+        return os.path.splitdrive(full_path)[0].upper()
+    while not os.path.exists(full_path):
+        parent = os.path.dirname(full_path)
+        if parent == full_path:
+            break
+        full_path = parent
+    try:
+        return str(os.stat(full_path).st_dev)
+    except OSError:
+        return full_path
+
+
+# --- Scheduler Commands ---
+
+# Runs jobs concurrently; a job only starts once every device it touches is below 'device_jobs'
+# - results keep the order of 'jobs'; a task that raises is reported as failed instead of stopping the others
+# - a device every job touches (one backup drive) caps the run at 'device_jobs', which is logged as a warning
+def run_backups(jobs: List[BackupJob], max_jobs: int = 1, device_jobs: int = 1) -> List[BackupResult]:
+    """Method that runs backup jobs with per-device concurrency limits"""
+    if not jobs:
+        return []
+    job_devices: List[List[str]] = [sorted({device_key(job.src), device_key(job.dest)}) for job in jobs]
+    device_limit = max(1, int(device_jobs))
+    shared_devices = set(job_devices[0]).intersection(*job_devices[1:])
+    if shared_devices and min(int(max_jobs), len(jobs)) > device_limit:
+        LOG.warning(f'{min(int(max_jobs), len(jobs))} jobs requested, but every job uses device '
+                    f"{', '.join(sorted(shared_devices))}, which runs {device_limit} at a time; "
+                    f"raise 'device_jobs' to run them concurrently")
+    device_counts: Dict[str, int] = {}
+    pending: List[int] = list(range(len(jobs)))
+    results: List[Optional[BackupResult]] = [None] * len(jobs)
+    condition = threading.Condition()
+
+    # Takes the first pending job whose devices all have room (skipping blocked ones), or None when done
+    def take_job() -> Optional[int]:
+        with condition:
+            while pending:
+                for (position, index) in enumerate(pending):
+                    if all(device_counts.get(device, 0) < device_limit for device in job_devices[index]):
+                        del pending[position]
+                        for device in job_devices[index]:
+                            device_counts[device] = device_counts.get(device, 0) + 1
+                        return index
+                condition.wait()
+            return None
+
+    def release_job(index: int):
+        with condition:
+            for device in job_devices[index]:
+                device_counts[device] -= 1
+            condition.notify_all()
+
+    def run_one(job: BackupJob) -> BackupResult:
+        start_time = time.perf_counter()
+        try:
+            success = bool(job.task())
+            return BackupResult(job.id, success, time.perf_counter() - start_time, metrics=job.metrics)
+        except Exception as e:
+            LOG.error(f'{job.id}: {type(e).__name__}: {e}')
+            return BackupResult(job.id, False, time.perf_counter() - start_time, f'{type(e).__name__}: {e}',
+                                job.metrics)
+
+    def worker():
+        while True:
+            index = take_job()
+            if index is None:
+                return
+            try:
+                results[index] = run_one(jobs[index])
+            finally:
+                release_job(index)
+
+    worker_count = max(1, min(int(max_jobs), len(jobs)))
+    if worker_count == 1:
+        worker()
+    else:
+        workers = [threading.Thread(target=worker, name=f'backup-{i}', daemon=True) for i in range(worker_count)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    return [result for result in results if result is not None]
+
+
+# Logs one line per job and a total; 'seconds' is the wall time run_backups took
+def log_backup_summary(logger: log.Logger, results: List[BackupResult], seconds: float = 0.0):
+    """Method that logs the summary of finished backup jobs"""
+    if not results:
+        return
+    id_width = max(len(result.id) for result in results)
+    logger.info('--- Backup summary ---')
+    for result in results:
+        status = 'ok' if result.success else 'FAILED'
+        line = f'{result.id:<{id_width}}  {status:<6}  {result.seconds:8.2f}s'
+        if result.error:
+            line += f'  {result.error}'
+        if result.success:
+            logger.info(line)
+        else:
+            logger.error(line)
+    failed = sum(1 for result in results if not result.success)
+    job_seconds = sum(result.seconds for result in results)
+    wall_time = f', {seconds:.2f}s wall' if seconds else ''
+    logger.info(f'{len(results)} jobs, {failed} failed, {job_seconds:.2f}s of work{wall_time}')
+
+
+# --- Metrics Commands ---
+
+_METRICS_PHASES = ('walk', 'compare', 'copy', 'cleanup')
+
+
+# Human readable byte count (binary units)
+def _format_bytes(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f'{size:.0f}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.1f}TiB'
+
+
+# Logs a table of the jobs that collected metrics (slowest first), then their slowest files
+# - 'stat'/'content' count the files compared by size/mtime alone vs by reading both copies
+def log_metrics_summary(logger: log.Logger, results: List[BackupResult], slowest_count: int = 5):
+    """Method that logs the throughput and latency metrics of finished backup jobs"""
+    measured = sorted((result for result in results if result.metrics is not None),
+                      key=lambda result: result.seconds, reverse=True)
+    if not measured:
+        return
+    id_width = max(len('target'), *(len(result.id) for result in measured))
+    phases = [*_METRICS_PHASES, *sorted({name for result in measured for name in result.metrics.seconds}
+                                         - set(_METRICS_PHASES))]
+    logger.info('--- Backup metrics ---')
+    header = f"{'target':<{id_width}}  {'scanned':>8}  {'stat':>7}  {'content':>7}  {'copied':>7}"
+    header += f"  {'read':>9}  {'written':>9}  {'rate':>11}"
+    header += ''.join(f'  {phase:>8}' for phase in phases)
+    logger.info(header)
+    for result in measured:
+        counts = result.metrics.counts
+        line = f"{result.id:<{id_width}}  {counts['files_scanned']:>8}  {counts['compared_stat']:>7}"
+        line += f"  {counts['compared_content']:>7}  {counts['files_copied']:>7}"
+        line += f"  {_format_bytes(counts['bytes_read']):>9}  {_format_bytes(counts['bytes_written']):>9}"
+        line += f"  {_format_bytes(result.metrics.throughput()) + '/s':>11}"
+        line += ''.join(f"  {result.metrics.seconds.get(phase, 0.0):>7.2f}s" for phase in phases)
+        logger.info(line)
+    slowest = sorted(((seconds, result.id, path, size) for result in measured
+                      for (seconds, path, size) in result.metrics.slowest), reverse=True)[:slowest_count]
+    if slowest:
+        logger.info('Slowest files:')
+        for (seconds, job_id, path, size) in slowest:
+            logger.info(f'{seconds:8.3f}s  {_format_bytes(size):>9}  {job_id}: {path}')
+
+
+# Appends one JSON object per job with metrics to 'path' (JSON lines), so runs can be compared over time
+def write_metrics(path: str, results: List[BackupResult]) -> bool:
+    """Method that appends the metrics of finished backup jobs as JSON lines"""
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    try:
+        with open(path, 'a', encoding='utf-8') as file:
+            for result in results:
+                if result.metrics is None:
+                    continue
+                record = {'time': timestamp, 'id': result.id, 'success': result.success,
+                          'total_seconds': round(result.seconds, 6), **result.metrics.to_dict()}
+                file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        return True
+    except OSError as e:
+        LOG.error(f'{type(e).__name__}: {e}')
+        return False
+
+
+# --- Archive Commands ---
+
+ARCHIVE_FORMATS: List[str] = ['tar.zst', 'tar.gz', 'zip']
+# Already-compressed files are stored as-is in zip archives; deflating them again only costs time
+_ZIP_STORED_SUFFIXES = ('.7z', '.gz', '.jpeg', '.jpg', '.mp4', '.png', '.rar', '.webp', '.zip', '.zst')
+_ARCHIVE_BUFFER_SIZE = 1024 * 1024
+
+
+def default_archive_format() -> str:
+    """Method that returns the best archive format available"""
+    return 'tar.zst' if zstandard else 'zip'
+
+
+# Archive of a backup target, kept next to where its mirrored directory would be
+def archive_path(dest: str, archive_format: str = '') -> str:
+    """Method that returns the archive location of a backup target"""
+    return f"{dest.rstrip('/').rstrip(os.sep)}.{archive_format or default_archive_format()}"
+
+
+# - the newest wins when archives in several formats exist (the format was changed between runs)
+def find_archive(dest: str) -> str:
+    """Method that returns the existing archive of a backup target (empty when there is none)"""
+    paths = [archive_path(dest, archive_format) for archive_format in ARCHIVE_FORMATS]
+    paths = [path for path in paths if os.path.isfile(path)]
+    return max(paths, key=os.path.getmtime) if paths else ''
+
+
+def _archive_format(path: str) -> str:
+    for archive_format in ARCHIVE_FORMATS:
+        if path.endswith(f'.{archive_format}'):
+            return archive_format
+    raise ValueError(f'unknown archive format: {path}')
+
+
+def _require_zstandard():
+    if not zstandard:
+        raise RuntimeError("'tar.zst' archives need the 'zstandard' package (pip install zstandard)")
+
+
+# Copies one member of an earlier archive into the archive being written
+def _add_archive_member(archive: Any, archive_format: str, name: str, is_dir: bool, size: int, mtime: float,
+                        open_member: Callable[[], Any]):
+    if archive_format == 'zip':
+        info = zipfile.ZipInfo(f'{name}/' if is_dir else name, date_time=time.localtime(mtime)[:6])
+        if is_dir:
+            archive.writestr(info, b'')
+            return
+        stored = name.lower().endswith(_ZIP_STORED_SUFFIXES)
+        (info.compress_type, info.file_size) = (zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED, size)
+        with open_member() as member, archive.open(info, 'w') as file:
+            shutil.copyfileobj(member, file, _ARCHIVE_BUFFER_SIZE)
+        return
+    info = tarfile.TarInfo(name)
+    (info.mtime, info.mode) = (int(mtime), 0o755 if is_dir else 0o644)
+    if is_dir:
+        info.type = tarfile.DIRTYPE
+        archive.addfile(info)
+        return
+    info.size = size
+    with open_member() as member:
+        archive.addfile(info, member)
+
+
+# Streams the selected files of 'sourcedir' straight into the archive (no staging copy); the archive is written
+# to a temporary name and renamed, so the previous run's archive stays intact until the new one is complete
+# - 'options' are sync options (only, include, exclude, ignore, purge); symlinks are skipped
+# - members of the previous archive that are no longer in 'sourcedir' are carried over unless 'purge' is set,
+#   so files cleared from the source after a run (screenshots) are not lost on the next one
+def write_archive(path: str, sourcedir: str, options: Optional[Dict[str, Any]] = None, dry_run: bool = False) -> bool:
+    """Method that archives a directory into one compressed file"""
+    if not os.path.isdir(sourcedir):
+        LOG.error(f'Source directory does not exist: {sourcedir}')
+        return False
+    archive_format = _archive_format(path)
+    if archive_format == 'tar.zst':
+        _require_zstandard()
+    start_time = time.perf_counter()
+    entries = [(rel_path.replace(os.sep, '/'), entry)
+               for (rel_path, entry) in sh.select_entries(sourcedir, options or {}) if not entry.is_symlink()]
+    if dry_run:
+        for (re_path, _) in entries:
+            LOG.info(f'>> {re_path}')
+        return True
+
+    # The previous archive may be in another format when '--archive' was changed between runs
+    previous = '' if (options or {}).get('purge') else find_archive(path[:-len(archive_format) - 1])
+    if previous.endswith('.tar.zst'):
+        _require_zstandard()
+    selected = {re_path for (re_path, _) in entries}
+    selected_files = {re_path for (re_path, entry) in entries if not entry.is_dir()}
+    counts = {'kept': 0}
+
+    # Members of the previous archive still in the source are rewritten from the source; a member below a path
+    # that is now a file is dropped
+    def carry_over(archive: Any):
+        if not previous:
+            return
+        with open(previous, 'rb') as previous_file:
+            members = _archive_members(_archive_format(previous), previous_file)
+            for (name, is_dir, size, mtime, open_member) in members:
+                parts = name.split('/')
+                if name in selected or any('/'.join(parts[:i]) in selected_files for i in range(1, len(parts))):
+                    continue
+                _add_archive_member(archive, archive_format, name, is_dir, size, mtime, open_member)
+                counts['kept'] += 0 if is_dir else 1
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    (file_count, read_bytes) = (0, 0)
+    try:
+        with open(temp_path, 'wb') as raw_file:
+            if archive_format == 'zip':
+                with zipfile.ZipFile(raw_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    for (re_path, entry) in entries:
+                        compression = zipfile.ZIP_STORED if re_path.lower().endswith(_ZIP_STORED_SUFFIXES) else None
+                        archive.write(entry.path, re_path, compress_type=compression)
+                        if entry.is_file():
+                            file_count += 1
+                            read_bytes += entry.stat().st_size
+                    carry_over(archive)
+            else:
+                if archive_format == 'tar.zst':
+                    stream = zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(raw_file, closefd=False)
+                    mode = 'w|'
+                else:
+                    stream = raw_file
+                    mode = 'w|gz'
+                with tarfile.open(fileobj=stream, mode=mode, format=tarfile.PAX_FORMAT) as archive:
+                    for (re_path, entry) in entries:
+                        info = archive.gettarinfo(entry.path, re_path)
+                        if info.isfile():
+                            with open(entry.path, 'rb') as file:
+                                archive.addfile(info, file)
+                            file_count += 1
+                            read_bytes += info.size
+                        else:
+                            archive.addfile(info)
+                    carry_over(archive)
+                if stream is not raw_file:
+                    stream.close()
+        os.replace(temp_path, path)
+    except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+        LOG.error(f'{type(e).__name__}: {e}')
+        return False
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    seconds = time.perf_counter() - start_time
+    written_bytes = os.path.getsize(path)
+    LOG.info(f"{os.path.basename(path)}: {file_count} files ({read_bytes} bytes) -> {written_bytes} bytes "
+             f"in {seconds:.2f} seconds ({file_count / max(seconds, 1e-9):.0f} files/s), "
+             f"{counts['kept']} files kept from earlier runs")
+    return True
+
+
+# Yields (name, is_dir, size, mtime, open member) for each archive entry, reading tar archives as a stream
+def _archive_members(archive_format: str, raw_file: Any) -> Iterator[Tuple[str, bool, int, float, Callable[[], Any]]]:
+    if archive_format == 'zip':
+        with zipfile.ZipFile(raw_file) as archive:
+            for info in archive.infolist():
+                mtime = time.mktime((*info.date_time, 0, 0, -1))
+                yield (info.filename.rstrip('/'), info.is_dir(), info.file_size, mtime,
+                       lambda info=info: archive.open(info))
+        return
+    if archive_format == 'tar.zst':
+        stream = zstandard.ZstdDecompressor().stream_reader(raw_file, closefd=False)
+        mode = 'r|'
+    else:
+        stream = raw_file
+        mode = 'r|gz'
+    with tarfile.open(fileobj=stream, mode=mode) as archive:
+        for info in archive:
+            if info.isdir() or info.isfile():
+                yield (info.name, info.isdir(), info.size, info.mtime, lambda info=info: archive.extractfile(info))
+
+
+# Extracts only the entries selected by 'options' (sync options); files whose size and mtime already match
+# are left alone, and each file is written to a temporary name then renamed
+# - zip stores mtimes with 2 second precision, so mtimes within 2 seconds count as matching
+def extract_archive(path: str, targetdir: str, options: Optional[Dict[str, Any]] = None, dry_run: bool = False
+                    ) -> bool:
+    """Method that restores the selected entries of an archive into a directory"""
+    if not os.path.isfile(path):
+        LOG.error(f'Archive does not exist: {path}')
+        return False
+    archive_format = _archive_format(path)
+    if archive_format == 'tar.zst':
+        _require_zstandard()
+    is_selected = sh.sync_selector(options or {})
+    counts = {'restored': 0, 'unchanged': 0, 'failed': 0}
+    target_root = os.path.abspath(targetdir)
+    try:
+        with open(path, 'rb') as raw_file:
+            for (name, is_dir, size, mtime, open_member) in _archive_members(archive_format, raw_file):
+                target = os.path.abspath(os.path.join(target_root, *name.split('/')))
+                if os.path.commonpath([target_root, target]) != target_root or not is_selected(name):
+                    continue  # never write outside 'targetdir'
+                if is_dir:
+                    if not dry_run:
+                        os.makedirs(target, exist_ok=True)
+                    continue
+                try:
+                    target_stat = os.stat(target)
+                    if target_stat.st_size == size and abs(target_stat.st_mtime - mtime) < 2:
+                        counts['unchanged'] += 1
+                        continue
+                except FileNotFoundError:
+                    pass
+                if dry_run:
+                    LOG.info(f'>> {name}')
+                    continue
+                try:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    temp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+                    try:
+                        with open_member() as member, open(temp_path, 'wb') as file:
+                            shutil.copyfileobj(member, file, _ARCHIVE_BUFFER_SIZE)
+                        os.utime(temp_path, (mtime, mtime))
+                        os.replace(temp_path, target)
+                    finally:
+                        if os.path.exists(temp_path):
+                            os.remove(temp_path)
+                    counts['restored'] += 1
+                except OSError as e:
+                    LOG.error(f'{type(e).__name__}: {e}')
+                    counts['failed'] += 1
+    except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+        LOG.error(f'{type(e).__name__}: {e}')
+        return False
+    LOG.info(f"{os.path.basename(path)}: {counts['restored']} files restored, {counts['unchanged']} unchanged, "
+             f"{counts['failed']} failed")
+    return counts['failed'] == 0
+
+
+# ------------------------ Main Program ------------------------
+# Initialize the logger
+BASENAME = 'backup_boilerplate'
+ARGS: argparse.Namespace = argparse.Namespace()  # for external modules
+LOG: log.Logger = log.get_logger(BASENAME)
+
+if __name__ == '__main__':
+    # Returns argparse.Namespace; to pass into function, use **vars(self.ARGS)
+    def parse_arguments():
+        """Method that parses arguments provided"""
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--debug', action='store_true')
+        parser.add_argument('--log-path', default='')
+        parser.add_argument('--jobs', type=int, default=4)
+        parser.add_argument('--device-jobs', type=int, default=1)
+        parser.add_argument('--test', choices=['jobs', 'archive'], default='jobs')
+        parser.add_argument('--files', type=int, default=2000)
+        return parser.parse_args()
+    ARGS = parse_arguments()
+
+    #  Configure the main logger
+    LOG_HANDLERS: List[log.LogHandlerOptions] = log.default_handlers(ARGS.debug, ARGS.log_path)
+    log.set_handlers(LOG, LOG_HANDLERS)
+
+    LOG.debug(f'ARGS: {ARGS}')
+    LOG.debug('------------------------------------------------')
+
+    # -------- Archive Test --------
+    if ARGS.test == 'archive':
+        # Compare a mirrored backup against each archive format on a synthetic tree ('--files' small files)
+        # - files written is what cloud sync has to upload one by one
+        import logging
+        import tempfile
+        QUIET_LOG = logging.getLogger(f'{BASENAME}.benchmark')
+        QUIET_LOG.propagate = False
+        QUIET_LOG.addHandler(logging.NullHandler())
+        with tempfile.TemporaryDirectory() as TEMP_DIR:
+            SOURCE_DIR = sh.join_path(TEMP_DIR, 'source')
+            for I in range(ARGS.files):
+                TEST_FILE = sh.join_path(SOURCE_DIR, f'dir{I // 100}', f'file{I}.txt')
+                sh.create_directory(sh.path_dir(TEST_FILE))
+                with open(TEST_FILE, 'w', encoding='utf-8') as FILE:
+                    FILE.write(f'setting{I} = {os.urandom(256).hex()}\n' * 4)
+
+            START_TIME = time.perf_counter()
+            MIRROR_DIR = sh.join_path(TEMP_DIR, 'mirror')
+            sh.sync_directory(SOURCE_DIR, MIRROR_DIR, options={'logger': QUIET_LOG})
+            SECONDS = time.perf_counter() - START_TIME
+            MIRROR_FILES = [os.path.join(ROOT, NAME) for (ROOT, _, NAMES) in os.walk(MIRROR_DIR) for NAME in NAMES]
+            MIRROR_BYTES = sum(os.path.getsize(PATH) for PATH in MIRROR_FILES)
+            LOG.info(f'mirror: {len(MIRROR_FILES)} files written, {MIRROR_BYTES} bytes, {SECONDS:.2f}s '
+                     f'({ARGS.files / SECONDS:.0f} files/s)')
+            for ARCHIVE_FORMAT in ARCHIVE_FORMATS:
+                if ARCHIVE_FORMAT == 'tar.zst' and not zstandard:
+                    LOG.info("tar.zst: skipped, 'zstandard' is not installed")
+                    continue
+                ARCHIVE_PATH = archive_path(sh.join_path(TEMP_DIR, 'archive'), ARCHIVE_FORMAT)
+                START_TIME = time.perf_counter()
+                write_archive(ARCHIVE_PATH, SOURCE_DIR, {'purge': True})  # a fresh archive per format
+                SECONDS = time.perf_counter() - START_TIME
+                ARCHIVE_BYTES = os.path.getsize(ARCHIVE_PATH)
+                LOG.info(f'{ARCHIVE_FORMAT}: 1 file written, {ARCHIVE_BYTES} bytes '
+                         f'({MIRROR_BYTES / ARCHIVE_BYTES:.1f}x smaller), {SECONDS:.2f}s '
+                         f'({ARGS.files / SECONDS:.0f} files/s)')
+
+    # -------- Scheduler Test --------
+    else:
+        # Sleeping jobs on the same device show how the per-device limit serializes them
+        TEST_JOBS = [BackupJob(f'job{I}', sh.current_path(), sh.current_path(), lambda: time.sleep(0.2) is None)
+                     for I in range(4)]
+        START_TIME = time.perf_counter()
+        RESULTS = run_backups(TEST_JOBS, ARGS.jobs, ARGS.device_jobs)
+        log_backup_summary(LOG, RESULTS, time.perf_counter() - START_TIME)
+
+    # --- Usage Example ---
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\backup_boilerplate.py --jobs=4 --device-jobs=2
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\backup_boilerplate.py --test=archive --files=5000
@@ -141,7 +141,8 @@ class DaemonContext(object):
 
     def create_pidfile(self):
         LOG.debug("Init")
-        sh.write_file(self.pidfile, str(sh.process_id()))
+        # Written atomically, so 'close' never reads a partial PID
+        sh.write_bytes(self.pidfile, str(sh.process_id()).encode(), atomic=True)
         LOG.debug("pid file created successfully")
 
     # Obtain an exclusive lock before running actions
@@ -153,8 +154,8 @@ class DaemonContext(object):
 
     def read_pidfile(self):
         LOG.debug("Init")
-        pid = sh.read_file(self.pidfile, True)
-        return int(pid) if (pid) else pid
+        pid = sh.read_bytes(self.pidfile).strip()
+        return int(pid) if (pid) else None
 
     def prevent_core_dump(self):
         LOG.debug("Init")
@@ -207,7 +208,7 @@ class DaemonContext(object):
         # Create signal handler map of default actions
         # NOTE: Setting signal.SIG_DFL on signal.SIGTERM is immediate exit; won't call atexit
         signal_handler_map = {
-            signal.SIGUP: signal.SIG_IGN,
+            signal.SIGHUP: signal.SIG_IGN,
             signal.SIGTERM: self.terminate,
             signal.SIGTSTP: signal.SIG_IGN,
             signal.SIGTTIN: signal.SIG_IGN,
@@ -318,10 +319,10 @@ class DaemonContext(object):
         LOG.debug("Init")
         if sh.path_exists(self.lockfile, "f"):
             LOG.debug(f"removed lockfile: {self.lockfile}")
-            sh.file_delete(self.lockfile)
+            sh.delete_file(self.lockfile)
         if sh.path_exists(self.pidfile, "f"):
             LOG.debug(f"removed PID file: {self.pidfile}")
-            sh.file_delete(self.pidfile)
+            sh.delete_file(self.pidfile)
 
     def run(self):
         LOG.warning(
@@ -3,13 +3,38 @@
 
 # --- Global Git Commands ---
 # Repository (bare/work):       repo_exists, repo_create
-# Working Directory:            work_remote, work_status, work_commit, work_push
+# Working Directory:            work_remote, work_status, work_dirty, enable_fast_status, work_commit, work_push
 # - meta reference:             ref_head, ref_heads, ref_remotes, ref_tags
 # - branch:                     branch_validate, branch_exists, branch_create, branch_switch, branch_delete
-# - pull methods:               work_fetch, work_merge, work_rebase, work_reset
+# - pull methods:               work_fetch, work_merge, work_merge_abort, work_rebase, work_reset
+# Session:                      open_session, close_session, get_session
+# Native refs:                  git_dir, read_refs, read_head
+# State cache:                  refs_fingerprint, load_state, save_state, state_file_hash, is_synced, mark_synced
+# Multi-repository:             find_repositories, sync_repository, sync_repositories, log_sync_summary
+
+# --- GitSession Class Commands ---
+# refs, ref_names, status, dirty, invalidate
+
+# :: Usage Instructions ::
+# * Call open_session() once per repository for the length of one command; the ref and status queries
+#   (ref_head, ref_heads, ref_remotes, ref_tags, branch_list, branch_exists, work_status, repo_exists) are then
+#   answered from one batched snapshot instead of one 'git' process each
+# * Commands that change the repository (commit, branch, fetch, merge, push, ...) invalidate the snapshot, so
+#   the next query reloads it; call GitSession.invalidate() after changing files outside of these commands
+# * load_state() keeps what a repeated run needs between processes in '.git/mygit-state.json' (HEAD, index
+#   mtime, branches, remote URLs, file hashes); mark_synced() after a successful push lets the next run skip
+#   fetch, merge and push while neither the work repo nor a local bare remote changed (see is_synced)
 
 import argparse
-from typing import List, Optional, Tuple
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 import logging_boilerplate as log
 import shell_boilerplate as sh
@@ -22,13 +47,21 @@ import shell_boilerplate as sh
 def repo_exists(path: str, bare: bool = False) -> bool:
     """Method that verifies repository exists"""
     result: bool = False
-    if bare:
-        if sh.path_exists(path, "d"):
+    session = get_session(path)
+    if bare and session is not None:
+        status = session.status()
+        result = status.bare
+    elif bare:
+        # A bare repository is its own repository directory; git_dir answers without running 'git'
+        repo_dir = git_dir(sh.expand_path(path)) if sh.path_exists(path, "d") else None
+        if repo_dir is not None:
+            result = (os.path.normcase(repo_dir) == os.path.normcase(sh.expand_path(path)))
+        elif sh.path_exists(path, "d"):
             command: List[str] = ["git", "rev-parse", "--is-bare-repository"]
             sh.print_command(command)
-            process = sh.run_subprocess(command, path)
+            process = sh.run_subprocess(command, path, shell=False)
             # sh.log_subprocess(LOG, process, debug=ARGS.debug)
-            result = (process.returncode == 0 and process.stdout == "true")
+            result = (process.returncode == 0 and process.stdout.strip() == "true")
     else:
         work_repo_dir = sh.join_path(path, ".git")
         result = sh.path_exists(work_repo_dir, "d")
@@ -43,10 +76,11 @@ def repo_create(path: str, bare: bool = False) -> Tuple[bool, bool]:
         sh.create_directory(path)  # Directory must exist prior
         command.append("--bare")
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     sh.log_subprocess(LOG, process, debug=ARGS.debug)
     failed: bool = (process.returncode != 0 and "Reinitialized existing Git repository" not in process.stdout)
     changed: bool = (not failed and "skipped, since" not in process.stdout)
+    _invalidate(path)
     return (not failed, changed)
 
 
@@ -58,24 +92,24 @@ def work_remote(path: str, remote_path: str, remote_alias: str = "origin") -> bo
     failed: bool = False
     # Check local repository for remote alias
     command: List[str] = ["git", "config", "--get", f"remote.{remote_alias}.url"]
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     if not process.stdout:
         # Repository is missing remote path, adding...
         LOG.warning(f"Remote ({remote_alias}) for local repository is missing, adding...")
         command = ["git", "remote", "add", remote_alias, remote_path]
 
         sh.print_command(command)
-        process = sh.run_subprocess(command, path)
+        process = sh.run_subprocess(command, path, shell=False)
         failed = (process.returncode != 0 and f"remote {remote_alias} already exists" not in process.stderr)
         LOG.info("Successfully added remote path for local repository!")
 
-    elif process.stdout != remote_path:
+    elif process.stdout.strip() != remote_path:
         # Repository has outdated remote path, updating...
         LOG.warning(f"Remote ({remote_alias}) for local repository is outdated, updating...")
         command = ["git", "remote", "set-url", remote_alias, remote_path]
 
         sh.print_command(command)
-        process = sh.run_subprocess(command, path)
+        process = sh.run_subprocess(command, path, shell=False)
         failed = (process.returncode != 0 and f"remote {remote_alias} already exists" not in process.stderr)
         LOG.info("Successfully updated remote path for local repository!")
 
@@ -85,12 +119,137 @@ def work_remote(path: str, remote_path: str, remote_alias: str = "origin") -> bo
 
 def work_status(path: str) -> bool:
     """Method that checks the working directory status of a repository"""
-    command: List[str] = ["git", "status"]
+    session = get_session(path)
+    if session is not None:
+        return session.dirty().clean
+    return work_dirty(path).clean
+
+
+# Whether the work-tree differs from HEAD, as DictObj(ok, clean, staged, modified, untracked, method):
+# - method 'status': one 'git status --porcelain=v2' answers; it is cheap on large work-trees once the untracked
+#   cache or fsmonitor is on (see enable_fast_status)
+# - method 'diff': without those settings, 'git diff-index --quiet --cached HEAD' (index vs HEAD, no work-tree
+#   access) runs alongside the status as an early exit; staged changes answer at once (the other flags stay
+#   False) and the status, which may still be looking for untracked files, is stopped
+# - the early exit needs a spare CPU (see _DIRTY_EARLY_EXIT); on one CPU both processes would take turns and a
+#   clean work-tree, the common case, would cost two processes instead of one
+# - 'fast_status' None looks the settings up (once per process while '.git/config' is unchanged)
+def work_dirty(path: str, fast_status: Optional[bool] = None) -> sh.DictObj:
+    """Method that checks whether the work-tree of a repository has changes"""
+    result = sh.DictObj(ok=True, clean=True, staged=False, modified=False, untracked=False, method="status")
+    if fast_status is None:
+        fast_status = fast_status_enabled(path)
+    # Entries are "1 XY ...", "2 XY ..." (renamed), "u XY ..." (unmerged) and "? path"
+    command: List[str] = ["git", "status", "--porcelain=v2", "--untracked-files=normal"]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
-    # sh.log_subprocess(LOG, process, debug=ARGS.debug)
-    is_clean: bool = ("nothing to commit, working directory clean" in process.stdout)
-    return is_clean
+    status_process: Optional[subprocess.Popen] = None
+    if not fast_status and _DIRTY_EARLY_EXIT and read_head(path) != ("", ""):
+        try:
+            status_process = subprocess.Popen(command, cwd=path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                              universal_newlines=True)
+        except OSError:
+            status_process = None
+    try:
+        if status_process is not None:
+            early_command = ["git", "--no-optional-locks", "diff-index", "--quiet", "--cached", "HEAD", "--"]
+            sh.print_command(early_command)
+            if sh.run_subprocess(early_command, path, shell=False).returncode == 1:
+                (result.method, result.staged, result.clean) = ("diff", True, False)
+                return result
+            (stdout, _) = status_process.communicate()
+            returncode = status_process.returncode
+        else:
+            process = sh.run_subprocess(command, path, shell=False)
+            (stdout, returncode) = (process.stdout, process.returncode)
+    finally:
+        if status_process is not None and status_process.poll() is None:
+            status_process.kill()
+            status_process.communicate()
+    result.ok = (returncode == 0)
+    for line in stdout.splitlines():
+        if line.startswith("? "):
+            result.untracked = True
+        elif line[:2] in ("1 ", "2 ", "u "):
+            result.staged = result.staged or line[2] != "."
+            result.modified = result.modified or line[3] != "."
+    result.clean = result.ok and not (result.staged or result.modified or result.untracked)
+    return result
+
+
+# Whether work_dirty has a spare CPU for its diff-index early exit
+_DIRTY_EARLY_EXIT = (os.cpu_count() or 1) > 1
+
+
+# Settings that make 'git status' cheap on large work-trees; fsmonitor needs the built-in daemon (Git 2.37+ on
+# Windows and macOS), so it is only turned on there
+_FAST_STATUS_KEYS = ("core.untrackedcache", "core.fsmonitor")
+_FAST_STATUS: Dict[str, Tuple[Any, bool]] = {}
+
+
+def _fast_status_settings(path: str) -> Dict[str, str]:
+    command: List[str] = ["git", "config", "--get-regexp", r"^core\.(untrackedcache|fsmonitor)$"]
+    process = sh.run_subprocess(command, path, shell=False)
+    settings: Dict[str, str] = {}
+    for line in process.stdout.splitlines():
+        (key, _, value) = line.partition(" ")
+        settings[key.lower()] = value.strip()
+    return settings
+
+
+def _is_fast_status(settings: Dict[str, str]) -> bool:
+    fsmonitor = settings.get("core.fsmonitor", "false").lower()
+    return (settings.get("core.untrackedcache", "").lower() in ("true", "yes", "on", "1")
+            or fsmonitor not in ("", "false", "no", "off", "0"))
+
+
+def _fast_status_key(path: str) -> Tuple[str, Any]:
+    repo_dir = git_dir(path) or sh.expand_path(path)
+    try:
+        config_stat = os.stat(os.path.join(repo_dir, "config"))
+        return (repo_dir, (config_stat.st_mtime_ns, config_stat.st_size))
+    except OSError:
+        return (repo_dir, None)
+
+
+# Whether core.untrackedCache or core.fsmonitor is on (any config level); 'settings' skips the 'git config' call
+def fast_status_enabled(path: str, settings: Optional[Dict[str, str]] = None) -> bool:
+    """Method that checks whether a repository has the fast status settings"""
+    (repo_dir, config_stat) = _fast_status_key(path)
+    cached = _FAST_STATUS.get(repo_dir)
+    if settings is None and cached is not None and cached[0] == config_stat:
+        return cached[1]
+    enabled = _is_fast_status(settings if settings is not None else _fast_status_settings(path))
+    _FAST_STATUS[repo_dir] = (config_stat, enabled)
+    return enabled
+
+
+# Turns on core.untrackedCache (and adds the cache to the index) and, where supported, core.fsmonitor; returns
+# whether either is on. Pass the settings when known (see load_state) to skip the 'git config' call.
+def enable_fast_status(path: str, settings: Optional[Dict[str, str]] = None) -> bool:
+    """Method that enables the settings that speed up the status of a repository"""
+    if settings is None:
+        settings = _fast_status_settings(path)
+    settings = dict(settings)
+    if settings.get("core.untrackedcache", "").lower() not in ("true", "false", "no", "off", "0"):
+        command: List[str] = ["git", "config", "core.untrackedCache", "true"]
+        sh.print_command(command)
+        if sh.run_subprocess(command, path, shell=False).returncode == 0:
+            settings["core.untrackedcache"] = "true"
+            command = ["git", "update-index", "--untracked-cache"]
+            sh.print_command(command)
+            sh.run_subprocess(command, path, shell=False)
+    if "core.fsmonitor" not in settings and sys.platform in ("win32", "darwin") and _git_version() >= (2, 37):
+        command = ["git", "config", "core.fsmonitor", "true"]
+        sh.print_command(command)
+        if sh.run_subprocess(command, path, shell=False).returncode == 0:
+            settings["core.fsmonitor"] = "true"
+    return fast_status_enabled(path, settings)
+
+
+def _git_version() -> Tuple[int, ...]:
+    process = sh.run_subprocess(["git", "version"], shell=False)
+    version = process.stdout.split()[2] if len(process.stdout.split()) > 2 else ""
+    return tuple(int(part) for part in version.split(".")[:2] if part.isdigit())
 
 
 def work_commit(path: str, message: str = "auto-commit", initial: bool = False) -> Tuple[bool, bool]:
@@ -100,42 +259,72 @@ def work_commit(path: str, message: str = "auto-commit", initial: bool = False)
         # 'git add' detects all changes; 'git commit -a' only detects modified/deleted
         command = ["git", "add", "--all", "."]
         sh.print_command(command)
-        process = sh.run_subprocess(command, path)
+        process = sh.run_subprocess(command, path, shell=False)
         # sh.log_subprocess(LOG, process, debug=ARGS.debug)
 
         # Commit the staged files
-        command = ["git", "commit", f"-m '{message}'"]
+        command = ["git", "commit", "-m", message]
         sh.print_command(command)
-        process = sh.run_subprocess(command, path)
+        process = sh.run_subprocess(command, path, shell=False)
         # sh.log_subprocess(LOG, process, debug=ARGS.debug)
         failed = (process.returncode != 0 and "nothing to commit (working directory clean)" not in process.stdout)
         changed = (not failed and "nothing to commit (working directory clean)" not in process.stdout)
+        _invalidate(path)
         return (not failed, changed)    # (succeeded, changed)
     else:
         # Initial commit so 'master' branch exists; helps prevent dangling HEAD refs
         # - HEAD points to 'refs/heads/master' after 'git init'
         # - however, there's no true 'master' branch until the first commit
-        command = ["git", "commit", "--allow-empty", f"-m 'Initial {message}'"]
+        command = ["git", "commit", "--allow-empty", "-m", f"Initial {message}"]
         sh.print_command(command)
-        process = sh.run_subprocess(command, path)
+        process = sh.run_subprocess(command, path, shell=False)
+        _invalidate(path)
         return (True, True)             # (succeeded, changed)
 
 
 # TODO: Set upstream (-u) on initial push; streamlines fetch
-def work_push(path: str, version: str = "master", remote_alias: str = "origin"):
+# Network errors worth another attempt (lowercase); anything else (rejected push, missing remote) fails at once
+_TRANSIENT_ERRORS: Tuple[str, ...] = (
+    "could not resolve host", "temporary failure in name resolution", "connection timed out",
+    "operation timed out", "connection reset", "connection refused", "failed to connect", "ssh: connect to host",
+    "the remote end hung up unexpectedly", "early eof", "rpc failed", "returned error: 429", "returned error: 502",
+    "returned error: 503", "returned error: 504")
+
+
+# Runs a command that talks to a remote; transient network failures are retried up to 'retries' times, waiting
+# 'backoff' seconds, then twice as long before each further attempt
+def _run_remote(command: List[str], path: str, retries: int = 0, backoff: float = 2.0
+                ) -> subprocess.CompletedProcess:
+    attempt = 0
+    while True:
+        process = sh.run_subprocess(command, path, shell=False)
+        stderr = process.stderr.lower()
+        if process.returncode == 0 or attempt >= retries or not any(error in stderr for error in _TRANSIENT_ERRORS):
+            return process
+        delay = backoff * 2 ** attempt
+        attempt += 1
+        error_line = next((line for line in process.stderr.splitlines() if line.strip()), "")
+        LOG.warning(f"'{' '.join(command[:2])}' failed in {path} ({error_line.strip()}), "
+                    f"retrying in {delay:.1f}s ({attempt}/{retries})...")
+        time.sleep(delay)
+
+
+def work_push(path: str, version: str = "master", remote_alias: str = "origin", retries: int = 0,
+              backoff: float = 2.0):
     """Method that pushes the commits of a repository"""
     command: List[str] = ["git", "push", remote_alias, version]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = _run_remote(command, path, retries, backoff)
     sh.log_subprocess(LOG, process, debug=ARGS.debug)
     failed = (process.returncode != 0 and "Everything up-to-date" not in process.stderr)
     changed = (not failed and "Everything up-to-date" not in process.stderr)
+    _invalidate(path)  # remote-tracking refs moved
     return (not failed, changed)
 
 
 # --- Repository Metadata Reference Commands ---
 
-# Trim extra apostrophes; expected format to validate against
+# Trim extra apostrophes (left by shell-quoted formats); expected format to validate against
 def _ref_formatter(in_list: List[str]) -> List[str]:
     # LOG.debug(f"(_ref_formatter): in_list: {in_list}")
     results: List[str] = [i.strip("'") for i in in_list]
@@ -145,12 +334,18 @@ def _ref_formatter(in_list: List[str]) -> List[str]:
 
 def ref_head(path: str) -> str:
     """Method that fetches the branch name of a repository"""
+    head = read_head(path)
+    if head is not None:
+        return head[0]
+    session = get_session(path)
+    if session is not None and session.status().ok:
+        return session.status().branch
     # command: List[str] = ["git", "show-ref", "--head"]
     command: List[str] = ["git", "rev-parse", "--abbrev-ref", "HEAD"]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     # sh.log_subprocess(LOG, process, debug=ARGS.debug)
-    result: str = process.stdout if (process.returncode == 0) else ""
+    result: str = process.stdout.strip() if (process.returncode == 0) else ""
     return result
 
 
@@ -158,9 +353,12 @@ def ref_head(path: str) -> str:
 # git show-ref --heads      # decent but no formatting and rc=1 when empty
 def ref_heads(path: str) -> List[str]:
     """Method that lists the branch names of a repository"""
-    command: List[str] = ["git", "for-each-ref", "--format='%(refname:short)'", "refs/heads"]
+    names = _ref_names(path, "refs/heads/")
+    if names is not None:
+        return names
+    command: List[str] = ["git", "for-each-ref", "--format=%(refname:short)", "refs/heads"]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     # sh.log_subprocess(LOG, process, debug=ARGS.debug)
     stdout_lines: List[str] = process.stdout.splitlines()
     # LOG.debug(f"(ref_heads): stdout_lines: {stdout_lines}")
@@ -172,9 +370,12 @@ def ref_heads(path: str) -> List[str]:
 # 'git for-each-ref' has better formatting than 'git branch -r'
 def ref_remotes(path: str) -> List[str]:
     """Method that lists the remote names of a repository"""
-    command: List[str] = ["git", "for-each-ref", "--format='%(refname:short)'", "refs/remotes"]
+    names = _ref_names(path, "refs/remotes/")
+    if names is not None:
+        return names
+    command: List[str] = ["git", "for-each-ref", "--format=%(refname:short)", "refs/remotes"]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     # sh.log_subprocess(LOG, process, debug=ARGS.debug)
     stdout_lines: List[str] = process.stdout.splitlines()
     # LOG.debug(f"(ref_remotes): stdout_lines: {stdout_lines}")
@@ -186,9 +387,12 @@ def ref_remotes(path: str) -> List[str]:
 # git show-ref --tags       # decent but no formatting and rc=1 when empty
 def ref_tags(path: str) -> List[str]:
     """Method that lists the tags of a repository"""
-    command: List[str] = ["git", "for-each-ref", "--format='%(refname:short)'", "refs/tags"]
+    names = _ref_names(path, "refs/tags/")
+    if names is not None:
+        return names
+    command: List[str] = ["git", "for-each-ref", "--format=%(refname:short)", "refs/tags"]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     # sh.log_subprocess(LOG, process, debug=ARGS.debug)
     stdout_lines: List[str] = process.stdout.splitlines()
     # LOG.debug(f"(ref_tags): stdout_lines: {stdout_lines}")
@@ -206,7 +410,7 @@ def branch_validate(path: str, version: str = "master") -> bool:
         return failed
     command: List[str] = ["git", "check-ref-format", "--branch", version]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     sh.log_subprocess(LOG, process, debug=ARGS.debug)
     failed = (process.returncode != 0 and "not a valid branch name" not in process.stderr)
     return not failed
@@ -246,11 +450,12 @@ def branch_create(path: str, version: str = "master") -> Tuple[bool, bool]:
     # 'git branch --force' resets the branch's HEAD (not wanted)
     command: List[str] = ["git", "branch", version]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     # sh.log_subprocess(LOG, process, debug=ARGS.debug)
     failed: bool = (process.returncode != 0 and "already exists" not in process.stderr)
     changed: bool = (not failed and "already exists" not in process.stderr)
     # LOG.debug(f"(branch_create): succeeded: {not failed}, changed: {changed}")
+    _invalidate(path)
     return (not failed, changed)
 
 
@@ -261,10 +466,11 @@ def branch_switch(path: str, version: str = "master", remote_alias: str = "") ->
     branch_use_name: str = remote_branch if remote_alias else version
     command: List[str] = ["git", "checkout", branch_use_name]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     # sh.log_subprocess(LOG, process, debug=ARGS.debug)
     failed: bool = (process.returncode != 0)
     changed: bool = (not failed and "Already on" not in process.stderr)
+    _invalidate(path)
     return (not failed, changed)
 
 
@@ -273,11 +479,12 @@ def branch_delete(path: str, version: str = "master") -> Tuple[bool, bool]:
     """Method that deletes a branch from the repository"""
     command: List[str] = ["git", "branch", "-D", version]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     sh.log_subprocess(LOG, process, debug=ARGS.debug)
     failed: bool = (process.returncode != 0)
     changed: bool = (not failed and "Deleted branch" in process.stdout)
     LOG.debug(f"(branch_delete): succeeded: {not failed}, changed: {changed}")
+    _invalidate(path)
     return (not failed, changed)
 
 
@@ -285,13 +492,15 @@ def branch_delete(path: str, version: str = "master") -> Tuple[bool, bool]:
 
 # Fetch the latest meta data; increases '.git' directory size
 # Consider 'git fetch --all' https://www.atlassian.com/git/tutorials/syncing/git-fetch
-def work_fetch(path: str, remote_alias: str = "origin") -> Tuple[bool, bool]:
+def work_fetch(path: str, remote_alias: str = "origin", retries: int = 0, backoff: float = 2.0) -> Tuple[bool, bool]:
     """Method that fetches the contents of a remote repository"""
     command: List[str] = ["git", "fetch", "--prune", remote_alias]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = _run_remote(command, path, retries, backoff)
     failed: bool = (process.returncode != 0 and "find remote ref" not in process.stdout)
-    changed: bool = (not failed and "find remote ref" not in process.stdout and "Everything up-to-date" not in process.stderr)
+    # Updated and pruned refs are listed on stderr as "<old>..<new>  <branch> -> <remote>/<branch>"
+    changed: bool = (not failed and " -> " in process.stderr)
+    _invalidate(path)
     return (not failed, changed)
 
 
@@ -304,15 +513,27 @@ def work_merge(path: str, version: str = "master", remote_alias: str = "", messa
     command: List[str] = ["git", "merge", branch_use_name]
     if not fast_forward:
         command.append("--no-ff")
-    command.extend(["--strategy=recursive", f"--strategy-option={pull_type}", f"-m '{message}'"])
+    command.extend(["--strategy=recursive", f"--strategy-option={pull_type}", "-m", message])
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     # sh.log_subprocess(LOG, process, debug=ARGS.debug)
     failed: bool = (process.returncode != 0)
-    changed: bool = (not failed and "Already uptodate" not in process.stdout and "Already up-to-date" not in process.stdout)
+    # "Already up to date." since Git 2.17 ("Already up-to-date." before)
+    changed: bool = (not failed and "Already up" not in process.stdout)
+    _invalidate(path)
     return (not failed, changed)
 
 
+# Returns the work-tree to its state before a merge that stopped (conflicts); fails when no merge is in progress
+def work_merge_abort(path: str) -> bool:
+    """Method that aborts the merge in progress of a repository"""
+    command: List[str] = ["git", "merge", "--abort"]
+    sh.print_command(command)
+    process = sh.run_subprocess(command, path, shell=False)
+    _invalidate(path)
+    return process.returncode == 0
+
+
 # Rebase replays commits from currently active branch onto 'version' parameter target branch
 # - automatically uses default of --strategy='recursive' --strategy-option='theirs'
 # - ours/theirs is reverse of merge; theirs is currently active branch - ours is target branch
@@ -322,10 +543,11 @@ def work_rebase(path: str, version: str = "master") -> Tuple[bool, bool]:
     # Merge pull branch (auto-resolve)
     command: List[str] = ["git", "rebase", version]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     # sh.log_subprocess(LOG, process, debug=ARGS.debug)
     failed: bool = (process.returncode != 0)
     changed: bool = (not failed and "is up to date" not in process.stdout)
+    _invalidate(path)
     return (not failed, changed)
 
 
@@ -336,16 +558,599 @@ def work_reset(path: str, version: str = "master", remote_alias: str = "") -> bo
     branch_use_name: str = remote_branch if remote_alias else version
     command: List[str] = ["git", "reset", "--hard", branch_use_name]
     sh.print_command(command)
-    process = sh.run_subprocess(command, path)
+    process = sh.run_subprocess(command, path, shell=False)
     # sh.log_subprocess(LOG, process, debug=ARGS.debug)
+    _invalidate(path)
     return process.returncode == 0
 
 
+# --- Native Ref Reader Commands ---
+
+# Rules 'git rev-parse' expands a short name with (refs.c); a ref's short name comes from the last rule (the
+# '/HEAD' one aside) that gives a name no other rule resolves: the strict mode used by '%(refname:short)'
+_REF_RULES: Tuple[Tuple[str, str], ...] = (("", ""), ("refs/", ""), ("refs/tags/", ""), ("refs/heads/", ""),
+                                           ("refs/remotes/", ""), ("refs/remotes/", "/HEAD"))
+_OID_CHARS = frozenset("0123456789abcdef")
+_REF_CACHE: Dict[str, Tuple[Any, Dict[str, Tuple[str, str]]]] = {}
+_REF_CACHE_LOCK = threading.Lock()
+
+
+# Locates the repository directory of a work-tree ('.git' directory, or a 'gitdir:' file) or a bare repository
+# - None for layouts the native reader leaves to 'git': linked worktrees ('commondir'), reftable ref storage,
+#   GIT_DIR overrides, or 'path' not being the top of a repository
+def git_dir(path: str) -> Optional[str]:
+    """Method that returns the repository directory of a work-tree or bare repository"""
+    if "GIT_DIR" in os.environ or "GIT_COMMON_DIR" in os.environ:
+        return None
+    dot_git = os.path.join(path, ".git")
+    if os.path.isdir(dot_git):
+        result = dot_git
+    elif os.path.isfile(dot_git):
+        try:
+            with open(dot_git, "r", encoding="utf-8") as file:
+                content = file.read().strip()
+        except OSError:
+            return None
+        if not content.startswith("gitdir:"):
+            return None
+        result = os.path.join(path, content[len("gitdir:"):].strip())
+    elif os.path.isfile(os.path.join(path, "HEAD")) and os.path.isdir(os.path.join(path, "refs")):
+        result = path  # bare repository
+    else:
+        return None
+    if os.path.exists(os.path.join(result, "commondir")) or os.path.isdir(os.path.join(result, "reftable")):
+        return None
+    return result
+
+
+def _is_oid(value: str) -> bool:
+    return len(value) in (40, 64) and _OID_CHARS.issuperset(value)
+
+
+# Every ref as {full name: (object name, short name)} sorted by name, like 'git for-each-ref', read straight from
+# 'packed-refs' and the loose files under 'refs/' (loose refs win); symbolic refs resolve to their target
+# - the result is cached until the stat data of 'packed-refs', a loose ref or the repository directory changes,
+#   so a repeated query costs a few stat calls
+# - None when 'git' has to answer instead (see git_dir; also unreadable or broken refs)
+def read_refs(path: str) -> Optional[Dict[str, Tuple[str, str]]]:
+    """Method that reads the refs of a repository without running git"""
+    repo_dir = git_dir(path)
+    if repo_dir is None:
+        return None
+    try:
+        # Root entries (e.g. HEAD, FETCH_HEAD) take part in short name ambiguity checks
+        root_names = sorted(os.listdir(repo_dir))
+        packed_path = os.path.join(repo_dir, "packed-refs")
+        packed_stat = os.stat(packed_path) if "packed-refs" in root_names else None
+        loose: List[Tuple[str, str, int, int]] = []
+
+        def unreadable(error: OSError):
+            raise error
+        for (rel_path, re_path, entry) in sh.walk_parallel(os.path.join(repo_dir, "refs"), max_workers=1,
+                                                           onerror=unreadable):
+            if entry.is_dir(follow_symlinks=False) or entry.name.endswith(".lock"):
+                continue
+            entry_stat = entry.stat()
+            loose.append((f"refs/{re_path}", entry.path, entry_stat.st_mtime_ns, entry_stat.st_size))
+    except OSError:
+        return None
+    loose.sort()
+    packed_signature = (packed_stat.st_mtime_ns, packed_stat.st_size, packed_stat.st_ino) if packed_stat else None
+    signature = (packed_signature, tuple((name, mtime_ns, size) for (name, _, mtime_ns, size) in loose),
+                 tuple(root_names))
+    cache_key = os.path.normcase(os.path.abspath(repo_dir))
+    cached = _REF_CACHE.get(cache_key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    try:
+        targets: Dict[str, str] = {}  # full name: object name, or 'ref: <full name>' when symbolic
+        if packed_stat is not None:
+            with open(packed_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.startswith(("#", "^")):
+                        continue  # header, or the peeled object of the annotated tag above
+                    (oid, _, refname) = line.rstrip("\n").partition(" ")
+                    if not _is_oid(oid) or not refname:
+                        return None
+                    targets[refname] = oid
+        for (refname, ref_path, _, _) in loose:
+            with open(ref_path, "r", encoding="utf-8") as file:
+                value = file.read().strip()
+            if not (_is_oid(value) or value.startswith("ref: ")):
+                return None  # broken, or being written; 'git' knows how to report it
+            targets[refname] = value
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    refs: Dict[str, Tuple[str, str]] = {}
+    for refname in sorted(targets):
+        oid = _resolve_target(targets, targets[refname])
+        if oid:
+            refs[refname] = (oid, "")
+    root_refs: Dict[str, bool] = {}
+    for (refname, (oid, _)) in refs.items():
+        refs[refname] = (oid, _shorten_ref(refname, refs, repo_dir, set(root_names), root_refs))
+    with _REF_CACHE_LOCK:
+        _REF_CACHE[cache_key] = (signature, refs)
+    return refs
+
+
+# HEAD as (short branch name, object name), like 'git rev-parse --abbrev-ref HEAD': 'HEAD' when detached, and
+# '' for an unborn branch (no commit yet); None when 'git' has to answer instead
+def read_head(path: str) -> Optional[Tuple[str, str]]:
+    """Method that reads the HEAD of a repository without running git"""
+    refs = read_refs(path)
+    repo_dir = git_dir(path)
+    if refs is None or repo_dir is None:
+        return None
+    try:
+        with open(os.path.join(repo_dir, "HEAD"), "r", encoding="utf-8") as file:
+            value = file.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if _is_oid(value):
+        return ("HEAD", value)
+    if not value.startswith("ref: "):
+        return None
+    refname = value[len("ref: "):]
+    if refname not in refs:
+        return ("", "")
+    return (refs[refname][1], refs[refname][0])
+
+
+# Follows 'ref: ' values (at most 5 levels, like git); '' when dangling
+def _resolve_target(targets: Dict[str, str], value: str) -> str:
+    for _ in range(5):
+        if not value.startswith("ref: "):
+            return value
+        value = targets.get(value[len("ref: "):], "")
+    return ""
+
+
+# Any file at the top of the repository directory holding a ref makes a short name of the same name ambiguous
+def _is_root_ref(repo_dir: str, name: str, root_refs: Dict[str, bool]) -> bool:
+    if name not in root_refs:
+        try:
+            with open(os.path.join(repo_dir, name), "rb") as file:
+                value = file.read(256).strip().decode("utf-8")
+            root_refs[name] = _is_oid(value) or value.startswith("ref: refs/")
+        except (OSError, UnicodeDecodeError):
+            root_refs[name] = False
+    return root_refs[name]
+
+
+def _shorten_ref(refname: str, refs: Dict[str, Any], repo_dir: str, root_names: set,
+                 root_refs: Dict[str, bool]) -> str:
+    for index in range(len(_REF_RULES) - 2, 0, -1):
+        prefix = _REF_RULES[index][0]
+        if not refname.startswith(prefix) or len(refname) == len(prefix):
+            continue
+        short_name = refname[len(prefix):]
+        ambiguous = False
+        for (other, (other_prefix, other_suffix)) in enumerate(_REF_RULES):
+            if other == index:
+                continue
+            candidate = f"{other_prefix}{short_name}{other_suffix}"
+            if other == 0:
+                ambiguous = candidate in root_names and _is_root_ref(repo_dir, candidate, root_refs)
+            else:
+                ambiguous = candidate in refs
+            if ambiguous:
+                break
+        if not ambiguous:
+            return short_name
+    return refname
+
+
+# Short names of the refs under a prefix (e.g. 'refs/heads/'), from the open session, else read natively;
+# None when only 'git' can answer
+def _ref_names(path: str, prefix: str) -> Optional[List[str]]:
+    session = get_session(path)
+    if session is not None:
+        return session.ref_names(prefix)
+    refs = read_refs(path)
+    if refs is None:
+        return None
+    return [short_name for (refname, (_, short_name)) in refs.items() if refname.startswith(prefix)]
+
+
+# --- State Cache Commands ---
+
+STATE_FILE = "mygit-state.json"
+_STATE_VERSION = 2
+_RACY_SECONDS = 2  # a file changed this recently can change again without a new mtime (see sh.HashCache)
+
+
+def _new_state() -> sh.DictObj:
+    return sh.DictObj(version=_STATE_VERSION, fingerprint="", branch="", head="", index_mtime=0, branches=[],
+                      remote_branches=[], config_stat=[], remotes={}, core={}, hashes={}, synced={})
+
+
+def _stat_key(path: str) -> List[int]:
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return []
+    if file_stat.st_mtime > time.time() - _RACY_SECONDS:
+        return []  # too recent to vouch for; read again next time
+    return [file_stat.st_mtime_ns, file_stat.st_size]
+
+
+# Digest of HEAD, the stat data of the index and every ref with its object; '' when the native reader cannot
+# answer (see read_refs). Committing, staging, checking out, fetching or pushing all change it.
+def refs_fingerprint(path: str) -> str:
+    """Method that fingerprints the HEAD, index and refs of a repository"""
+    refs = read_refs(path)
+    repo_dir = git_dir(path)
+    if refs is None or repo_dir is None:
+        return ""
+    digest = hashlib.sha1(sh.read_bytes(os.path.join(repo_dir, "HEAD")))
+    try:
+        index_stat = os.stat(os.path.join(repo_dir, "index"))
+        digest.update(f"{index_stat.st_mtime_ns} {index_stat.st_size}\n".encode("utf-8"))
+    except FileNotFoundError:
+        pass  # bare repository, or nothing staged yet
+    for (refname, (oid, _)) in refs.items():
+        digest.update(f"{oid} {refname}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+# The state of a work repo as saved by the last run, with the parts that went stale reloaded (and saved):
+# - fingerprint changed (see refs_fingerprint): branch, head, index_mtime, branches, remote_branches
+# - '.git/config' changed: remotes ({alias: URL}) and core ({key: value} of the fast status settings, see
+#   enable_fast_status), from one 'git config' call
+# - hashes ({path: [mtime_ns, size, digest]}) and synced ({alias: ...}) are checked where they are used
+# - None when the repository layout is left to 'git' (see git_dir)
+def load_state(path: str) -> Optional[sh.DictObj]:
+    """Method that loads the cached state of a repository"""
+    repo_dir = git_dir(path)
+    if repo_dir is None:
+        return None
+    state = _new_state()
+    try:
+        saved = json.loads(sh.read_bytes(os.path.join(repo_dir, STATE_FILE)) or b"{}")
+    except ValueError:
+        saved = {}
+    if isinstance(saved, dict) and saved.get("version") == _STATE_VERSION:
+        state.update((key, value) for (key, value) in saved.items() if key in state)
+    if _refresh_state(path, repo_dir, state):
+        save_state(path, state)
+    return state if state.fingerprint else None
+
+
+def save_state(path: str, state: sh.DictObj) -> bool:
+    """Method that saves the cached state of a repository"""
+    repo_dir = git_dir(path)
+    if repo_dir is None:
+        return False
+    return sh.write_bytes(os.path.join(repo_dir, STATE_FILE), json.dumps(state, indent=1).encode("utf-8"),
+                          atomic=True)
+
+
+def _refresh_state(path: str, repo_dir: str, state: sh.DictObj) -> bool:
+    changed = False
+    fingerprint = refs_fingerprint(path)
+    if fingerprint != state.fingerprint:
+        (state.branch, state.head) = read_head(path) or ("", "")
+        index_stat = _stat_key(os.path.join(repo_dir, "index"))
+        state.index_mtime = index_stat[0] if index_stat else 0
+        (state.branches, state.remote_branches) = (ref_heads(path), ref_remotes(path))
+        state.fingerprint = fingerprint
+        changed = True
+    config_stat = _stat_key(os.path.join(repo_dir, "config"))
+    if not config_stat or config_stat != state.config_stat:
+        command = ["git", "config", "--get-regexp", r"^(remote\..*\.url|core\.untrackedcache|core\.fsmonitor)$"]
+        process = sh.run_subprocess(command, path, shell=False)
+        (remotes, core) = ({}, {})
+        for line in process.stdout.splitlines():
+            (key, _, value) = line.partition(" ")
+            if key.lower() in _FAST_STATUS_KEYS:
+                core[key.lower()] = value
+            else:
+                remotes[key[len("remote."):-len(".url")]] = value
+        (state.remotes, state.core, state.config_stat) = (remotes, core, config_stat)
+        changed = True
+    return changed
+
+
+# sh.hash_file, answered from 'state' while the file keeps its size and mtime; save_state() keeps new digests
+def state_file_hash(state: sh.DictObj, file_path: str) -> str:
+    """Method that hashes a file through the cached state of a repository"""
+    key = os.path.abspath(sh.expand_path(file_path))
+    file_stat = _stat_key(key)
+    cached = state.hashes.get(key)
+    if file_stat and cached and cached[:2] == file_stat:
+        return cached[2]
+    digest = sh.hash_file(key)
+    if file_stat and digest:
+        state.hashes[key] = file_stat + [digest]
+    else:
+        state.hashes.pop(key, None)
+    return digest
+
+
+# True when the work repo's refs (and index) and the refs of the bare remote at 'remote_path' are exactly as
+# mark_synced() recorded them for 'version': fetching, merging and pushing would change nothing. Remotes that are
+# URLs cannot be read natively, so they are never reported as synced.
+def is_synced(path: str, state: Optional[sh.DictObj], remote_path: str, remote_alias: str = "origin",
+              version: str = "master") -> bool:
+    """Method that checks whether a repository is unchanged since its last sync"""
+    if state is None or not state.fingerprint:
+        return False
+    synced = state.synced.get(remote_alias)
+    if not synced or synced.get("version") != version or synced.get("fingerprint") != state.fingerprint:
+        return False
+    if synced.get("remote_path") != remote_path:
+        return False
+    remote_fingerprint = refs_fingerprint(sh.expand_path(remote_path))
+    return bool(remote_fingerprint) and synced.get("remote_fingerprint") == remote_fingerprint
+
+
+# Call after 'version' was pushed successfully; reloads the fingerprints, records them and saves the state
+def mark_synced(path: str, state: Optional[sh.DictObj], remote_path: str, remote_alias: str = "origin",
+                version: str = "master") -> bool:
+    """Method that records a repository as synchronized with its remote"""
+    repo_dir = git_dir(path)
+    if state is None or repo_dir is None:
+        return False
+    _refresh_state(path, repo_dir, state)
+    remote_fingerprint = refs_fingerprint(sh.expand_path(remote_path))
+    if remote_fingerprint:
+        state.synced[remote_alias] = {"version": version, "fingerprint": state.fingerprint,
+                                      "remote_path": remote_path, "remote_fingerprint": remote_fingerprint}
+    else:
+        state.synced.pop(remote_alias, None)
+    return save_state(path, state)
+
+
+# --- Multi-Repository Commands ---
+
+# Work-trees at or below 'root' (at most 'max_depth' directories deep); repositories are not searched for nested
+# ones, nor are hidden directories
+def find_repositories(root: str, max_depth: int = 2) -> List[str]:
+    """Method that finds the work-tree repositories under a directory"""
+    root = sh.expand_path(root)
+    if os.path.exists(os.path.join(root, ".git")):
+        return [root]
+
+    def is_repository(re_path: str) -> bool:
+        return os.path.exists(os.path.join(root, re_path, ".git"))
+
+    def recurse(re_path: str) -> bool:
+        return (re_path.count("/") + 1 < max_depth and not re_path.rsplit("/", 1)[-1].startswith(".")
+                and not is_repository(re_path))
+    results = [entry.path for (_, re_path, entry) in sh.walk_parallel(root, recurse=recurse)
+               if entry.is_dir() and not entry.name.startswith(".") and is_repository(re_path)]
+    return sorted(results)
+
+
+# Fetches, merges the remote branch of the current branch ('ours' strategy, like 'mygit pull') and pushes it back
+# - status: 'ok', 'skipped' (not a repository, no branch checked out, no remote, dirty work-tree; fetch still
+#   runs for a dirty one) or 'failed'; 'detail' says which step and why
+# - fetch and push retry transient network failures (see _run_remote)
+def sync_repository(path: str, remote_alias: str = "origin", retries: int = 2, backoff: float = 2.0) -> sh.DictObj:
+    """Method that synchronizes the current branch of a repository with its remote"""
+    start_time = time.perf_counter()
+    result = sh.DictObj(path=path, status="ok", detail="", branch="", fetched=False, merged=False, pushed=False,
+                        seconds=0.0)
+
+    def finish(status: str, detail: str = "") -> sh.DictObj:
+        (result.status, result.detail) = (status, detail)
+        result.seconds = time.perf_counter() - start_time
+        return result
+
+    if not repo_exists(path):
+        return finish("skipped", "not a work-tree repository")
+    result.branch = ref_head(path)
+    if result.branch in ("", "HEAD"):
+        return finish("skipped", "no commits yet" if not result.branch else "detached HEAD")
+    process = sh.run_subprocess(["git", "config", "--get", f"remote.{remote_alias}.url"], path, shell=False)
+    if not process.stdout.strip():
+        return finish("skipped", f"no '{remote_alias}' remote")
+
+    (succeeded, result.fetched) = work_fetch(path, remote_alias, retries, backoff)
+    if not succeeded:
+        return finish("failed", "fetch failed")
+    # Untracked files do not block the merge (git refuses to overwrite one, and that merge is aborted below)
+    session = get_session(path)
+    dirty = session.dirty() if session is not None else work_dirty(path)
+    if not dirty.ok or dirty.staged or dirty.modified:
+        return finish("skipped", "dirty work-tree; fetched only")
+    if branch_exists(path, result.branch, remote_alias):
+        (succeeded, result.merged) = work_merge(path, result.branch, remote_alias)
+        if not succeeded:
+            # Never leave the repository mid-merge for the next run (or the user) to trip over
+            aborted = work_merge_abort(path)
+            return finish("failed", f"merge of '{remote_alias}/{result.branch}' failed"
+                                    f"{'; aborted' if aborted else ''}")
+    (succeeded, result.pushed) = work_push(path, result.branch, remote_alias, retries, backoff)
+    if not succeeded:
+        return finish("failed", "push failed")
+    return finish("ok")
+
+
+# Runs sync_repository on up to 'max_workers' repositories at a time; results keep the order of 'paths', and a
+# repository that raises is reported as failed instead of stopping the others
+def sync_repositories(paths: List[str], remote_alias: str = "origin", max_workers: int = 4, retries: int = 2,
+                      backoff: float = 2.0) -> List[sh.DictObj]:
+    """Method that synchronizes many repositories concurrently"""
+    def sync_one(path: str) -> sh.DictObj:
+        try:
+            result = sync_repository(path, remote_alias, retries, backoff)
+        except Exception as e:
+            result = sh.DictObj(path=path, status="failed", detail=f"{type(e).__name__}: {e}", branch="",
+                                fetched=False, merged=False, pushed=False, seconds=0.0)
+        log_line = f"{os.path.basename(path)}: {result.status} ({result.seconds:.2f}s) {result.detail}".rstrip()
+        if result.status == "failed":
+            LOG.error(log_line)
+        else:
+            LOG.debug(log_line)
+        return result
+
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(int(max_workers), len(paths)))) as executor:
+        return list(executor.map(sync_one, paths))
+
+
+# Logs one line per repository and a total; 'seconds' is the wall time sync_repositories took
+def log_sync_summary(logger: log.Logger, results: List[sh.DictObj], seconds: float = 0.0):
+    """Method that logs the summary of synchronized repositories"""
+    if not results:
+        return
+    name_width = max(len(os.path.basename(result.path)) for result in results)
+    logger.info("--- Sync summary ---")
+    for result in results:
+        changes = ", ".join(step for step in ("fetched", "merged", "pushed") if result[step]) or "up-to-date"
+        line = (f"{os.path.basename(result.path):<{name_width}}  {result.status:<7}  {result.seconds:7.2f}s  "
+                f"{result.branch or '-'}: {result.detail or changes}")
+        if result.status == "failed":
+            logger.error(line)
+        elif result.status == "skipped":
+            logger.warning(line)
+        else:
+            logger.info(line)
+    counts = {status: sum(1 for result in results if result.status == status) for status in ("ok", "skipped", "failed")}
+    repo_seconds = sum(result.seconds for result in results)
+    wall_time = f", {seconds:.2f}s wall" if seconds else ""
+    logger.info(f"{len(results)} repositories, {counts['ok']} ok, {counts['skipped']} skipped, "
+                f"{counts['failed']} failed, {repo_seconds:.2f}s of work{wall_time}")
+
+
+# --- Session Commands ---
+
+_SESSIONS: Dict[str, "GitSession"] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def _session_key(path: str) -> str:
+    return os.path.normcase(os.path.realpath(sh.expand_path(path)))
+
+
+# Opt-in; once open, the query commands on 'path' answer from the session's snapshot (see GitSession)
+def open_session(path: str) -> "GitSession":
+    """Method that opens the cached Git session of a repository"""
+    key = _session_key(path)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = _SESSIONS[key] = GitSession(path)
+        return session
+
+
+def close_session(path: str):
+    """Method that closes the cached Git session of a repository"""
+    with _SESSIONS_LOCK:
+        _SESSIONS.pop(_session_key(path), None)
+
+
+def get_session(path: str) -> Optional["GitSession"]:
+    """Method that returns the open Git session of a repository (None when not open)"""
+    if not _SESSIONS:
+        return None
+    return _SESSIONS.get(_session_key(path))
+
+
+# Called by every command that changes refs, HEAD or the work-tree
+def _invalidate(path: str):
+    session = get_session(path)
+    if session is not None:
+        session.invalidate()
+
+
+# ------------------------ GitSession Class ------------------------
+
+# Snapshot of one repository, loaded lazily and kept until invalidated:
+# - refs:   read natively (see read_refs), else 'git for-each-ref' with a combined format (object name, full
+#           name, short name) for every ref
+# - status: 'git status --porcelain=v2 --branch' for HEAD (branch, commit, upstream) and the changed entries;
+#           it fails in a bare repository, which is recorded as 'bare'
+# - dirty:  work_dirty(), the quickest way to tell a clean work-tree from a dirty one
+class GitSession(object):
+    """Class of a cached snapshot of a repository's refs and status"""
+
+    _REF_FORMAT = "--format=%(objectname)%09%(refname)%09%(refname:short)"
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self._lock = threading.RLock()
+        self._refs: Optional[Dict[str, Tuple[str, str]]] = None
+        self._status: Optional[sh.DictObj] = None
+        self._dirty: Optional[sh.DictObj] = None
+
+    def refs(self) -> Dict[str, Tuple[str, str]]:
+        """Method that returns every ref as {full name: (object name, short name)}, sorted by name"""
+        with self._lock:
+            if self._refs is None:
+                self._refs = read_refs(self.path)
+            if self._refs is None:
+                command: List[str] = ["git", "for-each-ref", self._REF_FORMAT]
+                sh.print_command(command)
+                process = sh.run_subprocess(command, self.path, shell=False)
+                refs: Dict[str, Tuple[str, str]] = {}
+                if process.returncode == 0:
+                    for line in process.stdout.splitlines():
+                        (oid, refname, short_name) = line.split("\t", 2)
+                        refs[refname] = (oid, short_name)
+                self._refs = refs
+            return self._refs
+
+    def ref_names(self, prefix: str) -> List[str]:
+        """Method that returns the short names of the refs under a prefix (e.g. 'refs/heads/')"""
+        return [short_name for (refname, (_, short_name)) in self.refs().items() if refname.startswith(prefix)]
+
+    def status(self) -> sh.DictObj:
+        """Method that returns HEAD and the work-tree state"""
+        with self._lock:
+            if self._status is None:
+                command: List[str] = ["git", "status", "--porcelain=v2", "--branch"]
+                sh.print_command(command)
+                process = sh.run_subprocess(command, self.path, shell=False)
+                status = sh.DictObj(ok=(process.returncode == 0), bare=False, branch="", oid="", upstream="",
+                                    ahead=0, behind=0, entries=[], clean=False)
+                if status.ok:
+                    for line in process.stdout.splitlines():
+                        if not line.startswith("# "):
+                            status.entries.append(line)
+                            continue
+                        (key, _, value) = line[2:].partition(" ")
+                        if key == "branch.oid":
+                            status.oid = "" if value == "(initial)" else value
+                        elif key == "branch.head":
+                            status.branch = "HEAD" if value == "(detached)" else value
+                        elif key == "branch.upstream":
+                            status.upstream = value
+                        elif key == "branch.ab":
+                            (ahead, behind) = value.split(" ")
+                            (status.ahead, status.behind) = (int(ahead), -int(behind))
+                    status.clean = not status.entries
+                    # Like 'git rev-parse --abbrev-ref HEAD', an unborn branch has no name yet
+                    if not status.oid and status.branch != "HEAD":
+                        status.branch = ""
+                else:
+                    status.bare = "work tree" in process.stderr
+                self._status = status
+            return self._status
+
+    def dirty(self) -> sh.DictObj:
+        """Method that returns whether the work-tree has changes (see work_dirty)"""
+        with self._lock:
+            if self._dirty is None:
+                self._dirty = work_dirty(self.path)
+            return self._dirty
+
+    def invalidate(self):
+        """Method that drops the snapshot, so the next query reloads it"""
+        with self._lock:
+            (self._refs, self._status, self._dirty) = (None, None, None)
+
+
 # ------------------------ Main Program ------------------------
 
 # Initialize the logger
 BASENAME = "git_boilerplate"
-ARGS: argparse.Namespace = argparse.Namespace()  # for external modules
+ARGS: argparse.Namespace = argparse.Namespace(debug=False)  # for external modules; library callers get debug off
 LOG: log.Logger = log.get_logger(BASENAME)
 
 if __name__ == "__main__":
@@ -353,6 +1158,10 @@ if __name__ == "__main__":
         """Method that parses arguments provided"""
         parser = argparse.ArgumentParser()
         parser.add_argument("--debug", action="store_true")
+        parser.add_argument("--log-path", default="")
+        parser.add_argument("--test", choices=["refs", "status"])
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--repo-path", default="")  # work-tree for '--test=status' (e.g. a .NET solution)
         return parser.parse_args()
     ARGS = parse_arguments()
 
@@ -368,5 +1177,86 @@ if __name__ == "__main__":
     LOG.debug(f"ARGS: {ARGS}")
     LOG.debug("------------------------------------------------")
 
+    # -------- Refs Test --------
+    if ARGS.test == "refs":
+        # List the tags of a generated repository ('--iterations' x 100 tags, half packed) with 'git for-each-ref',
+        # then with read_refs: a first (cold) read, and repeated reads answered by the cache
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as TEMP_DIR:
+            TAG_COUNT = ARGS.iterations * 100
+            repo_create(TEMP_DIR)
+            sh.run_subprocess(["git", "-c", "user.name=test", "-c", "user.email=test@test", "commit", "--allow-empty",
+                               "-m", "refs test"], TEMP_DIR, shell=False)
+            HEAD_OID = sh.run_subprocess(["git", "rev-parse", "HEAD"], TEMP_DIR, shell=False).stdout.strip()
+            for (START, STOP) in [(0, TAG_COUNT // 2), (TAG_COUNT // 2, TAG_COUNT)]:
+                subprocess.run(["git", "update-ref", "--stdin"], cwd=TEMP_DIR, check=True, text=True,
+                               input="".join(f"create refs/tags/v{I} {HEAD_OID}\n" for I in range(START, STOP)))
+                if START == 0:
+                    sh.run_subprocess(["git", "pack-refs", "--all"], TEMP_DIR, shell=False)
+
+            START_TIME = time.perf_counter()
+            CLI_TAGS = sh.run_subprocess(["git", "for-each-ref", "--format=%(refname:short)", "refs/tags"],
+                                         TEMP_DIR, shell=False).stdout.splitlines()
+            LOG.info(f"git for-each-ref: {len(CLI_TAGS)} tags in {time.perf_counter() - START_TIME:.3f}s")
+            START_TIME = time.perf_counter()
+            NATIVE_TAGS = ref_tags(TEMP_DIR)
+            LOG.info(f"read_refs (cold): {len(NATIVE_TAGS)} tags in {time.perf_counter() - START_TIME:.3f}s")
+            START_TIME = time.perf_counter()
+            for _ in range(10):
+                ref_tags(TEMP_DIR)
+            LOG.info(f"read_refs (cached): {(time.perf_counter() - START_TIME) / 10 * 1000:.2f}ms per call")
+            if NATIVE_TAGS != CLI_TAGS:
+                LOG.error("read_refs and 'git for-each-ref' disagree")
+
+    # -------- Status Test --------
+    elif ARGS.test == "status":
+        # Check a clean work-tree ('--repo-path', else a generated one of '--iterations' x 400 tracked files plus
+        # twice as many in ignored 'node_modules' and 'obj' directories) with the former 'git status' call, then
+        # with work_dirty: status with the diff-index early exit, then (generated tree only; a '--repo-path' keeps
+        # its config) status alone once enable_fast_status turned the untracked cache on
+        import tempfile
+
+        def timed(label: str, task: Any, iterations: int = 5):
+            """Method that logs the mean time of a task"""
+            task()  # warm the file system cache
+            start_time = time.perf_counter()
+            for _ in range(iterations):
+                answer = task()
+            LOG.info(f"{label}: {(time.perf_counter() - start_time) / iterations * 1000:.1f}ms ({answer})")
+
+        with tempfile.TemporaryDirectory() as TEMP_DIR:
+            REPO_PATH = ARGS.repo_path or TEMP_DIR
+            if not ARGS.repo_path:
+                for I in range(ARGS.iterations * 400):
+                    FILE_DIR = sh.join_path(TEMP_DIR, "src", f"p{I % 40}", f"d{I % 17}")
+                    os.makedirs(FILE_DIR, exist_ok=True)
+                    sh.write_file(sh.join_path(FILE_DIR, f"f{I}.cs"), str(I))
+                for I in range(ARGS.iterations * 800):
+                    FILE_DIR = sh.join_path(TEMP_DIR, "node_modules" if I % 2 else "obj", f"m{I % 300}")
+                    os.makedirs(FILE_DIR, exist_ok=True)
+                    sh.write_file(sh.join_path(FILE_DIR, f"f{I}.js"), str(I))
+                sh.write_file(sh.join_path(TEMP_DIR, ".gitignore"), "node_modules/\nobj/\n")
+                repo_create(TEMP_DIR)
+                for COMMAND in (["git", "add", "--all", "."],
+                                ["git", "-c", "user.name=test", "-c", "user.email=test@test", "commit", "-m", "test"]):
+                    sh.run_subprocess(COMMAND, TEMP_DIR, shell=False)
+
+            def former_status() -> bool:
+                """Method that checks the status the way work_status used to"""
+                process = sh.run_subprocess(["git", "status"], REPO_PATH, shell=False)
+                return "nothing to commit" in process.stdout
+
+            timed("git status", former_status)
+            timed("work_dirty (early exit)", lambda: work_dirty(REPO_PATH, fast_status=False).clean)
+            if ARGS.repo_path:
+                LOG.info(f"fast status settings: {_fast_status_settings(REPO_PATH) or 'none'}")
+            else:
+                enable_fast_status(REPO_PATH)
+                former_status()  # fills the untracked cache
+                timed("git status (untracked cache)", former_status)
+                timed("work_dirty (untracked cache)", lambda: work_dirty(REPO_PATH).clean)
+
     # --- Usage Example ---
     # python ~/.local/lib/python3.6/site-packages/git_boilerplate.py --debug --test=subprocess
+    # python git_boilerplate.py --test=refs --iterations=200  # 20000 tags: git for-each-ref vs read_refs
@@ -7,26 +7,58 @@
 # Utility:          shift_directory, change_directory, list_differences, print_command
 # Process:          exit_process, fail_process, process_id, process_parent_id
 # Path:             current_path, expand_path, join_path, path_exists, path_dir, path_basename, path_filename
-# Directory:        list_directory, create_directory, delete_directory, copy_directory, sync_directory, remove_empty_directories
-# File:             read_file, write_file, delete_file, rename_file, copy_file, hash_file, match_file, backup_file
+# Directory:        list_directory, create_directory, delete_directory, copy_directory, sync_directory, remove_empty_directories,
+#                   walk_parallel, sync_matcher, sync_selector, select_entries, sync_manifest_path
+# File:             read_file, write_file, read_bytes, write_bytes, delete_file, rename_file, copy_file, copy_files,
+#                   hash_file, match_file, backup_file
 # Signal:           max_signal, handle_signal, send_signal
-# SubProcess:       run_subprocess, log_subprocess
+# SubProcess:       run_subprocess, run_subprocesses, run_subprocess_async, gather_subprocesses, log_subprocess, subprocess_stats, reset_subprocess_stats
+# ShellSession:     open_session_pool, close_session_pool
+# HashCache:        open_hash_cache, close_hash_cache, hash_cache_path
 
 # --- SubProcess Class Commands ---
-# await_results, is_done, format_output
+# await_results, stream_lines, is_done, format_output
+
+# --- ShellSession Class Commands ---
+# run, close, is_alive
+
+# --- HashCache Class Commands ---
+# signature, lookup, store, flush, close
+
+# --- SyncMatcher Class Commands ---
+# selected, ignored, descend
+
+# --- SyncMetrics Class Commands ---
+# add, add_seconds, phase, record_file, throughput, to_dict
 
 import argparse
+import asyncio
+import atexit
 # import distutils.dir_util
 # import distutils.file_util
+import errno
+import filecmp
+import hashlib
+import heapq
 import json
+import mmap
 import os
+import queue
+import re
+import shlex
 import shutil
 # import signal
+import sqlite3
+import stat
 import subprocess
 import sys
+import threading
 import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import dirsync
 import logging_boilerplate as log
@@ -275,11 +307,15 @@ def copy_directory(src: str, dest: str) -> bool:
 
 
 # Uses rsync, a better alternative to 'shutil.copytree' with ignore
+# - 'engine' is 'rsync' (the binary) or 'native' (pure Python delta transfer, see _rsync_tree); the default
+#   uses rsync when it is installed
 def rsync_directory(src: str, dest: str, recursive: bool = True, purge: bool = True, cut: bool = False,
-                    include: Tuple = (), exclude: Tuple = (), debug: bool = False
+                    include: Tuple = (), exclude: Tuple = (), debug: bool = False, engine: str = ''
                     ) -> Tuple[List[str], List[str]]:
     """Method that syncs a directory's contents"""
     LOG.debug('Init')
+    if engine == 'native' or (not engine and not shutil.which('rsync')):
+        return _rsync_tree(src, dest, recursive, purge, cut, include, exclude, debug)
     changed_files: List[str] = []
     changes_dirs: List[str] = []
     # Create sequence of command options
@@ -323,28 +359,196 @@ def rsync_directory(src: str, dest: str, recursive: bool = True, purge: bool = T
     command.extend(command_options)
     command.extend([src, dest])
     LOG.debug(f'command used: {command}')
-    process = run_subprocess(command)
-    # log_subprocess(LOG, process)
-
-    results: List[str] = str.splitlines(str(process.stdout))
-    LOG.debug(f'results: {results}')
-
-    for r in results:
-        result = r.split(' ', 1)
+    # Parse the itemized output as rsync writes it, so memory stays flat regardless of the tree size
+    try:
+        process = SubProcess(command)
+    except OSError as e:
+        LOG.error(f'OSError: {e}')
+        return (changed_files, changes_dirs)
+    for (stream, line) in process.stream_lines():
+        if stream == 'stderr':
+            LOG.error(line)
+            continue
+        result = line.split(' ', 1)
+        if len(result) < 2 or len(result[0]) < 2:
+            continue
         itemized_output = result[0]
         file_name = result[1]
-        if itemized_output[1] == 'f':
+        if itemized_output[1] in ('f', 'L'):
             changed_files.append(join_path(dest, file_name))
         elif itemized_output[1] == 'd':
             changes_dirs.append(join_path(dest, file_name))
+    LOG.debug(f'rc: {process.rc}')
 
     LOG.debug(f'changed_files: {changed_files}')
     return (changed_files, changes_dirs)
 
 
+# Filter of rsync '--include'/'--exclude' glob rules for a '/'-separated relative path (True when excluded)
+# - the first matching rule wins and includes come first, the same order rsync_directory passes them to rsync
+# - '*' and '?' stop at '/', '**' does not; a rule without '/' matches the last path component, one with a
+#   leading '/' is anchored to the transfer root, and one with a trailing '/' only matches directories
+def _rsync_rules(include: Tuple, exclude: Tuple) -> Callable[[str, bool], bool]:
+    rules: List[Tuple[bool, bool, Any]] = []
+    for (excluded, patterns) in ((False, include), (True, exclude)):
+        for pattern in patterns:
+            if not pattern:
+                continue
+            dir_only = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            if pattern.startswith('/'):
+                prefix = ''
+                pattern = pattern[1:]
+            else:
+                prefix = '(?:.*/)?'
+            regex = ''
+            for (index, part) in enumerate(re.split(r'(\*\*|\*|\?)', pattern)):
+                regex += {'**': '.*', '*': '[^/]*', '?': '[^/]'}[part] if index % 2 else re.escape(part)
+            rules.append((excluded, dir_only, re.compile(f'{prefix}{regex}$')))
+
+    def is_excluded(re_path: str, is_dir: bool) -> bool:
+        for (excluded, dir_only, regex) in rules:
+            if (is_dir or not dir_only) and regex.match(re_path):
+                return excluded
+        return False
+    return is_excluded
+
+
+# Native rsync_directory: the same transfer (-a --delete -m --remove-source-files --dry-run) and the same
+# (changed files, changed directories) result, without the rsync binary
+# - 'src' with a trailing separator copies its contents into 'dest', else the directory itself (like rsync)
+# - files are skipped when size + mtime match (rsync's quick check); a changed file that already exists in
+#   'dest' is delta-transferred, so only its changed blocks are read from 'src' and written (see _delta_transfer)
+# - without 'recursive' only the files directly in 'src' are transferred
+def _rsync_tree(src: str, dest: str, recursive: bool, purge: bool, cut: bool, include: Tuple, exclude: Tuple,
+                dry_run: bool) -> Tuple[List[str], List[str]]:
+    changed_files: List[str] = []
+    changes_dirs: List[str] = []
+    if not os.path.isdir(src):
+        LOG.error(f'Source directory does not exist: {src}')
+        return (changed_files, changes_dirs)
+    is_excluded = _rsync_rules(include, exclude)
+    name_root = '' if src.endswith(('/', os.sep)) else os.path.basename(os.path.normpath(src))
+    target_root = os.path.join(dest, name_root) if name_root else dest
+
+    # Source list: (relative path, DirEntry); excluded directories are not descended into
+    entries: List[Tuple[str, os.DirEntry]] = []
+    wanted_dirs = {''}  # directories holding a transferred file or link (--prune-empty-dirs)
+
+    def recurse(re_path: str) -> bool:
+        return recursive and not is_excluded(re_path, True)
+    for (rel_path, re_path, entry) in walk_parallel(src, recurse=recurse, prefetch=True):
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if is_excluded(re_path, is_dir) or (is_dir and not recursive):
+            continue
+        entries.append((rel_path, entry))
+        if not is_dir:
+            parent = os.path.dirname(rel_path)
+            while parent not in wanted_dirs:
+                wanted_dirs.add(parent)
+                parent = os.path.dirname(parent)
+    source_paths = {rel_path for (rel_path, entry) in entries}
+
+    reported_dirs = set()
+
+    def report(rel_path: str, is_dir: bool):
+        if is_dir:
+            reported_dirs.add(rel_path)
+        name = '/'.join(filter(None, [name_root, rel_path.replace(os.sep, '/')]))
+        (changes_dirs if is_dir else changed_files).append(join_path(dest, f'{name or "."}/' if is_dir else name))
+
+    if not os.path.isdir(target_root):
+        report('', True)
+        if not dry_run:
+            os.makedirs(target_root)
+    copied_dirs: List[Tuple[str, os.DirEntry]] = []
+    transferred: List[str] = []
+    for (rel_path, entry) in entries:
+        target = os.path.join(target_root, rel_path)
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if rel_path not in wanted_dirs:
+                    continue
+                if not os.path.isdir(target):
+                    report(rel_path, True)
+                    if not dry_run:
+                        os.makedirs(target)
+                copied_dirs.append((rel_path, entry))
+            elif entry.is_symlink():
+                link = os.readlink(entry.path)
+                if not (os.path.islink(target) and os.readlink(target) == link):
+                    report(rel_path, False)
+                    if not dry_run:
+                        _remove_file(target, missing_ok=True)
+                        os.symlink(link, target)
+                transferred.append(entry.path)
+            else:
+                source_stat = entry.stat()
+                try:
+                    target_stat = os.stat(target)
+                    unchanged = (stat.S_ISREG(target_stat.st_mode) and target_stat.st_size == source_stat.st_size
+                                 and int(target_stat.st_mtime) == int(source_stat.st_mtime))
+                except FileNotFoundError:
+                    (target_stat, unchanged) = (None, False)
+                if not unchanged:
+                    report(rel_path, False)
+                    if not dry_run:
+                        if target_stat is not None and stat.S_ISREG(target_stat.st_mode) and \
+                                target_stat.st_size >= _DELTA_MIN_SIZE:
+                            _delta_transfer(entry.path, target)
+                            shutil.copystat(entry.path, target)
+                        else:
+                            _copy_entry(entry.path, target)
+                transferred.append(entry.path)
+        except OSError as e:
+            LOG.error(f'{type(e).__name__}: {e}')
+
+    # Directory times are set last, since filling a directory changes its mtime
+    for (rel_path, entry) in reversed(copied_dirs):
+        target = os.path.join(target_root, rel_path)
+        try:
+            if rel_path not in reported_dirs and int(os.stat(target).st_mtime) != int(entry.stat().st_mtime):
+                report(rel_path, True)
+            if not dry_run:
+                shutil.copystat(entry.path, target)
+        except OSError as e:
+            if not dry_run:
+                LOG.error(f'{type(e).__name__}: {e}')
+
+    if purge and os.path.isdir(target_root):
+        for (rel_path, re_path, entry) in list(walk_parallel(target_root, recurse=lambda re_path: recursive)):
+            parent = os.path.dirname(rel_path)
+            if rel_path in source_paths or (parent and parent not in source_paths):
+                continue  # kept, or removed with its directory
+            if is_excluded(re_path, entry.is_dir(follow_symlinks=False)):
+                continue  # rsync only deletes excluded files with --delete-excluded
+            if not recursive and entry.is_dir(follow_symlinks=False):
+                continue  # directories are not part of a non-recursive transfer
+            LOG.debug(f'deleting {rel_path}')
+            if not dry_run:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, onerror=_ignore_missing)
+                else:
+                    _remove_file(entry.path, missing_ok=True)
+
+    if cut and not dry_run:
+        for path in transferred:
+            _remove_file(path, missing_ok=True)
+    LOG.debug(f'changed_files: {changed_files}')
+    return (changed_files, changes_dirs)
+
+
+# Regex patterns sync_directory always ignores, on top of its 'ignore' argument
+# - use raw string notation for regex (https://docs.python.org/3/howto/regex.html)
+SYNC_IGNORE_DEFAULTS: List[str] = [
+    r'.*\.bak$',  # ignore files with '.bak' extension
+]
+
+
 def sync_directory(sourcedir: str, targetdir: str, action: str = 'sync',
                    options: Optional[Dict[str, Any]] = None,
                    ignore: Optional[List[str]] = None,
+                   engine: str = 'native',
                    ) -> bool:
     """Method that copies a directory
 
@@ -352,7 +556,8 @@ def sync_directory(sourcedir: str, targetdir: str, action: str = 'sync',
         src (str): Source directory location
         dest (str): Destination directory location
         action (str): Action strategy for behavior.  Defaults to 'sync'.
-        options (dict): Provide additional options, such as: only, exclude, include
+        options (dict): Provide additional options, such as: only, exclude, include, metrics (SyncMetrics)
+        engine (str): 'native' (scandir) or 'dirsync'; options only dirsync knows always use dirsync.  Defaults to 'native'.
 
     Returns:
         bool: Whether directories are in sync
@@ -372,11 +577,7 @@ def sync_directory(sourcedir: str, targetdir: str, action: str = 'sync',
         'create': True,  # create target directory if it does not exist
         'ctime': True,  # takes into account the creation time or last metadata change
         'content': True,  # synchronize only different files (e.g. hash check)
-        # use raw string notation for regex (https://docs.python.org/3/howto/regex.html)
-        'ignore': [
-            r'.*\.bak$',  # ignore files with '.bak' extension
-            *ignore,
-        ],  # regex patterns to ignore (https://regexr.com)
+        'ignore': [*SYNC_IGNORE_DEFAULTS, *ignore],  # regex patterns to ignore (https://regexr.com)
     }
     if options:
         LOG.debug(f'options provided: {options}')
@@ -388,76 +589,841 @@ def sync_directory(sourcedir: str, targetdir: str, action: str = 'sync',
         full_options: Dict[str, Any] = default_options
     LOG.debug(f'options used: {full_options}')
 
+    if engine == 'native' and _SYNC_OPTIONS.issuperset(full_options):
+        return _sync_tree(sourcedir, targetdir, action, full_options)
+    # dirsync neither reads nor updates manifests; drop a target manifest so it cannot go stale
+    if full_options.get('manifest') and action == 'sync':
+        _remove_file(full_options['manifest'], missing_ok=True)
+    # dirsync has no metrics hooks; only its total time is recorded
+    metrics: Optional[SyncMetrics] = full_options.pop('metrics', None) or SyncMetrics()
+
     try:
         # https://github.com/tkhyn/dirsync
-        dirsync.sync(sourcedir, targetdir, action, **full_options)
+        # dirsync.sync(sourcedir, targetdir, action, **full_options)
+        with metrics.phase('sync'):
+            syncer = _HashCacheSyncer(sourcedir, targetdir, action, **full_options)
+            syncer.do_work()
+        syncer.report()
         return True
     except Exception as e:
         LOG.error(f'Exception: {e}')
         return False
 
 
-# https://stackoverflow.com/questions/47093561/remove-empty-folders-python
-def remove_empty_directories(root) -> List[str]:
-    """Method that recursively removes empty subdirectories"""
-    removed_dirs: List[str] = []
+# Options the native engine supports (same meaning as dirsync); any other option falls back to dirsync
+_SYNC_OPTIONS = frozenset(['logger', 'verbose', 'create', 'ctime', 'content', 'purge',
+                           'only', 'exclude', 'include', 'ignore', 'manifest', 'source_manifest', 'workers',
+                           'metrics'])
+_MANIFEST_VERSION = 1
+_SYNC_MATCHERS: Dict[str, 'SyncMatcher'] = {}  # see sync_matcher
+# Copy engine: files at least _COPY_PARALLEL_SIZE may be copied as parallel _COPY_RANGE_SIZE ranges
+_COPY_PARALLEL_SIZE = 64 * 1024 * 1024
+_COPY_RANGE_SIZE = 16 * 1024 * 1024
+_COPY_BUFFER_SIZE = 1024 * 1024
+# Directory listings walk_parallel runs at once
+_WALK_WORKERS = 8
+# Native rsync_directory: existing files at least _DELTA_MIN_SIZE are delta-transferred instead of copied
+_DELTA_MIN_SIZE = 64 * 1024
+# copy_file_range errors meaning "not possible here" (cross-device, unsupported filesystem), not a failed copy
+_COPY_FALLBACK_ERRNOS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM)
+
+
+# Native sync engine: each tree is walked once with os.scandir, stat results are compared before any content
+# - 'only'/'include'/'exclude'/'ignore' are regexes matched (re.match) against '/'-separated relative paths,
+#   exactly like dirsync: 'only' must match, then 'include' wins over 'exclude' + 'ignore'; 'ignore' also
+#   hides target paths (never purged)
+# - 'content' compares sizes first; equal size + mtime is trusted as unchanged (like rsync), else bytes are
+#   compared (or digests, when the hash cache is open)
+# - without 'content', a newer source mtime (or ctime with 'ctime') updates the target, the same as dirsync
+# - 'manifest' (see sync_manifest_path) records the target after a sync; the next run lists the target from it
+#   instead of scanning it, and only stats the listed entries it compares, so a target file that went missing
+#   or changed since is still updated (delete the manifest to force a full scan); with 'purge' the target is
+#   always scanned, since files added to it outside the manifest must be found to be purged
+# - 'source_manifest' lists the source from a manifest (restore from a backup) and only stats the listed
+#   target paths instead of scanning the target; compared source entries are stat'ed the same way, and purge
+#   is not possible in this mode
+# - 'workers' copies that many files at once, or splits a lone large file into that many ranges (never both,
+#   so at most 'workers' copy threads run); the default of 1 copies one file at a time, which is kindest to
+#   spinning disks
+# - 'metrics' (SyncMetrics) collects counters, phase times and the slowest transfers
+def _sync_tree(sourcedir: str, targetdir: str, action: str, options: Dict[str, Any]) -> bool:
+    logger: log.Logger = options.get('logger') or LOG
+    verbose = bool(options.get('verbose'))
+    if not os.path.isdir(sourcedir):
+        LOG.error(f'Source directory does not exist: {sourcedir}')
+        return False
+    target_created = False
+    if not os.path.isdir(targetdir):
+        if not options.get('create') or action == 'diff':
+            LOG.error(f'Target directory does not exist: {targetdir}')
+            return False
+        if verbose:
+            logger.info(f'Creating directory {targetdir}')
+        os.makedirs(targetdir)
+        target_created = True
+
+    start_time = time.perf_counter()
+    matcher = sync_matcher(options)
+    metrics: SyncMetrics = options.get('metrics') or SyncMetrics()
+
+    # Manifests only apply while the filters they were written with are unchanged
+    filters = to_json([options.get(key) or [] for key in ('only', 'include', 'exclude', 'ignore')])
+    manifest_path: str = options.get('manifest') or ''
+    # A source manifest lists everything in the source; this run's filters are applied on top of it
+    source_manifest = _read_manifest(options.get('source_manifest') or '', None, sourcedir)
+    purge = action == 'sync' and bool(options.get('purge')) and source_manifest is None
+    # Purge has to see what was added to the target outside the manifest, so it always scans the target
+    target_manifest = None if target_created or purge else _read_manifest(manifest_path, filters, targetdir)
+
+    # Source: directories are only scanned when an entry below them can be selected (a deeper path may match
+    # even when its directory does not)
+    left: Dict[str, Any] = {}
+    left_parents = set()
+    dir_count = 1
+    file_count = 0
+    source_entries = source_manifest.items() if source_manifest is not None else (
+        (rel_path, entry) for (rel_path, re_path, entry)
+        in walk_parallel(sourcedir, recurse=matcher.descend, prefetch=True))
+    for (rel_path, entry) in source_entries:
+        if entry.is_dir():
+            dir_count += 1
+        else:
+            file_count += 1
+        if matcher.selected(rel_path.replace('\\', '/')):
+            left[rel_path] = entry
+            # Directories holding a selected entry belong to the source side too (never purged)
+            parent = os.path.dirname(rel_path)
+            while parent and parent not in left_parents:
+                left_parents.add(parent)
+                parent = os.path.dirname(parent)
+
+    # Target: ignored directories are pruned
+    right: Dict[str, Any] = {}
+    if target_manifest is not None:
+        right = target_manifest
+    elif source_manifest is not None:
+        # Stat only the paths the source lists
+        for rel_path in left:
+            target = os.path.join(targetdir, rel_path)
+            try:
+                right[rel_path] = _SyncEntry(target, os.stat(target))
+            except OSError:
+                pass
+    else:
+        for (rel_path, re_path, entry) in walk_parallel(targetdir, lambda re_path: not matcher.ignored(re_path),
+                                                        prefetch=True):
+            right[rel_path] = entry
+
+    left_only = sorted(rel_path for rel_path in left if rel_path not in right)
+    right_only = sorted(rel_path for rel_path in right if rel_path not in left and rel_path not in left_parents)
+    common = sorted(rel_path for rel_path in left if rel_path in right)
+    metrics.add(files_scanned=file_count, dirs_scanned=dir_count)
+    metrics.add_seconds('walk', time.perf_counter() - start_time)
+
+    if action == 'diff':
+        for (title, marker, rel_paths) in ((f'Only in {sourcedir}', '>>', left_only),
+                                           (f'Only in {targetdir}', '<<', right_only),
+                                           (f'Common to {sourcedir} and {targetdir}', '--', common)):
+            if rel_paths:
+                logger.info(title)
+                for rel_path in rel_paths:
+                    logger.info(f'{marker} {rel_path}')
+        return True
+
+    counts = {'copied': 0, 'updated': 0, 'purged': 0, 'created': 0, 'failed': 0}
+    failed = set()
+    counts_lock = threading.Lock()  # copies may run on worker threads
+
+    def apply(message: str, target: str, task: Callable[[], Any], count: str, rel_path: str = '') -> bool:
+        if verbose:
+            logger.info(f'{message} {target}')
+        try:
+            task()
+            with counts_lock:
+                counts[count] += 1
+            return True
+        except OSError as e:
+            logger.error(f'{type(e).__name__}: {e}')
+            with counts_lock:
+                counts['failed'] += 1
+                failed.add(rel_path)
+            return False
+
+    # Files & directories only in target directory
+    phase_start = time.perf_counter()
+    if purge:
+        purged_dirs = set()
+        for rel_path in right_only:
+            parent = os.path.dirname(rel_path)
+            while parent and parent not in purged_dirs:
+                parent = os.path.dirname(parent)
+            if parent:
+                continue  # already removed with its directory
+            target = os.path.join(targetdir, rel_path)
+            if right[rel_path].is_dir(follow_symlinks=False):
+                purged_dirs.add(rel_path)
+                apply('Deleting', target, lambda target=target: shutil.rmtree(target, onerror=_ignore_missing), 'purged')
+            else:
+                apply('Deleting', target, lambda target=target: _remove_file(target, missing_ok=True), 'purged')
+    metrics.add_seconds('cleanup', time.perf_counter() - phase_start)
+
+    # File copies are queued as (message, count, relative path, source, target) and run together at the end
+    copies: List[Tuple[str, str, str, str, str]] = []
+
+    # Files & directories only in source directory (sorted, so directories come before their contents)
+    if action == 'sync':
+        for rel_path in left_only:
+            entry = left[rel_path]
+            target = os.path.join(targetdir, rel_path)
+            if entry.is_dir() and not entry.is_symlink():
+                apply('Creating directory', target, lambda target=target: os.makedirs(target, exist_ok=True), 'created',
+                      rel_path)
+            else:
+                copies.append(('Copying file', 'copied', rel_path, entry.path, target))
+
+    # Common files
+    use_content = bool(options.get('content'))
+    use_ctime = bool(options.get('ctime'))
+    phase_start = time.perf_counter()
+    (compared_stat, compared_content, content_bytes) = (0, 0, 0)
+    for rel_path in common:
+        (source_entry, target_entry) = (left[rel_path], right[rel_path])
+        if source_entry.is_dir():
+            if target_manifest is not None and not os.path.isdir(target_entry.path) and action == 'sync':
+                apply('Creating directory', target_entry.path,
+                      lambda target=target_entry.path: os.makedirs(target, exist_ok=True), 'created', rel_path)
+            continue  # nothing else to do for a directory
+        try:
+            # Entries listed from a manifest are stat'ed now: what changed since it was written is not trusted
+            if source_manifest is not None:
+                source_entry = left[rel_path] = _stat_entry(source_entry)
+            if target_manifest is not None:
+                (listed, target_entry) = (target_entry, _stat_entry(target_entry))
+                if target_entry is not listed:
+                    right[rel_path] = None  # changed since the manifest, so its digest is refreshed
+            source_stat = source_entry.stat()
+            target_stat = target_entry.stat()
+        except OSError:
+            if source_manifest is None and target_manifest is None:
+                continue
+            # An entry a manifest listed is missing: copy it again (a missing source fails and is reported)
+            copies.append(('Updating file', 'updated', rel_path, source_entry.path, target_entry.path))
+            continue
+        if use_content:
+            need_update = not _same_content(source_entry.path, target_entry.path, source_stat, target_stat)
+            if source_stat.st_size == target_stat.st_size and source_stat.st_mtime_ns != target_stat.st_mtime_ns:
+                compared_content += 1
+                content_bytes += 2 * source_stat.st_size  # at most; a difference or cached digests stop early
+            else:
+                compared_stat += 1
+        else:
+            need_update = (source_stat.st_mtime_ns // 1_000_000 > target_stat.st_mtime_ns // 1_000_000 or
+                           (use_ctime and source_stat.st_ctime_ns // 1_000_000 > target_stat.st_mtime_ns // 1_000_000))
+            compared_stat += 1
+        if need_update:
+            copies.append(('Updating file', 'updated', rel_path, source_entry.path, target_entry.path))
+    metrics.add(compared_stat=compared_stat, compared_content=compared_content, bytes_read=content_bytes)
+    metrics.add_seconds('compare', time.perf_counter() - phase_start)
+
+    workers = max(1, int(options.get('workers') or 1))
+    # Files already copied in parallel are not split into parallel ranges as well (workers x workers threads)
+    range_workers = workers if len(copies) == 1 else 1
+
+    def run_copy(copy: Tuple[str, str, str, str, str]) -> bool:
+        (message, count, rel_path, source, target) = copy
+        copy_start = time.perf_counter()
+        success = apply(message, target, lambda: _copy_entry(source, target, range_workers), count, rel_path)
+        if success:
+            try:
+                size = left[rel_path].stat().st_size
+            except OSError:
+                size = 0
+            metrics.record_file(rel_path, size, time.perf_counter() - copy_start)
+        return success
+    with metrics.phase('copy'):
+        if workers > 1 and len(copies) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(copies))) as executor:
+                copied = list(executor.map(run_copy, copies))
+        else:
+            copied = [run_copy(copy) for copy in copies]
+    for ((_, count, rel_path, _, _), success) in zip(copies, copied):
+        if success and count == 'updated':
+            right[rel_path] = None  # transferred, so the manifest digest is refreshed
+
+    if action == 'sync' and manifest_path and source_manifest is None:
+        retained = {} if purge else {rel_path: right[rel_path] for rel_path in right_only}
+        with metrics.phase('cleanup'):
+            _write_manifest(manifest_path, filters, targetdir, left, right, failed, retained)
+
+    logger.info(f'sync finished in {time.perf_counter() - start_time:.2f} seconds')
+    logger.info(f"{dir_count} directories parsed, {counts['copied']} files copied")
+    for (count, text) in (('created', 'directories were created'), ('updated', 'files were updated'),
+                          ('purged', 'files/directories were purged'), ('failed', 'operations failed')):
+        if counts[count]:
+            logger.info(f'{counts[count]} {text}.')
+    return counts['failed'] == 0
+
+
+# Matcher of the sync options, compiled once per distinct set of patterns (see SyncMatcher)
+def sync_matcher(options: Dict[str, Any]) -> 'SyncMatcher':
+    """Method that returns the cached matcher of sync options"""
+    key = repr([options.get(name) or [] for name in ('only', 'include', 'exclude', 'ignore')])
+    matcher = _SYNC_MATCHERS.get(key)
+    if matcher is None:
+        matcher = _SYNC_MATCHERS[key] = SyncMatcher(options)
+    return matcher
+
+
+# Filter of the sync options ('only', 'include', 'exclude', 'ignore') for a '/'-separated relative path
+def sync_selector(options: Dict[str, Any]) -> Callable[[str], bool]:
+    """Method that returns whether a relative path is selected by sync options"""
+    return sync_matcher(options).selected
+
+
+# Yields (relative path, DirEntry) of every entry under 'root' the sync options select
+# - 'rel_dir' walks only that subdirectory of 'root' (paths stay relative to 'root')
+def select_entries(root: str, options: Dict[str, Any], rel_dir: str = '') -> Iterator[Tuple[str, os.DirEntry]]:
+    """Method that walks a directory for the entries selected by sync options"""
+    matcher = sync_matcher(options)
+    for (rel_path, re_path, entry) in walk_parallel(root, recurse=matcher.descend, rel_dir=rel_dir, prefetch=True):
+        if matcher.selected(re_path):
+            yield (rel_path, entry)
+
+
+# Manifest of a synced directory, kept next to it (not inside, so it is never synced or purged itself)
+def sync_manifest_path(directory: str) -> str:
+    """Method that returns the manifest location of a synced directory"""
+    return f"{directory.rstrip('/').rstrip(os.sep)}.manifest.json"
+
+
+# Stands in for os.DirEntry where the stat data comes from a manifest or one os.stat (no directory scan)
+class _SyncEntry(object):
+    __slots__ = ('path', '_stat', 'digest')
+
+    def __init__(self, path: str, file_stat: Any, digest: str = ''):
+        self.path: str = path
+        self._stat = file_stat
+        self.digest: str = digest
+
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        return stat.S_ISDIR(self._stat.st_mode)
+
+    def is_symlink(self) -> bool:
+        return False
+
+    def stat(self) -> Any:
+        return self._stat
+
+
+# Stats a manifest entry again: the same entry while its type, size and mtime still match the manifest, else a
+# new entry with the current stat data (and no digest)
+def _stat_entry(entry: _SyncEntry) -> _SyncEntry:
+    file_stat = os.stat(entry.path)
+    listed = entry.stat()
+    if (stat.S_IFMT(file_stat.st_mode) == stat.S_IFMT(listed.st_mode) and file_stat.st_size == listed.st_size and
+            file_stat.st_mtime_ns == listed.st_mtime_ns):
+        return entry
+    return _SyncEntry(entry.path, file_stat)
+
+
+# Entries are {'/'-separated path: [size, mtime_ns, digest]}, size -1 for a directory
+# - returns None (full scan) when missing, unreadable, or written with other 'filters' (None skips that check)
+def _read_manifest(path: str, filters: Optional[str], root: str) -> Optional[Dict[str, _SyncEntry]]:
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('version') != _MANIFEST_VERSION or filters not in (None, manifest.get('filters')):
+            return None
+        entries: Dict[str, _SyncEntry] = {}
+        for (re_path, (size, mtime_ns, digest)) in manifest['entries'].items():
+            rel_path = re_path.replace('/', os.sep)
+            mode = stat.S_IFDIR if size < 0 else stat.S_IFREG
+            file_stat = argparse.Namespace(st_mode=mode, st_size=max(size, 0), st_mtime_ns=mtime_ns, st_ctime_ns=mtime_ns)
+            entries[rel_path] = _SyncEntry(os.path.join(root, rel_path), file_stat, digest)
+        return entries
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        LOG.warning(f'Ignoring manifest {path}: {type(e).__name__}: {e}')
+        return None
+
+
+# Records every entry now in the target: the selected source entries plus 'retained' target-only entries
+# - digests are kept for untouched files and only computed for files transferred this run (missing from
+#   'right', or set to None there), so the cost follows the amount of change
+def _write_manifest(path: str, filters: str, root: str, left: Dict[str, Any], right: Dict[str, Any], failed: set,
+                    retained: Dict[str, Any]):
+    entries: Dict[str, List[Any]] = {}
+    for (rel_path, entry) in [*left.items(), *retained.items()]:
+        if rel_path in failed:
+            continue
+        try:
+            if entry.is_dir() and not entry.is_symlink():
+                entries[rel_path.replace(os.sep, '/')] = [-1, 0, '']
+                continue
+            file_stat = entry.stat()
+        except OSError:
+            continue
+        previous = right.get(rel_path)
+        if previous is not None:
+            digest = getattr(previous, 'digest', '')
+        else:
+            digest = hash_file(os.path.join(root, rel_path))
+        entries[rel_path.replace(os.sep, '/')] = [file_stat.st_size, file_stat.st_mtime_ns, digest]
+    manifest = {'version': _MANIFEST_VERSION, 'filters': filters, 'entries': entries}
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, separators=(',', ':'))
+        os.replace(temp_path, path)
+    except OSError as e:
+        LOG.error(f'{type(e).__name__}: {e}')
+
+
+# Removes entries (relative paths) from a manifest without reading the tree again
+def _drop_manifest_entries(path: str, rel_paths: List[str]):
+    if not os.path.isfile(path):
+        return
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        for rel_path in rel_paths:
+            manifest['entries'].pop(rel_path.replace(os.sep, '/'), None)
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, separators=(',', ':'))
+        os.replace(temp_path, path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        # A manifest that cannot be updated must not be trusted either; the next sync scans the target
+        LOG.warning(f'Removing manifest {path}: {type(e).__name__}: {e}')
+        try:
+            _remove_file(path, missing_ok=True)
+        except OSError:
+            pass
+
+
+# Walks a tree with os.scandir on up to 'max_workers' threads, yielding (relative path, '/'-separated path,
+# DirEntry) as each directory is listed; the order is not fixed, but a directory always comes before its contents
+# - symlinked directories are listed but not followed (like os.walk)
+# - 'descend' can prune an entry by its '/'-separated path and 'recurse' can keep a listed directory from being
+#   scanned; both run on the worker threads, so they must be thread-safe (SyncMatcher methods are)
+# - with 'prefetch', every yielded non-directory entry is stat'ed on the worker thread (DirEntry caches it), so
+#   the stat round trips of network or cloud-synced volumes overlap instead of adding up
+# - 'onerror' is called (on the consuming thread) with the OSError of a directory that cannot be listed; the
+#   default logs it, and either way the walk goes on
+# - 'rel_dir' walks only that subdirectory of 'root' (paths stay relative to 'root'); 'max_workers' of 1 walks on
+#   the calling thread
+def walk_parallel(root: str, descend: Optional[Callable[[str], bool]] = None,
+                  recurse: Optional[Callable[[str], bool]] = None, rel_dir: str = '',
+                  max_workers: int = _WALK_WORKERS, prefetch: bool = False,
+                  onerror: Optional[Callable[[OSError], Any]] = None
+                  ) -> Iterator[Tuple[str, str, os.DirEntry]]:
+    """Method that walks a directory tree with parallel directory listings"""
+    def scan(directory: str, rel_dir: str) -> Tuple[List[Tuple[str, str, os.DirEntry]], List[Tuple[str, str]],
+                                                    Optional[OSError]]:
+        (listed, subdirs) = ([], [])
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    re_path = rel_path.replace('\\', '/')
+                    if descend is not None and not descend(re_path):
+                        continue
+                    listed.append((rel_path, re_path, entry))
+                    if entry.is_dir(follow_symlinks=False):
+                        if recurse is None or recurse(re_path):
+                            subdirs.append((entry.path, rel_path))
+                    elif prefetch:
+                        try:
+                            entry.stat()
+                        except OSError:
+                            pass  # e.g. a dangling symlink; the caller's own stat() raises again
+        except OSError as e:
+            return (listed, subdirs, e)
+        return (listed, subdirs, None)
+
+    def report(error: OSError):
+        if onerror is not None:
+            onerror(error)
+        else:
+            LOG.error(f'{type(error).__name__}: {error}')
+
+    start = (os.path.join(root, rel_dir) if rel_dir else root, rel_dir)
+    if max_workers <= 1:
+        pending: List[Tuple[str, str]] = [start]
+        while pending:
+            (listed, subdirs, error) = scan(*pending.pop())
+            yield from listed
+            if error is not None:
+                report(error)
+            pending.extend(subdirs)
+        return
+
+    # Finished listings are handed over through a queue; new directories are submitted as their parents finish
+    results: queue.Queue = queue.Queue()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        executor.submit(scan, *start).add_done_callback(results.put)
+        outstanding = 1
+        while outstanding:
+            (listed, subdirs, error) = results.get().result()
+            outstanding -= 1
+            for subdir in subdirs:
+                executor.submit(scan, *subdir).add_done_callback(results.put)
+            outstanding += len(subdirs)
+            yield from listed
+            if error is not None:
+                report(error)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)  # the consumer may stop early
 
-    for (current_dir, subdirs, files) in os.walk(root, topdown=False):
-        if files:
-            continue  # skip directory with files
-        # LOG.debug(f'current_dir: {current_dir}')
 
-        still_has_subdirs = False
-        for subdir in subdirs:
-            # LOG.debug(f'subdir: {subdir}')
-            if os.path.join(current_dir, subdir) not in removed_dirs:
-                still_has_subdirs = True
-            # LOG.debug(f'still_has_subdirs: {still_has_subdirs}')
+# Stat first (size, then size + mtime), content only when that cannot decide
+def _same_content(path1: str, path2: str, stat1: os.stat_result, stat2: os.stat_result) -> bool:
+    if stat1.st_size != stat2.st_size:
+        return False
+    if stat1.st_mtime_ns == stat2.st_mtime_ns:
+        return True
+    if _HASH_CACHE is not None:
+        return match_file(path1, path2)
+    return filecmp.cmp(path1, path2, shallow=False)
 
-        if not still_has_subdirs:
-            os.rmdir(current_dir)
-            removed_dirs.append(current_dir)
 
-    # LOG.debug(f'empty directories removed: {removed_dirs}')
-    return removed_dirs
+# Copies file data and metadata (like shutil.copy2); symlinks are recreated rather than followed
+def _copy_entry(src: str, dst: str, range_workers: int = 1):
+    if os.path.lexists(dst) and (os.path.islink(src) or os.path.islink(dst)):
+        _remove_file(dst)
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        return
+    try:
+        _copy_file_data(src, dst, range_workers)
+    except FileNotFoundError:
+        # Parent directories are only created on demand (not one mkdir per file)
+        if os.path.isdir(os.path.dirname(dst)):
+            raise
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        _copy_file_data(src, dst, range_workers)
+    except PermissionError:
+        # Read-only target (Windows), the same retry dirsync does
+        os.chmod(dst, stat.S_IWRITE)
+        _copy_file_data(src, dst, range_workers)
+    shutil.copystat(src, dst)
+
+
+# In-kernel copy: copy_file_range (Linux; reflinks / server-side copies where supported), else shutil.copyfile
+# which uses sendfile (Linux), fcopyfile (macOS) or large buffered reads (Windows)
+# - with 'range_workers', files of at least _COPY_PARALLEL_SIZE are copied as ranges on that many threads
+def _copy_file_data(src: str, dst: str, range_workers: int = 1):
+    if range_workers > 1:
+        size = os.stat(src).st_size
+        if size >= _COPY_PARALLEL_SIZE:
+            _copy_file_ranges(src, dst, size, range_workers)
+            return
+    if hasattr(os, 'copy_file_range'):
+        with open(src, 'rb') as source, open(dst, 'wb') as target:
+            try:
+                while os.copy_file_range(source.fileno(), target.fileno(), 1 << 30):
+                    pass
+                return
+            except OSError as e:
+                if e.errno not in _COPY_FALLBACK_ERRNOS:
+                    raise
+    shutil.copyfile(src, dst)
+
+
+# The target is sized up front, then every range is written at its own offset (no shared file position)
+def _copy_file_ranges(src: str, dst: str, size: int, range_workers: int):
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        target.truncate(size)
+        offsets = range(0, size, _COPY_RANGE_SIZE)
+        with ThreadPoolExecutor(max_workers=min(range_workers, len(offsets))) as executor:
+            futures = [executor.submit(_copy_range, source, target, offset, min(_COPY_RANGE_SIZE, size - offset))
+                       for offset in offsets]
+            for future in futures:
+                future.result()  # re-raises the first failure
+
+
+def _copy_range(source: Any, target: Any, offset: int, length: int):
+    end = offset + length
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while offset < end:
+                copied = os.copy_file_range(source.fileno(), target.fileno(), end - offset, offset, offset)
+                if not copied:
+                    break
+                offset += copied
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+    # Own handles per range, so seeks never race (Windows has no pread/pwrite)
+    with open(source.name, 'rb') as source_file, open(target.name, 'r+b') as target_file:
+        source_file.seek(offset)
+        target_file.seek(offset)
+        buffer = memoryview(bytearray(_COPY_BUFFER_SIZE))
+        while offset < end:
+            count = source_file.readinto(buffer[:min(_COPY_BUFFER_SIZE, end - offset)])
+            if not count:
+                break
+            target_file.write(buffer[:count])
+            offset += count
+
+
+def _strong_checksum(block: bytes) -> bytes:
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+# rsync's block size: about the square root of the file size, within [700 bytes, 128 KiB]
+def _delta_block_size(size: int) -> int:
+    return min(max(700, int(size ** 0.5) // 8 * 8), 128 * 1024)
+
+
+# Rewrites 'dst' (the basis) to match 'src', reusing every basis block found anywhere in 'src' and writing only
+# the bytes in between; returns (literal bytes, reused bytes)
+# - blocks are found by a weak checksum (Adler-32, rolled one byte at a time) confirmed by a strong hash
+# - the block at the current offset is checked first (zlib, in C), so unchanged regions cost one checksum per
+#   block; only changed regions are scanned byte by byte
+# - when every reused block is still at its own offset (edits in place, appends), only the literal bytes are
+#   written into 'dst'; otherwise 'dst' is rebuilt in a temporary file and replaced
+# - when more than half of 'src' is new data, or the byte-by-byte scan exceeds a budget (a rewritten file has
+#   no matches to find), a plain copy is cheaper, so it falls back to one
+def _delta_transfer(src: str, dst: str) -> Tuple[int, int]:
+    block_size = _delta_block_size(os.path.getsize(dst))
+    signatures: Dict[int, Dict[bytes, int]] = {}
+    with open(dst, 'rb') as basis:
+        for (index, block) in enumerate(iter(lambda: basis.read(block_size), b'')):
+            if len(block) == block_size:
+                signatures.setdefault(zlib.adler32(block), {}).setdefault(_strong_checksum(block), index)
+    src_size = os.path.getsize(src)
+    if not signatures or src_size < block_size:
+        _copy_file_data(src, dst)
+        return (src_size, 0)
+
+    # Operations: (source offset, length, basis block index or -1 for literal source bytes)
+    operations: List[Tuple[int, int, int]] = []
+    max_literal = src_size // 2
+    scan_budget = max(64 * block_size, src_size // 32)
+    (literal, reused, scanned) = (0, 0, 0)
+    with open(src, 'rb') as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        (position, literal_start, rolling) = (0, 0, False)
+        (a, b) = (0, 0)
+        while position + block_size <= src_size:
+            if not rolling:
+                weak = zlib.adler32(data[position:position + block_size])
+                (a, b, rolling) = (weak & 0xffff, weak >> 16, True)
+            candidates = signatures.get((b << 16) | a)
+            if candidates:
+                index = candidates.get(_strong_checksum(data[position:position + block_size]))
+                if index is not None:
+                    if position > literal_start:
+                        operations.append((literal_start, position - literal_start, -1))
+                        literal += position - literal_start
+                    operations.append((position, block_size, index))
+                    reused += block_size
+                    position += block_size
+                    (literal_start, rolling) = (position, False)
+                    continue
+            if position + block_size >= src_size:
+                break
+            scanned += 1
+            if scanned > scan_budget or literal + position - literal_start > max_literal:
+                break
+            (old_byte, new_byte) = (data[position], data[position + block_size])
+            a = (a - old_byte + new_byte) % 65521
+            b = (b - block_size * old_byte + a - 1) % 65521
+            position += 1
+        if src_size > literal_start:
+            operations.append((literal_start, src_size - literal_start, -1))
+            literal += src_size - literal_start
+        if literal > max_literal or scanned > scan_budget:
+            data.close()
+            source.close()
+            _copy_file_data(src, dst)
+            return (src_size, 0)
+
+        if all(index < 0 or index * block_size == offset for (offset, _, index) in operations):
+            with open(dst, 'r+b') as target:
+                for (offset, length, index) in operations:
+                    if index < 0:
+                        target.seek(offset)
+                        target.write(data[offset:offset + length])
+                target.truncate(src_size)
+            return (literal, reused)
+        temp_path = f'{dst}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(dst, 'rb') as basis, open(temp_path, 'wb') as target:
+                for (offset, length, index) in operations:
+                    if index < 0:
+                        target.write(data[offset:offset + length])
+                    else:
+                        basis.seek(index * block_size)
+                        target.write(basis.read(block_size))
+            os.replace(temp_path, dst)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return (literal, reused)
+
+
+def _remove_file(path: str, missing_ok: bool = False):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        if not missing_ok:
+            raise
+    except PermissionError:
+        os.chmod(path, stat.S_IWRITE)
+        os.remove(path)
+
+
+# shutil.rmtree 'onerror' handler that treats an already deleted path as removed
+def _ignore_missing(function: Callable, path: str, exc_info: Tuple):
+    if not isinstance(exc_info[1], FileNotFoundError):
+        raise exc_info[1]
+
+
+# Removes every directory (including 'root') that holds no files once its empty subdirectories are gone
+# - one walk_parallel listing per directory, then a bottom-up pass with a per-directory count of remaining
+#   entries (linear)
+# - symlinks are entries that keep their directory; they are never followed
+# - 'manifest' (see sync_manifest_path) drops the removed directories, so the next sync does not trust them
+# - returns DictObj(removed=[...], failed=[...], scanned=int, dry_run=bool); 'removed' is bottom-up,
+#   and with 'dry_run' lists what would be removed
+def remove_empty_directories(root: str, dry_run: bool = False, max_workers: int = _WALK_WORKERS,
+                             manifest: str = '') -> DictObj:
+    """Method that recursively removes empty subdirectories"""
+    result = DictObj(removed=[], failed=[], scanned=0, dry_run=dry_run)
+    if not os.path.isdir(root):
+        return result
+    # Relative directories in walk order (parents before their children), with their count of entries
+    directories: List[str] = ['']
+    remaining: Dict[str, int] = {'': 0}
+
+    def unreadable(error: OSError):
+        LOG.error(f'{type(error).__name__}: {error}')
+        result.failed.append(error.filename)
+        rel_dir = os.path.relpath(error.filename, root)
+        remaining['' if rel_dir == os.curdir else rel_dir] += 1  # never treated as empty
+    for (rel_path, re_path, entry) in walk_parallel(root, max_workers=max_workers, onerror=unreadable):
+        remaining[os.path.dirname(rel_path)] += 1
+        if entry.is_dir(follow_symlinks=False):
+            directories.append(rel_path)
+            remaining[rel_path] = 0
+    result.scanned = len(directories)
+
+    for rel_dir in reversed(directories):
+        if remaining[rel_dir]:
+            continue
+        directory = os.path.join(root, rel_dir) if rel_dir else root
+        if not dry_run:
+            try:
+                os.rmdir(directory)
+            except OSError as e:
+                LOG.error(f'{type(e).__name__}: {e}')
+                result.failed.append(directory)
+                continue
+        result.removed.append(directory)
+        if rel_dir:
+            remaining[os.path.dirname(rel_dir)] -= 1
+    if manifest and result.removed and not dry_run:
+        _drop_manifest_entries(manifest, [os.path.relpath(directory, root) for directory in result.removed])
+    return result
 
 
 # --- File Commands ---
 
+# Reads a whole file in one read call (sized by fstat, no text layer); 'path' is used as given (no expand_path)
+# - a missing file reads as b'' without logging, so polling loops (pidfiles, lockfiles) stay quiet
+# - with 'use_mmap', a non-empty file is returned as a read-only mmap instead: bytes-like (slicing, find, hashing)
+#   without copying the file into memory; close it, or use it in a 'with' block
+def read_bytes(path: str, use_mmap: bool = False) -> bytes | mmap.mmap:
+    """Method that reads a file's raw content"""
+    try:
+        with open(path, 'rb', buffering=0) as file:
+            if use_mmap and os.fstat(file.fileno()).st_size:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return file.readall()
+    except FileNotFoundError:
+        return b''
+    except OSError as e:
+        LOG.error(f'{type(e).__name__}: {e}')
+        return b''
+
+
+# Writes raw content; 'path' is used as given (no expand_path), and its directory is only created when the
+# first open finds it missing (no existence check per call)
+# - with 'atomic', the content goes to a temporary file in the same directory that then replaces 'path'
+#   (keeping its permissions), so readers see the old or the new content, never a partial file
+def write_bytes(path: str, data: bytes | bytearray | memoryview = b'', append: bool = False, atomic: bool = False
+                ) -> bool:
+    """Method that writes a file's raw content"""
+    target = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp' if atomic and not append else path
+
+    def write():
+        with open(target, 'ab' if append else 'wb') as file:
+            file.write(data)
+    try:
+        try:
+            write()
+        except FileNotFoundError:
+            if not os.path.dirname(path) or os.path.isdir(os.path.dirname(path)):
+                raise
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write()
+        if target != path:
+            try:
+                os.chmod(target, stat.S_IMODE(os.stat(path).st_mode))
+            except FileNotFoundError:
+                pass
+            os.replace(target, path)
+        return True
+    except OSError as e:
+        LOG.error(f'{type(e).__name__}: {e}')
+        if target != path:
+            _remove_file(target, missing_ok=True)
+        return False
+
+
 # Touch file and optionally fill with content
-def write_file(path: str, content: Optional[Any] = None, append: bool = False):
+# - text is encoded once (latin-1, newlines as os.linesep, like the text mode it replaces) and written by write_bytes
+def write_file(path: str, content: Optional[Any] = None, append: bool = False, atomic: bool = False) -> bool:
     """Method that creates a file"""
-    strategy = 'a' if (append) else 'w'  # write mode
-    # open() only accepts absolute paths, not relative
-    path = expand_path(path)
-    # Ensure containing directory exists
-    if not path_exists(path, 'd'):
-        create_directory(path_dir(path))
+    # Accept content as string or sequence of strings
+    if isinstance(content, list):
+        text = ''.join(content)
+    elif content is None:
+        text = ''
+    else:
+        text = str(content)
     # http://python-notes.curiousefficiency.org/en/latest/python3/text_file_processing.html
-    with open(path, strategy, encoding='latin-1') as f:
-        # Accept content as string or sequence of strings
-        if isinstance(content, list):
-            f.writelines(content)
-        elif content is None:
-            f.write('')
-        else:
-            f.write(str(content))
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    # open() only accepts absolute paths, not relative
+    return write_bytes(expand_path(path), text.encode('latin-1'), append, atomic)
 
 
+# Reads a file's content as latin-1 text (any byte decodes), decoded once from read_bytes
+# - newlines are normalized to '\n' like text mode; 'oneline' only reads up to the first line break
 def read_file(path: str, oneline: bool = False) -> str:
     """Method that reads a file's content"""
-    data: str = ''
     path = expand_path(path)
-    if not (path or path_exists(path, 'f')):
-        return data
-    try:
-        # http://python-notes.curiousefficiency.org/en/latest/python3/text_file_processing.html
-        with open(path, 'r', encoding='latin-1') as f:
-            data = f.readline().rstrip() if (oneline) else f.read().strip()
-    except IOError as e:
-        # File does not exist or some other IOError
-        LOG.error(f'Exception: {e}')
-    return data
+    if oneline:
+        try:
+            with open(path, 'rb') as file:
+                line = file.readline()
+        except FileNotFoundError:
+            return ''
+        except OSError as e:
+            # Unreadable (permissions, a directory) or some other IOError
+            LOG.error(f'Exception: {e}')
+            return ''
+        return line.decode('latin-1').split('\r', 1)[0].rstrip()
+    # http://python-notes.curiousefficiency.org/en/latest/python3/text_file_processing.html
+    data = read_bytes(path).decode('latin-1')
+    if '\r' in data:
+        data = data.replace('\r\n', '\n').replace('\r', '\n')
+    return data.strip()
 
 
 def delete_file(path: str):
@@ -475,7 +1441,9 @@ def rename_file(src: str, dest: str):
         os.rename(src, dest)
 
 
-def copy_file(src: str, dest: str) -> bool:
+# Same result as 'shutil.copy2' (data, then permissions + timestamps + flags via copystat), with in-kernel copies
+# - 'range_workers' > 1 copies a large file as parallel ranges (fast on SSDs, slow on spinning disks)
+def copy_file(src: str, dest: str, range_workers: int = 1) -> bool:
     """Method that copies a file"""
     if not path_exists(src, 'f'):
         return False
@@ -483,34 +1451,112 @@ def copy_file(src: str, dest: str) -> bool:
     dest_dir = path_dir(dest)  # grab directory path from file path
     create_directory(dest_dir)
     try:
-        shutil.copy2(src, dest)
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(src))
+        _copy_file_data(src, dest, range_workers)
+        shutil.copystat(src, dest)
         return True
     except Exception as e:
         LOG.error(f'Exception: {e}')
         return False
 
 
-def hash_file(path: str) -> str:
+# Copies (src, dest) pairs on a thread pool, keeping many small files in flight; results keep the order of 'pairs'
+# - files of at least _COPY_PARALLEL_SIZE are also split into 'range_workers' parallel ranges
+def copy_files(pairs: List[Tuple[str, str]], max_workers: int = 8, range_workers: int = 4) -> List[bool]:
+    """Method that copies many files concurrently"""
+    if not pairs:
+        return []
+    worker_count = max(1, min(int(max_workers), len(pairs)))
+    if worker_count == 1:
+        return [copy_file(src, dest, range_workers) for (src, dest) in pairs]
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        return list(executor.map(lambda pair: copy_file(pair[0], pair[1], range_workers), pairs))
+
+
+# Chunk size for hash_file; files at least _HASH_MMAP_SIZE are hashed through mmap instead of read calls
+_HASH_CHUNK_SIZE = 1024 * 1024
+_HASH_MMAP_SIZE = 64 * 1024 * 1024
+_HASH_BUFFER = threading.local()
+
+
+# Hashes in-process (no 'sha256sum' subprocess); 'algorithm' is any hashlib name or 'crc32'
+# - 'crc32' (zlib) is a fast non-cryptographic digest, only fit for equality checks (see match_file)
+def hash_file(path: str, algorithm: str = 'sha256') -> str:
     """Method that verifies a file hash"""
     if not path_exists(path, 'f'):
         return ''
-    # Using SHA-2 hash check (more secure than MD5|SHA-1)
-    command: List[str] = ['sha256sum', path]
-    process = run_subprocess(command)
-    # log_subprocess(LOG, process, debug=ARGS.debug)
-    results: List[str] = str(process.stdout).split()
-    # LOG.debug(f"results: {results}")
-    return results[0]
+    hash_cache = _HASH_CACHE
+    try:
+        file_stat = os.stat(path)
+        if hash_cache is not None:
+            cached_digest = hash_cache.lookup(path, file_stat, algorithm)
+            if cached_digest:
+                return cached_digest
+        with open(path, 'rb') as file:
+            if algorithm == 'crc32':
+                checksum = 0
+                for chunk in _read_chunks(file, file_stat.st_size):
+                    checksum = zlib.crc32(chunk, checksum)
+                result = f'{checksum:08x}'
+            else:
+                # Using SHA-2 hash check by default (more secure than MD5|SHA-1)
+                digest = hashlib.new(algorithm)
+                for chunk in _read_chunks(file, file_stat.st_size):
+                    digest.update(chunk)
+                result = digest.hexdigest()
+            # Only cache when the file did not change while it was read
+            if hash_cache is not None and HashCache.signature(os.fstat(file.fileno())) == HashCache.signature(file_stat):
+                hash_cache.store(path, file_stat, algorithm, result)
+            return result
+    except (OSError, ValueError) as e:
+        LOG.error(f'{type(e).__name__}: {e}')
+        return ''
+
+
+# Yields views of 'file' contents; the read buffer is reused per thread so hashing many files allocates nothing
+def _read_chunks(file, size: int) -> Iterator[memoryview]:
+    if size >= _HASH_MMAP_SIZE:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for offset in range(0, size, _HASH_MMAP_SIZE):
+                    # Release each slice before the map closes (exported views block mmap.close)
+                    with view[offset:offset + _HASH_MMAP_SIZE] as chunk:
+                        yield chunk
+        return
+    buffer: Optional[bytearray] = getattr(_HASH_BUFFER, 'buffer', None)
+    if buffer is None:
+        buffer = _HASH_BUFFER.buffer = bytearray(_HASH_CHUNK_SIZE)
+    with memoryview(buffer) as view:
+        while True:
+            read_size = file.readinto(view)
+            if not read_size:
+                break
+            with view[:read_size] as chunk:
+                yield chunk
 
 
 # Uses hash to validate file integrity
-def match_file(path1: str, path2: str) -> bool:
+# - files of different size are never hashed; the same file (hard link or same path) is never read
+def match_file(path1: str, path2: str, algorithm: str = 'sha256') -> bool:
     """Method that verifies whether files match based on hash"""
+    try:
+        stat1 = os.stat(path1)
+        stat2 = os.stat(path2)
+    except OSError:
+        return False
+    if not (stat.S_ISREG(stat1.st_mode) and stat.S_ISREG(stat2.st_mode)):
+        return False
+    if os.path.samestat(stat1, stat2):
+        return True
+    # Equal mtimes cannot prove equal contents, so only the size is trusted to short-circuit
+    if stat1.st_size != stat2.st_size:
+        return False
     # LOG.debug(f"path1: {path1}")
-    hash1 = hash_file(path1)
+    hash1 = hash_file(path1, algorithm)
     # LOG.debug(f"hash1: {hash1}")
     # LOG.debug(f"path2: {path2}")
-    hash2 = hash_file(path2)
+    hash2 = hash_file(path2, algorithm)
     # LOG.debug(f"hash2: {hash2}")
     if len(hash1) > 0 and len(hash2) > 0:
         return hash1 == hash2
@@ -577,7 +1623,7 @@ def save_json(path: str, data: Any, indent: Optional[int] = 2) -> bool:
     # LOG.debug(f'data: {data}')
     file_ready = to_json(data, indent)
     # LOG.debug(f'file_ready: {file_ready}')
-    write_file(path, file_ready)
+    write_file(path, file_ready, atomic=True)
     return path_exists(path, 'f')
 
 
@@ -596,28 +1642,118 @@ def is_json_str(json_str: str) -> bool:
 
 # --- Process Commands ---
 
+# Characters that only mean something to a shell; argv holding any of them keeps the shell wrapper
+_SHELL_CHARACTERS = frozenset('|&;<>()$`"\'*?[]{}\n\t ')
+# Windows script types that CreateProcess cannot launch directly
+_SHELL_EXTENSIONS = ('.bat', '.cmd', '.ps1')
+
+# Counters per launch mode: 'exec' (direct argv), 'shell' (bash/pwsh wrapper), 'session' (warm shell)
+_SUBPROCESS_STATS: Dict[str, Dict[str, float]] = {}
+_SUBPROCESS_STATS_LOCK = threading.Lock()
+
+
+def _record_subprocess(mode: str, elapsed: float):
+    with _SUBPROCESS_STATS_LOCK:
+        stats = _SUBPROCESS_STATS.setdefault(mode, {'calls': 0, 'seconds': 0.0})
+        stats['calls'] += 1
+        stats['seconds'] += elapsed
+
+
+def subprocess_stats() -> Dict[str, Dict[str, float]]:
+    """Method that returns the call count and total seconds per subprocess launch mode"""
+    with _SUBPROCESS_STATS_LOCK:
+        return {mode: dict(stats) for (mode, stats) in _SUBPROCESS_STATS.items()}
+
+
+def reset_subprocess_stats():
+    """Method that clears the subprocess launch counters"""
+    with _SUBPROCESS_STATS_LOCK:
+        _SUBPROCESS_STATS.clear()
+
+
+# Returns the resolved executable path when the argv can skip the shell, otherwise an empty string
+def _resolve_executable(command: List[str]) -> str:
+    if not command:
+        return ''
+    for arg in command:
+        text = str(arg)
+        if _SHELL_CHARACTERS.intersection(text) or text.startswith(('~', '#')):
+            return ''
+        if system_platform() != 'windows' and '\\' in text:
+            return ''
+    # Cmdlets, aliases and shell builtins only resolve inside the shell
+    executable = shutil.which(str(command[0])) or ''
+    if executable.lower().endswith(_SHELL_EXTENSIONS):
+        return ''
+    return executable
+
+
+# Resolves how 'command' is launched: 'exec' runs the executable directly, 'shell' wraps it in the platform shell
+# - 'missing' when 'shell' is False and no executable is found on PATH
+def _launch_command(command: List[str], shell: Optional[bool] = None) -> Tuple[str, List[str]]:
+    executable = '' if shell else _resolve_executable(command)
+    if shell is False and not executable:
+        executable = shutil.which(str(command[0])) if command else ''
+        if not executable:
+            return ('missing', [])
+    if executable:
+        return ('exec', [executable, *map(str, command[1:])])
+
+    # Detect shell to run command in based on system platform
+    run_command: List[str] = []
+    platform = system_platform()
+    if platform == 'windows':
+        # run_command = ['powershell', '-Command'] + command  # legacy Windows PowerShell, built on Windows-only .NET
+        run_command = ['pwsh', '-Command'] + command  # PowerShell [Core], built on cross-platform .NET Core
+    elif platform == 'linux':
+        run_command = ['bash', '-c'] + command  # use Bash for *nix
+    # LOG.debug(f'run_command: {run_command}')
+    return ('shell', run_command)
+
+
 # Creates asyncronous process and immediately awaits the tuple results
 # NOTE: Only accepting 'command' as list; argument options can have spaces
+# - shell=None detects whether the command needs shell syntax; False launches argv directly (no bash/pwsh hop)
 def run_subprocess(
     command: List[str],
     cwd: Optional[str] = None,
     env: Optional[Dict[str, str]] = None,
+    shell: Optional[bool] = None,
     # ) -> Tuple[str, str, int]:
 ) -> subprocess.CompletedProcess:
     """Method that runs a command in a subprocess"""
-    run_command: List[str] = []
+    start_time = time.perf_counter()
 
     # process: SubProcess = SubProcess(command, cwd, env)
     # (stdout, stderr, rc) = process.await_results()
 
-    # Detect shell to run command in based on system platform
-    platform = system_platform()
-    if platform == 'windows':
-        # run_command = ['powershell', '-Command'] + command  # legacy Windows PowerShell, built on Windows-only .NET
-        run_command = ['pwsh', '-Command'] + command  # PowerShell [Core], built on cross-platform .NET Core
-    elif platform == 'linux':
-        run_command = ['bash', '-c'] + command  # use Bash for *nix
-    # LOG.debug(f'run_command: {run_command}')
+    (mode, run_command) = _launch_command(command, shell)
+    if mode == 'missing':
+        return subprocess.CompletedProcess(command, 127, '', f'command not found: {command[0] if command else ""}')
+
+    if mode == 'exec':
+        # Absolute executable with inherited fds (non-inheritable since PEP 446) lets CPython use posix_spawn/vfork
+        result: subprocess.CompletedProcess = subprocess.run(
+            run_command,
+            capture_output=True,
+            cwd=cwd,
+            check=False,
+            env=env,
+            universal_newlines=True,
+            close_fds=False,
+        )
+        result.args = command
+        _record_subprocess('exec', time.perf_counter() - start_time)
+        return result
+
+    # Dispatch into a warm shell session when the pool is open (see open_session_pool)
+    # - commands with 'env' keep the one-off shell: a session would layer 'env' instead of replacing the environment
+    if _SESSION_POOL is not None and env is None:
+        session_result = _SESSION_POOL.run(command, cwd, env)
+        if session_result is not None:
+            _record_subprocess('session', time.perf_counter() - start_time)
+            return session_result
+        # No live session could take the command; fall back to a one-off shell
 
     # Execute the command in a subprocess
     result: subprocess.CompletedProcess = subprocess.run(
@@ -629,6 +1765,7 @@ def run_subprocess(
         universal_newlines=True,
     )
     # LOG.debug(f'subprocess result: {result}')
+    _record_subprocess('shell', time.perf_counter() - start_time)
 
     # stdout: str = result.stdout
     # stderr: str = result.stderr
@@ -638,6 +1775,139 @@ def run_subprocess(
     return result
 
 
+# Runs independent commands concurrently (bounded by 'max_workers'); results keep the order of 'commands'
+# - provide 'logger' to log each command with its output as one block once it completes (never interleaved)
+# - only for commands that share no state, so no command script uses it: 'code --install-extension' calls all
+#   write extensions.json, 'dotnet add package' calls the same .csproj and 'az' calls ~/.azure; they run in one
+#   process (code) or one after another instead
+def run_subprocesses(
+    commands: List[List[str]],
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    max_workers: int = 4,
+    logger: Optional[log.Logger] = None,
+    debug: bool = False,
+) -> List[subprocess.CompletedProcess]:
+    """Method that runs independent commands concurrently in subprocesses"""
+    if not commands:
+        return []
+    log_lock = threading.Lock()
+
+    def run_one(command: List[str]) -> subprocess.CompletedProcess:
+        process = run_subprocess(command, cwd, env)
+        if logger:
+            with log_lock:
+                logger.debug(' '.join(map(str, command)))
+                log_subprocess(logger, process, debug)
+        return process
+
+    worker_count = max(1, min(int(max_workers), len(commands)))
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        return list(executor.map(run_one, commands))
+
+
+# Async counterpart of run_subprocess for overlapping I/O-bound CLI calls on one event loop (no threads)
+# - 'on_output' streams each line as it arrives: on_output('stdout' | 'stderr', line)
+# - 'timeout' kills the process and raises subprocess.TimeoutExpired; cancelling the task also kills the process
+async def run_subprocess_async(
+    command: List[str],
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    shell: Optional[bool] = None,
+    timeout: Optional[float] = None,
+    on_output: Optional[Callable[[str, str], None]] = None,
+) -> subprocess.CompletedProcess:
+    """Method that runs a command in an asyncio subprocess"""
+    start_time = time.perf_counter()
+    (mode, run_command) = _launch_command(command, shell)
+    if mode == 'missing':
+        return subprocess.CompletedProcess(command, 127, '', f'command not found: {command[0] if command else ""}')
+
+    process = await asyncio.create_subprocess_exec(
+        *run_command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+    )
+    stdout = bytearray()
+    stderr = bytearray()
+
+    # Chunked reads (not readline) so very long lines never hit the StreamReader limit
+    async def read_stream(stream: asyncio.StreamReader, name: str, buffer: bytearray):
+        line_start = 0
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            buffer += chunk
+            if on_output:
+                line_end = buffer.find(b'\n', line_start)
+                while line_end != -1:
+                    on_output(name, _decode_output(bytes(buffer[line_start:line_end + 1])))
+                    line_start = line_end + 1
+                    line_end = buffer.find(b'\n', line_start)
+        if on_output and line_start < len(buffer):
+            on_output(name, _decode_output(bytes(buffer[line_start:])))
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                read_stream(process.stdout, 'stdout', stdout),
+                read_stream(process.stderr, 'stderr', stderr),
+                process.wait(),
+            ),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        await _kill_process_async(process)
+        raise subprocess.TimeoutExpired(command, timeout, _decode_output(bytes(stdout)), _decode_output(bytes(stderr)))
+    except asyncio.CancelledError:
+        await _kill_process_async(process)
+        raise
+    _record_subprocess(mode, time.perf_counter() - start_time)
+    return subprocess.CompletedProcess(command, process.returncode, _decode_output(bytes(stdout)), _decode_output(bytes(stderr)))
+
+
+# Event-loop runner so sync commands can gather many async subprocesses at once (bounded by 'max_concurrency')
+# - results keep the order of 'commands'; a command that exceeds 'timeout' is returned with rc -1
+def gather_subprocesses(
+    commands: List[List[str]],
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    max_concurrency: int = 8,
+    timeout: Optional[float] = None,
+) -> List[subprocess.CompletedProcess]:
+    """Method that runs commands concurrently on an asyncio event loop"""
+    if not commands:
+        return []
+
+    async def gather_all() -> List[subprocess.CompletedProcess]:
+        semaphore = asyncio.Semaphore(max(1, int(max_concurrency)))
+
+        async def run_one(command: List[str]) -> subprocess.CompletedProcess:
+            async with semaphore:
+                try:
+                    return await run_subprocess_async(command, cwd, env, timeout=timeout)
+                except subprocess.TimeoutExpired as e:
+                    return subprocess.CompletedProcess(command, -1, e.output or '', e.stderr or f'timed out after {timeout}s')
+
+        return list(await asyncio.gather(*(run_one(command) for command in commands)))
+
+    return asyncio.run(gather_all())
+
+
+async def _kill_process_async(process: asyncio.subprocess.Process):
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+    # Shield the reap so a second cancellation cannot leave a zombie behind
+    await asyncio.shield(process.wait())
+
+
 # Log the subprocess output provided
 def log_subprocess(logger: log.Logger, process: subprocess.CompletedProcess, debug: bool = False):
     """Method that logs a command in a subprocess"""
@@ -659,6 +1929,66 @@ def log_subprocess(logger: log.Logger, process: subprocess.CompletedProcess, deb
     # [Debug]               "rc: {0}"
 
 
+# --- ShellSession Commands ---
+
+_SESSION_POOL: Optional['ShellSessionPool'] = None
+
+
+# Opt-in; once open, run_subprocess reuses warm shells instead of starting one per call
+def open_session_pool(size: int = 2) -> 'ShellSessionPool':
+    """Method that opens the shell session pool used by run_subprocess"""
+    global _SESSION_POOL
+    if _SESSION_POOL is None:
+        _SESSION_POOL = ShellSessionPool(size)
+    return _SESSION_POOL
+
+
+def close_session_pool():
+    """Method that closes the shell session pool used by run_subprocess"""
+    global _SESSION_POOL
+    if _SESSION_POOL is not None:
+        _SESSION_POOL.close()
+        _SESSION_POOL = None
+
+
+atexit.register(close_session_pool)
+
+
+# --- HashCache Commands ---
+
+_HASH_CACHE: Optional['HashCache'] = None
+
+
+# Default location in the user cache directory (%LOCALAPPDATA% on Windows, $XDG_CACHE_HOME or ~/.cache otherwise)
+def hash_cache_path() -> str:
+    """Method that returns the default hash cache location"""
+    if system_platform() == 'windows':
+        cache_root = environment_get('LOCALAPPDATA') or expand_path('~/AppData/Local')
+    else:
+        cache_root = environment_get('XDG_CACHE_HOME') or expand_path('~/.cache')
+    return join_path(cache_root, 'pc-setup', 'hash_cache.sqlite3')
+
+
+# Opt-in; once open, hash_file, match_file and sync_directory ('content' option) reuse digests of unchanged files
+def open_hash_cache(path: str = '', max_entries: int = 200000) -> 'HashCache':
+    """Method that opens the persistent hash cache used by hash_file"""
+    global _HASH_CACHE
+    if _HASH_CACHE is None:
+        _HASH_CACHE = HashCache(path, max_entries)
+    return _HASH_CACHE
+
+
+def close_hash_cache():
+    """Method that closes the persistent hash cache used by hash_file"""
+    global _HASH_CACHE
+    if _HASH_CACHE is not None:
+        _HASH_CACHE.close()
+        _HASH_CACHE = None
+
+
+atexit.register(close_hash_cache)
+
+
 # --- Signal Commands ---
 
 # def max_signal() -> int:
@@ -756,6 +2086,59 @@ class SubProcess(object):
             LOG.error(f'Exception: {e}')
             return ('', '', -1)
 
+    # Yields ('stdout' | 'stderr', line) while the process runs, instead of buffering the whole output
+    # - at most 'max_buffered' lines wait in memory; when full the reader threads block, the pipe fills and
+    #   the process itself pauses until the consumer catches up (backpressure)
+    # - closing the generator early kills the process
+    def stream_lines(self, max_buffered: int = 1000) -> Iterator[Tuple[str, str]]:
+        """Method that yields output lines of the process as they are written"""
+        lines: queue.Queue = queue.Queue(maxsize=max(1, int(max_buffered)))
+        stopped = threading.Event()
+
+        def read_stream(stream, name: str):
+            try:
+                for line in iter(stream.readline, ''):
+                    while not stopped.is_set():
+                        try:
+                            lines.put((name, line.rstrip('\r\n')), timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stopped.is_set():
+                        break
+            finally:
+                stream.close()
+                lines.put((name, None))
+
+        readers = [
+            threading.Thread(target=read_stream, args=(self.process.stdout, 'stdout'), daemon=True),
+            threading.Thread(target=read_stream, args=(self.process.stderr, 'stderr'), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        open_streams = len(readers)
+        try:
+            while open_streams:
+                (name, line) = lines.get()
+                if line is None:
+                    open_streams -= 1
+                    continue
+                yield (name, line)
+            self.rc = self.process.wait()
+        finally:
+            if self.process.poll() is None:
+                self.process.kill()
+                self.process.wait()
+            stopped.set()
+            # Free any reader blocked on a full queue so it can see the stop
+            while any(reader.is_alive() for reader in readers):
+                try:
+                    lines.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.pid = self.process.pid
+            self.rc = self.process.returncode
+
     def format_output(self, text: str) -> str:
         """Method that formats process output"""
         # Split newlines and strip/trim whitespace
@@ -768,6 +2151,526 @@ class SubProcess(object):
             return whitespace_trimmed
 
 
+# ------------------------ ShellSession Class ------------------------
+
+# Each command is framed by a unique token on stdout (followed by the return code) and stderr
+# - commands run inside a subshell/scriptblock so 'cd' and exported variables never leak into the next
+# - 'env' is exported on top of the session environment (layered, like SubProcess); subprocess.run(env=...) replaces
+#   the environment instead, so run_subprocess only dispatches commands without 'env' to a session
+class ShellSession(object):
+    """Class of a long-lived shell process that runs framed commands"""
+
+    def __init__(self, platform: str = ''):
+        self.platform: str = platform or system_platform()
+        self.token: str = f'__shell_session_{uuid.uuid4().hex}__'
+        if self.platform == 'windows':
+            shell_command = ['pwsh', '-NoLogo', '-NoProfile', '-NonInteractive', '-Command', '-']
+        else:
+            shell_command = ['bash', '--noprofile', '--norc']
+        self.process = subprocess.Popen(
+            shell_command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        # Drain stdout/stderr on background threads so neither pipe can fill up and block the shell
+        self._buffers: List[bytearray] = [bytearray(), bytearray()]
+        self._eof: List[bool] = [False, False]
+        self._condition = threading.Condition()
+        for (index, stream) in enumerate([self.process.stdout, self.process.stderr]):
+            reader = threading.Thread(target=self._read_stream, args=(index, stream), daemon=True)
+            reader.start()
+
+    def __str__(self):
+        return str(self.process)
+
+    @property
+    def is_alive(self) -> bool:
+        """Method that validates whether the shell process is still running"""
+        return self.process.poll() is None
+
+    def _read_stream(self, index: int, stream):
+        while True:
+            try:
+                chunk = os.read(stream.fileno(), 65536)
+            except (OSError, ValueError):
+                chunk = b''
+            with self._condition:
+                if chunk:
+                    self._buffers[index] += chunk
+                else:
+                    self._eof[index] = True
+                self._condition.notify_all()
+            if not chunk:
+                return
+
+    # Returns (output, trailer) where trailer is the text between token and newline; None when the shell died
+    def _take(self, index: int) -> Optional[Tuple[bytes, bytes]]:
+        marker = self.token.encode()
+        with self._condition:
+            while True:
+                buffer = self._buffers[index]
+                position = buffer.find(marker)
+                if position >= 0:
+                    line_end = buffer.find(b'\n', position)
+                    if line_end >= 0:
+                        output = bytes(buffer[:position])
+                        trailer = bytes(buffer[position + len(marker):line_end])
+                        del buffer[:line_end + 1]
+                        return (output, trailer)
+                if self._eof[index]:
+                    return None
+                self._condition.wait()
+
+    def _frame_bash(self, command: str, cwd: Optional[str], env: Optional[Dict[str, str]]) -> str:
+        steps: List[str] = []
+        if cwd:
+            steps.append(f'cd -- {shlex.quote(cwd)}')
+        for (key, value) in (env or {}).items():
+            steps.append(f'export {key}={shlex.quote(str(value))}')
+        # 'eval' keeps the frame intact even when the command itself has a syntax error
+        steps.append(f'eval {shlex.quote(command)}')
+        script = ' && '.join(steps)
+        return (f'( {script} ) </dev/null; '
+                f'printf \'%s%d\\n\' \'{self.token}\' "$?"; '
+                f'printf \'%s\\n\' \'{self.token}\' >&2\n')
+
+    def _frame_pwsh(self, command: str, cwd: Optional[str], env: Optional[Dict[str, str]]) -> str:
+        def quote(text: str) -> str:
+            return "'" + str(text).replace("'", "''") + "'"
+        saves: List[str] = []
+        restores: List[str] = []
+        for (key, value) in (env or {}).items():
+            saves.append(f'$__saved[{quote(key)}] = $env:{key}; $env:{key} = {quote(value)}')
+            restores.append(f'$env:{key} = $__saved[{quote(key)}]')
+        push = f'Push-Location -LiteralPath {quote(cwd)}; ' if cwd else ''
+        pop = 'Pop-Location; ' if cwd else ''
+        return ('& { $global:LASTEXITCODE = 0; $__ok = $true; $__saved = @{}; '
+                + ''.join(f'{s}; ' for s in saves)
+                + f'try {{ {push}Invoke-Expression {quote(command)}; $__ok = $? }} '
+                + 'catch { [Console]::Error.WriteLine($_); $__ok = $false } '
+                + f'finally {{ {pop}' + ''.join(f'{r}; ' for r in restores) + '}; '
+                + '$__rc = if ($global:LASTEXITCODE) { $global:LASTEXITCODE } elseif ($__ok) { 0 } else { 1 }; '
+                + f'[Console]::Out.Write({quote(self.token)} + $__rc + "`n"); '
+                + f'[Console]::Error.Write({quote(self.token)} + "`n") }}\n')
+
+    # Returns None when the session was already dead, so the caller can start a one-off process instead
+    def run(self, command: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None
+            ) -> Optional[subprocess.CompletedProcess]:
+        """Method that runs a command in the shell session"""
+        if not self.is_alive:
+            return None
+        # Follow the caller's working directory the same way a new process would inherit it
+        cwd = cwd or current_path()
+        # Same joining 'pwsh -Command' applies to a list of arguments
+        command_text: str = ' '.join(map(str, command))
+        if self.platform == 'windows':
+            frame = self._frame_pwsh(command_text, cwd, env)
+        else:
+            frame = self._frame_bash(command_text, cwd, env)
+        try:
+            self.process.stdin.write(frame.encode())
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            LOG.debug(f'shell session unavailable: {e}')
+            return None
+
+        stdout_frame = self._take(0)
+        stderr_frame = self._take(1)
+        if stdout_frame is None or stderr_frame is None:
+            # Shell died while the command was running; report what was captured instead of running it twice
+            LOG.warning(f'shell session exited during command: {command_text}')
+            self.close()
+            stdout = stdout_frame[0] if stdout_frame else bytes(self._buffers[0])
+            stderr = stderr_frame[0] if stderr_frame else bytes(self._buffers[1])
+            rc = self.process.returncode if self.process.returncode else -1
+        else:
+            stdout = stdout_frame[0]
+            stderr = stderr_frame[0]
+            rc = int(stdout_frame[1].decode() or -1)
+        return subprocess.CompletedProcess(command, rc, _decode_output(stdout), _decode_output(stderr))
+
+    def close(self):
+        """Method that stops the shell process"""
+        if self.is_alive:
+            try:
+                self.process.stdin.write(b'exit\n')
+                self.process.stdin.close()
+                self.process.wait(timeout=2)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+
+
+# Sessions are created lazily up to 'size' and handed out one command at a time (thread-safe)
+# - callers wait on a condition that every release, retirement and 'close' signals, so a session that dies or a
+#   pool that closes while every session is busy never leaves a caller waiting forever
+class ShellSessionPool(object):
+    """Class of warm shell sessions shared by run_subprocess"""
+
+    def __init__(self, size: int = 2, platform: str = ''):
+        self.size: int = max(1, int(size))
+        self.platform: str = platform or system_platform()
+        self._idle: List[ShellSession] = []
+        self._created: int = 0
+        self._closed: bool = False
+        self._condition = threading.Condition()
+
+    # Returns None once the pool is closed
+    def _acquire(self) -> Optional[ShellSession]:
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                self._condition.wait()
+        try:
+            return ShellSession(self.platform)
+        except OSError:
+            with self._condition:
+                self._created -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, session: ShellSession):
+        with self._condition:
+            retire = self._closed or not session.is_alive
+            if retire:
+                self._created -= 1
+            else:
+                self._idle.append(session)
+            self._condition.notify()
+        if retire:
+            session.close()
+
+    def run(self, command: List[str], cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None
+            ) -> Optional[subprocess.CompletedProcess]:
+        """Method that runs a command in the next available shell session"""
+        try:
+            session = self._acquire()
+        except OSError as e:
+            LOG.debug(f'unable to start shell session: {e}')
+            return None
+        if session is None:
+            return None
+        try:
+            return session.run(command, cwd, env)
+        finally:
+            self._release(session)
+
+    def close(self):
+        """Method that stops every idle shell session"""
+        with self._condition:
+            self._closed = True
+            (sessions, self._idle) = (self._idle, [])
+            self._created -= len(sessions)
+            self._condition.notify_all()
+        for session in sessions:
+            session.close()
+
+
+# Matches the text 'universal_newlines=True' would have produced
+def _decode_output(data: bytes) -> str:
+    return data.decode(errors='replace').replace('\r\n', '\n')
+
+
+# ------------------------ HashCache Class ------------------------
+
+# Digests are keyed by absolute path + algorithm and only trusted while (size, mtime_ns, ctime_ns, inode) still match
+# - hits are touched in memory and written back in batches; 'flush' evicts the least recently used past 'max_entries'
+# - files modified within the last few seconds are not stored, since a same-size rewrite in the same mtime tick
+#   would otherwise look unchanged (the "racy git" problem)
+class HashCache(object):
+    """Class of a persistent (SQLite) file hash cache"""
+
+    _RACY_SECONDS = 2  # coarsest common mtime granularity (FAT)
+
+    def __init__(self, path: str = '', max_entries: int = 200000, batch_size: int = 1000):
+        self.path: str = path or hash_cache_path()
+        self.max_entries: int = max(1, int(max_entries))
+        self.batch_size: int = max(1, int(batch_size))
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[Tuple[str, str], int] = {}
+        self._pending: int = 0
+        create_directory(path_dir(self.path))
+        self._connection: Optional[sqlite3.Connection] = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.executescript(
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            ' path TEXT NOT NULL, algorithm TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,'
+            ' ctime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, digest TEXT NOT NULL, used INTEGER NOT NULL,'
+            ' PRIMARY KEY (path, algorithm));'
+            'CREATE INDEX IF NOT EXISTS hashes_used ON hashes (used);'
+        )
+        self._clock: int = int(self._connection.execute('SELECT COALESCE(MAX(used), 0) FROM hashes').fetchone()[0])
+
+    @staticmethod
+    def signature(file_stat: os.stat_result) -> Tuple[int, int, int, int]:
+        """Method that returns the stat fields a cached digest depends on"""
+        return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ctime_ns, file_stat.st_ino)
+
+    def lookup(self, path: str, file_stat: os.stat_result, algorithm: str = 'sha256') -> str:
+        """Method that returns the cached digest of an unchanged file, else an empty string"""
+        key = (os.path.abspath(path), algorithm)
+        with self._lock:
+            if self._connection is None:
+                return ''
+            try:
+                row = self._connection.execute(
+                    'SELECT size, mtime_ns, ctime_ns, inode, digest FROM hashes WHERE path = ? AND algorithm = ?', key
+                ).fetchone()
+            except sqlite3.Error as e:
+                LOG.error(f'sqlite3.Error: {e}')
+                return ''
+            if row is None or tuple(row[:4]) != self.signature(file_stat):
+                self.misses += 1
+                return ''
+            self.hits += 1
+            self._clock += 1
+            self._touched[key] = self._clock
+            self._count_pending()
+            return row[4]
+
+    def store(self, path: str, file_stat: os.stat_result, algorithm: str, digest: str):
+        """Method that records the digest of a file"""
+        if time.time_ns() - file_stat.st_mtime_ns < self._RACY_SECONDS * 1_000_000_000:
+            return
+        key = (os.path.abspath(path), algorithm)
+        with self._lock:
+            if self._connection is None:
+                return
+            self._clock += 1
+            try:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (*key, *self.signature(file_stat), digest, self._clock),
+                )
+            except sqlite3.Error as e:
+                LOG.error(f'sqlite3.Error: {e}')
+                return
+            self._touched.pop(key, None)
+            self._count_pending()
+
+    # Caller holds the lock
+    def _count_pending(self):
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self._flush()
+
+    def flush(self):
+        """Method that writes pending changes and evicts the least recently used entries"""
+        with self._lock:
+            if self._connection is not None:
+                self._flush()
+
+    def _flush(self):
+        try:
+            if self._touched:
+                self._connection.executemany(
+                    'UPDATE hashes SET used = ? WHERE path = ? AND algorithm = ?',
+                    [(used, *key) for (key, used) in self._touched.items()],
+                )
+            self._touched.clear()
+            overflow = self._connection.execute('SELECT COUNT(*) FROM hashes').fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._connection.execute(
+                    'DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes ORDER BY used LIMIT ?)', (overflow,)
+                )
+            self._connection.commit()
+        except sqlite3.Error as e:
+            LOG.error(f'sqlite3.Error: {e}')
+        self._pending = 0
+
+    def close(self):
+        """Method that flushes and closes the cache database"""
+        with self._lock:
+            if self._connection is not None:
+                self._flush()
+                self._connection.close()
+                self._connection = None
+
+
+# Consults the open hash cache (match_file) before dirsync reads both files for a 'content' comparison
+# - unchanged pairs return early with no content reads; everything else keeps dirsync's own behavior
+class _HashCacheSyncer(dirsync.syncer.Syncer):
+    def _update(self, filename, dir1, dir2):
+        if self._updatefiles and self._use_content and _HASH_CACHE is not None:
+            if match_file(os.path.join(dir1, filename), os.path.join(dir2, filename)):
+                return -1  # same as dirsync when no update is needed
+        return super()._update(filename, dir1, dir2)
+
+
+# ------------------------ SyncMatcher Class ------------------------
+
+# Compiles the sync options into one combined regex per list, matched with re.match exactly like dirsync:
+# 'only' must match, then 'include' wins over 'exclude' + 'ignore' ('^\.dirsync$' is always excluded)
+# - 'descend' tells a walker whether anything below a directory can be selected, so whole subtrees are skipped:
+#   no 'only' pattern can match below it (by literal prefix), or an 'exclude'/'ignore' pattern matches every path
+#   below it and no 'include' pattern can
+# - both checks are conservative; a pattern they cannot reason about never prunes anything
+class SyncMatcher(object):
+    """Class of a compiled matcher for sync options"""
+
+    _META_CHARS = '.^$*+?{}[]()|'
+    _LOOKAHEADS = ('$', '\\Z', '\\b', '\\B', '(?=', '(?!')
+
+    def __init__(self, options: Dict[str, Any]):
+        self._only_patterns: List[Any] = list(options.get('only') or [])
+        self._include_patterns: List[Any] = list(options.get('include') or [])
+        exclude_patterns = [*(options.get('exclude') or []), r'^\.dirsync$']
+        ignore_patterns = list(options.get('ignore') or [])
+        self._only = self._compile(self._only_patterns)
+        self._include = self._compile(self._include_patterns)
+        self._exclude = self._compile([*exclude_patterns, *ignore_patterns])
+        self._ignore = self._compile(ignore_patterns)
+        self._only_prefixes: List[str] = [self._literal_prefix(pattern) for pattern in self._only_patterns]
+        self._include_prefixes: List[str] = [self._literal_prefix(pattern) for pattern in self._include_patterns]
+        # Patterns that match every longer path once they match a prefix of it (nothing looks past the match)
+        self._subtree_exclude = self._compile([pattern for pattern in [*exclude_patterns, *ignore_patterns]
+                                               if isinstance(pattern, str)
+                                               and not any(token in pattern for token in self._LOOKAHEADS)])
+
+    # Returns one callable for a list: a single alternation when the patterns combine safely, else a loop
+    @staticmethod
+    def _compile(patterns: List[Any]) -> Callable[[str], bool]:
+        if not patterns:
+            return lambda re_path: False
+        compiled = [re.compile(pattern) for pattern in patterns]
+        if all(isinstance(pattern, str) for pattern in patterns) and not any(regex.groups for regex in compiled):
+            try:
+                combined = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+                return lambda re_path: combined.match(re_path) is not None
+            except re.error:
+                pass  # e.g. inline global flags, only allowed at the start of a whole pattern
+        return lambda re_path: any(regex.match(re_path) for regex in compiled)
+
+    # Literal text every match of 'pattern' starts with ('' when unknown)
+    @classmethod
+    def _literal_prefix(cls, pattern: Any) -> str:
+        if not isinstance(pattern, str) or '|' in pattern or pattern.startswith('(?'):
+            return ''
+        prefix: List[str] = []
+        index = 1 if pattern.startswith('^') else 0
+        while index < len(pattern):
+            char = pattern[index]
+            if char == '\\':
+                escaped = pattern[index + 1:index + 2]
+                if not escaped or escaped.isalnum():
+                    break  # character class, anchor or backreference
+                prefix.append(escaped)
+                index += 2
+            elif char in cls._META_CHARS:
+                if char in '*?{' and prefix:
+                    prefix.pop()  # the previous character is optional
+                break
+            else:
+                prefix.append(char)
+                index += 1
+        return ''.join(prefix)
+
+    def selected(self, re_path: str) -> bool:
+        """Method that returns whether a '/'-separated relative path is selected"""
+        if self._only_patterns and not self._only(re_path):
+            return False
+        if self._include(re_path):
+            return True
+        return not self._exclude(re_path)
+
+    def ignored(self, re_path: str) -> bool:
+        """Method that returns whether a '/'-separated relative path is ignored (skipped on both sides)"""
+        return self._ignore(re_path)
+
+    def descend(self, re_path: str) -> bool:
+        """Method that returns whether anything below a directory can be selected"""
+        below = f'{re_path}/'
+
+        def reachable(prefixes: List[str]) -> bool:
+            return any(prefix.startswith(below) or below.startswith(prefix) for prefix in prefixes)
+        if self._only_patterns and not reachable(self._only_prefixes):
+            return False
+        if self._subtree_exclude(below) and not reachable(self._include_prefixes):
+            return False
+        return True
+
+
+# ------------------------ SyncMetrics Class ------------------------
+
+# Where the time of one sync target goes; pass it as the 'metrics' sync option and the native engine fills it
+# - phases: 'walk' (listing both trees), 'compare' (common files), 'copy' (transfers), 'cleanup' (purge, manifest,
+#   empty directories); callers may time their own phases with phase()
+# - 'compared_stat' files were decided by size/mtime alone, 'compared_content' ones had their bytes compared
+#   (both files read, counted in 'bytes_read' unless the hash cache answers)
+# - thread-safe, copies may record from worker threads
+class SyncMetrics(object):
+    """Class of the throughput and latency counters of a sync"""
+
+    COUNTERS = ('files_scanned', 'dirs_scanned', 'compared_stat', 'compared_content', 'files_copied',
+                'bytes_read', 'bytes_written')
+
+    def __init__(self, slowest_count: int = 5):
+        self.counts: Dict[str, int] = {name: 0 for name in self.COUNTERS}
+        self.seconds: Dict[str, float] = {}
+        self.slowest: List[Tuple[float, str, int]] = []  # min-heap of (seconds, path, size)
+        self._slowest_count: int = slowest_count
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int):
+        """Method that adds to one or more counters"""
+        with self._lock:
+            for (name, value) in counts.items():
+                self.counts[name] += value
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Method that times a block as (part of) a phase"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_seconds(name, time.perf_counter() - start_time)
+
+    def add_seconds(self, name: str, seconds: float):
+        """Method that adds time to a phase"""
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def record_file(self, path: str, size: int, seconds: float):
+        """Method that records one file transfer"""
+        with self._lock:
+            self.counts['files_copied'] += 1
+            self.counts['bytes_read'] += size
+            self.counts['bytes_written'] += size
+            if len(self.slowest) < self._slowest_count:
+                heapq.heappush(self.slowest, (seconds, path, size))
+            elif self.slowest and seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (seconds, path, size))
+
+    def throughput(self) -> float:
+        """Method that returns the bytes written per second of copy time"""
+        seconds = self.seconds.get('copy', 0.0)
+        return self.counts['bytes_written'] / seconds if seconds > 0 else 0.0
+
+    def to_dict(self) -> DictObj:
+        """Method that returns the metrics as plain data (JSON serializable)"""
+        with self._lock:
+            slowest = sorted(self.slowest, reverse=True)
+            return DictObj({
+                **self.counts,
+                'seconds': {name: round(value, 6) for (name, value) in self.seconds.items()},
+                'throughput': round(self.throughput(), 1),
+                'slowest': [{'path': path, 'size': size, 'seconds': round(seconds, 6)}
+                            for (seconds, path, size) in slowest],
+            })
+
+
 # ------------------------ Main program ------------------------
 
 # Initialize the logger
@@ -782,10 +2685,21 @@ if __name__ == '__main__':
         parser = argparse.ArgumentParser()
         parser.add_argument('--debug', action='store_true')
         parser.add_argument('--log-path', default='')
-        parser.add_argument('--test', choices=['subprocess', 'multiprocess', 'xml'])
+        parser.add_argument('--test', choices=['subprocess', 'multiprocess', 'xml', 'session', 'exec', 'async', 'hash', 'sync', 'empty', 'copy', 'delta', 'walk'])
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--walk-root', default='')  # tree for '--test=walk' (e.g. a network or OneDrive folder)
         return parser.parse_args()
     ARGS = parse_arguments()
 
+    def benchmark(label: str, task: Callable, iterations: int) -> float:
+        """Method that times repeated calls of a task"""
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            task()
+        elapsed = time.perf_counter() - start_time
+        LOG.info(f'{label}: {elapsed:.3f}s total, {elapsed / iterations * 1000:.2f}ms per call ({iterations} calls)')
+        return elapsed
+
     #  Configure the main logger
     LOG_HANDLERS = log.default_handlers(ARGS.debug, ARGS.log_path)
     log.set_handlers(LOG, LOG_HANDLERS)
@@ -826,6 +2740,202 @@ if __name__ == '__main__':
             log_subprocess(LOG, PROCESS, debug=ARGS.debug)
         delete_file(test_file)
 
+    # -------- ShellSession Benchmark --------
+    elif ARGS.test == 'session':
+        # Compare one shell process per call against warm shell sessions
+        test_command = ['git --version']
+        one_shot_time = benchmark('one process per call', lambda: run_subprocess(test_command), ARGS.iterations)
+        open_session_pool()
+        session_time = benchmark('shell session pool', lambda: run_subprocess(test_command), ARGS.iterations)
+        close_session_pool()
+        LOG.info(f'speedup: {one_shot_time / session_time:.1f}x')
+
+    # -------- Direct Exec Benchmark --------
+    elif ARGS.test == 'exec':
+        # Compare the bash/pwsh wrapper against launching argv directly
+        test_command = ['git', '--version']
+        reset_subprocess_stats()
+        shell_time = benchmark('shell wrapper', lambda: run_subprocess(test_command, shell=True), ARGS.iterations)
+        exec_time = benchmark('direct exec', lambda: run_subprocess(test_command, shell=False), ARGS.iterations)
+        LOG.info(f'speedup: {shell_time / exec_time:.1f}x')
+        for (MODE, STATS) in subprocess_stats().items():
+            LOG.info(f"{MODE}: {STATS['calls']} calls, {STATS['seconds'] / STATS['calls'] * 1000:.2f}ms average")
+
+    # -------- Async Gather Benchmark --------
+    elif ARGS.test == 'async':
+        # Compare sequential calls against gathering the same calls on one event loop
+        # - 'sleep' stands in for an I/O-bound CLI call (az, git fetch, dotnet restore) waiting on the network
+        test_commands = [['sleep', '0.05'] for _ in range(ARGS.iterations)]
+        sequential_time = benchmark('sequential run_subprocess', lambda: [run_subprocess(C) for C in test_commands], 1)
+        gather_time = benchmark('gather_subprocesses', lambda: gather_subprocesses(test_commands), 1)
+        LOG.info(f'speedup: {sequential_time / gather_time:.1f}x')
+
+    # -------- Hash Benchmark --------
+    elif ARGS.test == 'hash':
+        # Compare a 'sha256sum' subprocess per file against in-process hashing ('--iterations' files)
+        import tempfile
+        with tempfile.TemporaryDirectory() as TEMP_DIR:
+            test_files = [join_path(TEMP_DIR, f'file{I}.bin') for I in range(ARGS.iterations)]
+            for (I, TEST_FILE) in enumerate(test_files):
+                with open(TEST_FILE, 'wb') as FILE:
+                    FILE.write(os.urandom(4096 + I % 64 * 1024))
+            subprocess_time = benchmark('sha256sum subprocess',
+                                        lambda: [run_subprocess(['sha256sum', F]) for F in test_files], 1)
+            sha256_time = benchmark('hashlib sha256', lambda: [hash_file(F) for F in test_files], 1)
+            crc32_time = benchmark('zlib crc32', lambda: [hash_file(F, 'crc32') for F in test_files], 1)
+            LOG.info(f'speedup: sha256 {subprocess_time / sha256_time:.1f}x, crc32 {subprocess_time / crc32_time:.1f}x')
+
+    # -------- Sync Engine Benchmark --------
+    elif ARGS.test == 'sync':
+        # Compare dirsync against the native engine on a synthetic tree ('--iterations' files, 100 per directory)
+        # - first run copies everything, second run finds nothing changed (the common backup case)
+        import logging
+        import tempfile
+        QUIET_LOG = logging.getLogger(f'{BASENAME}.benchmark')
+        QUIET_LOG.propagate = False
+        QUIET_LOG.addHandler(logging.NullHandler())
+        with tempfile.TemporaryDirectory() as TEMP_DIR:
+            SOURCE_DIR = join_path(TEMP_DIR, 'source')
+            for I in range(ARGS.iterations):
+                TEST_FILE = join_path(SOURCE_DIR, f'dir{I // 100}', f'file{I}.txt')
+                create_directory(path_dir(TEST_FILE))
+                with open(TEST_FILE, 'wb') as FILE:
+                    FILE.write(os.urandom(1024))
+            ENGINE_TIMES: Dict[str, List[float]] = {}
+            for ENGINE in ['dirsync', 'native']:
+                TARGET_DIR = join_path(TEMP_DIR, ENGINE)
+                ENGINE_TIMES[ENGINE] = [
+                    benchmark(f'{ENGINE} ({RUN} run)',
+                              lambda: sync_directory(SOURCE_DIR, TARGET_DIR, options={'logger': QUIET_LOG}, engine=ENGINE), 1)
+                    for RUN in ['first', 'second']
+                ]
+            for (I, RUN) in enumerate(['first', 'second']):
+                LOG.info(f"speedup ({RUN} run): {ENGINE_TIMES['dirsync'][I] / ENGINE_TIMES['native'][I]:.1f}x")
+
+    elif ARGS.test == 'empty':
+        # Time remove_empty_directories against the old list lookups on trees of 1x, 2x and 4x
+        # '--iterations' x 20 empty leaves (10 deep); time per directory stays flat when scaling is linear
+        import tempfile
+
+        def list_lookup_remove(root: str) -> List[str]:
+            """Method that removes empty directories the old way (membership checks on a list)"""
+            removed_dirs: List[str] = []
+            for (current_dir, subdirs, files) in os.walk(root, topdown=False):
+                if not files and all(os.path.join(current_dir, subdir) in removed_dirs for subdir in subdirs):
+                    os.rmdir(current_dir)
+                    removed_dirs.append(current_dir)
+            return removed_dirs
+
+        for SCALE in [1, 2, 4]:
+            LEAF_COUNT = ARGS.iterations * 20 * SCALE
+            for (LABEL, REMOVE) in [('list lookups', list_lookup_remove), ('child counts', remove_empty_directories)]:
+                with tempfile.TemporaryDirectory() as TEMP_DIR:
+                    for I in range(LEAF_COUNT):
+                        os.makedirs(join_path(TEMP_DIR, 'root', *[f'd{I % (J + 2)}' for J in range(9)], f'leaf{I}'))
+                    with open(join_path(TEMP_DIR, 'root', 'keep.txt'), 'w', encoding='utf-8') as FILE:
+                        FILE.write('keeps the root')
+                    START_TIME = time.perf_counter()
+                    REMOVE(join_path(TEMP_DIR, 'root'))
+                    ELAPSED = time.perf_counter() - START_TIME
+                    LOG.info(f'{LABEL} ({LEAF_COUNT} leaves): {ELAPSED:.3f}s, {ELAPSED / LEAF_COUNT * 1e6:.1f}us per leaf')
+
+    elif ARGS.test == 'copy':
+        # Compare a shutil.copy2 loop against copy_files on '--iterations' x 20 small files plus one 256 MiB file
+        import tempfile
+        with tempfile.TemporaryDirectory() as TEMP_DIR:
+            SOURCE_FILES = [join_path(TEMP_DIR, 'source', f'dir{I // 100}', f'shot{I}.png') for I in range(ARGS.iterations * 20)]
+            for TEST_FILE in SOURCE_FILES:
+                create_directory(path_dir(TEST_FILE))
+                with open(TEST_FILE, 'wb') as FILE:
+                    FILE.write(os.urandom(64 * 1024))
+            SOURCE_FILES.append(join_path(TEMP_DIR, 'source', 'large.bin'))
+            with open(SOURCE_FILES[-1], 'wb') as FILE:
+                for _ in range(256):
+                    FILE.write(os.urandom(1024 * 1024))
+            COPY_TIMES: Dict[str, float] = {}
+            for LABEL in ['copy2', 'copy_files']:
+                PAIRS = [(TEST_FILE, TEST_FILE.replace(join_path(TEMP_DIR, 'source'), join_path(TEMP_DIR, LABEL)))
+                         for TEST_FILE in SOURCE_FILES]
+                for (_, DEST_FILE) in PAIRS:
+                    create_directory(path_dir(DEST_FILE))
+                START_TIME = time.perf_counter()
+                if LABEL == 'copy2':
+                    for (SRC_FILE, DEST_FILE) in PAIRS:
+                        shutil.copy2(SRC_FILE, DEST_FILE)
+                else:
+                    copy_files(PAIRS)
+                COPY_TIMES[LABEL] = time.perf_counter() - START_TIME
+                LOG.info(f'{LABEL}: {len(PAIRS)} files in {COPY_TIMES[LABEL]:.3f}s')
+            LOG.info(f"speedup: {COPY_TIMES['copy2'] / COPY_TIMES['copy_files']:.1f}x")
+
+    elif ARGS.test == 'delta':
+        # Compare full copies against delta transfers of '--iterations' 4 MiB save files with a few small edits
+        # (one in place, one inserted line), the way game saves and SavedVariables tables change
+        import tempfile
+        with tempfile.TemporaryDirectory() as TEMP_DIR:
+            PAIRS: List[Tuple[str, str]] = []
+            for I in range(ARGS.iterations):
+                TEST_DATA = bytearray(os.urandom(4 * 1024 * 1024))
+                PAIRS.append((join_path(TEMP_DIR, f'save{I}.new'), join_path(TEMP_DIR, f'save{I}.old')))
+                with open(PAIRS[-1][1], 'wb') as FILE:
+                    FILE.write(TEST_DATA)
+                TEST_DATA[1024 * 1024:1024 * 1024 + 16] = os.urandom(16)
+                TEST_DATA[3 * 1024 * 1024:3 * 1024 * 1024] = b'["new_setting"] = true,\n'
+                with open(PAIRS[-1][0], 'wb') as FILE:
+                    FILE.write(TEST_DATA)
+            TOTAL_BYTES = sum(os.path.getsize(SRC_FILE) for (SRC_FILE, _) in PAIRS)
+            for (_, DEST_FILE) in PAIRS:
+                shutil.copyfile(DEST_FILE, f'{DEST_FILE}.copy')
+            START_TIME = time.perf_counter()
+            for (SRC_FILE, DEST_FILE) in PAIRS:
+                _copy_file_data(SRC_FILE, f'{DEST_FILE}.copy')
+            LOG.info(f'full copy: {TOTAL_BYTES} bytes written in {time.perf_counter() - START_TIME:.3f}s')
+            START_TIME = time.perf_counter()
+            LITERAL_BYTES = sum(_delta_transfer(SRC_FILE, DEST_FILE)[0] for (SRC_FILE, DEST_FILE) in PAIRS)
+            LOG.info(f'delta transfer: {LITERAL_BYTES} new bytes ({LITERAL_BYTES / TOTAL_BYTES:.2%}) '
+                     f'in {time.perf_counter() - START_TIME:.3f}s')
+
+    # -------- Parallel Walk Benchmark --------
+    elif ARGS.test == 'walk':
+        # Walk and stat every file of '--walk-root' (else a generated tree of '--iterations' x 100 files) with
+        # os.walk + os.stat, then walk_parallel on 1 and 8 threads; threads pay off where stat latency dominates
+        import tempfile
+
+        def os_walk_stat(root: str) -> int:
+            """Method that walks and stats a tree the old way"""
+            count = 0
+            for (current_dir, subdirs, files) in os.walk(root):
+                for filename in files:
+                    os.stat(os.path.join(current_dir, filename))
+                    count += 1
+            return count
+
+        def parallel_walk_stat(root: str, max_workers: int) -> int:
+            """Method that walks and stats a tree with walk_parallel"""
+            count = 0
+            for (_, _, ENTRY) in walk_parallel(root, max_workers=max_workers, prefetch=True):
+                if not ENTRY.is_dir(follow_symlinks=False):
+                    ENTRY.stat()
+                    count += 1
+            return count
+
+        with tempfile.TemporaryDirectory() as TEMP_DIR:
+            WALK_ROOT = ARGS.walk_root
+            if not WALK_ROOT:
+                WALK_ROOT = TEMP_DIR
+                for I in range(ARGS.iterations * 100):
+                    FILE_DIR = join_path(TEMP_DIR, f'd{I % 10}', f'd{I % 7}', f'd{I % 13}')
+                    os.makedirs(FILE_DIR, exist_ok=True)
+                    with open(join_path(FILE_DIR, f'file{I}.txt'), 'w', encoding='utf-8') as FILE:
+                        FILE.write(str(I))
+            for (LABEL, WALK) in [('os.walk + os.stat', os_walk_stat),
+                                  ('walk_parallel, 1 thread', lambda root: parallel_walk_stat(root, 1)),
+                                  ('walk_parallel, 8 threads', lambda root: parallel_walk_stat(root, 8))]:
+                START_TIME = time.perf_counter()
+                FILE_COUNT = WALK(WALK_ROOT)
+                ELAPSED = time.perf_counter() - START_TIME
+                LOG.info(f'{LABEL}: {FILE_COUNT} files in {ELAPSED:.3f}s ({FILE_COUNT / ELAPSED:.0f} files/s)')
+
     # -------- SubProcess (simple) Test --------
     else:
         # test_command = ['ls', '-la', '/tmp']
@@ -839,3 +2949,12 @@ if __name__ == '__main__':
     # sudo python /root/.local/lib/python2.7/site-packages/shell_boilerplate.py
     # sudo python /root/.local/lib/python2.7/site-packages/shell_boilerplate.py --debug --test=subprocess
     # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --debug --test=subprocess
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --test=session --iterations=100
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --test=exec --iterations=100
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --test=empty --iterations=200
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --test=copy --iterations=100
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --test=delta --iterations=20
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --test=walk --walk-root="$Env:OneDrive"
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --test=async --iterations=100
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --test=hash --iterations=2000
+    # py $Env:AppData\Python\Python311\site-packages\boilerplates\shell_boilerplate.py --test=sync --iterations=10000
@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+"""Common test logic for Git interactions"""
+
+# --- Global Git Commands ---
+# Working Directory: work_dirty, work_status
+# Native refs:      read_refs, read_head, ref_heads, ref_remotes, ref_tags (against 'git for-each-ref')
+# Session:          open_session, close_session, get_session (invalidated by branch_create, work_commit)
+# State cache:      load_state, save_state, state_file_hash, is_synced, mark_synced
+# Multi-repository: sync_repository, sync_repositories
+
+import json
+import os
+import subprocess
+import time
+
+import pytest
+
+import git_boilerplate as bp_git
+
+# ------------------------ Test Helpers ------------------------
+
+MOCK_ENV = {'GIT_AUTHOR_NAME': 'mock', 'GIT_AUTHOR_EMAIL': 'mock@example.com', 'GIT_COMMITTER_NAME': 'mock',
+            'GIT_COMMITTER_EMAIL': 'mock@example.com', 'GIT_CONFIG_NOSYSTEM': '1'}
+
+
+@pytest.fixture(autouse=True)
+def mock_git_env(monkeypatch, tmp_path):
+    for (key, value) in MOCK_ENV.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setenv('HOME', str(tmp_path))  # no global config (init.defaultBranch, hooks, ...)
+
+
+def git(path, *args) -> str:
+    process = subprocess.run(['git', *args], cwd=path, capture_output=True, text=True, check=True)
+    return process.stdout.strip()
+
+
+def git_refs(path, prefix: str):
+    return git(path, 'for-each-ref', '--format=%(refname:short)', prefix).splitlines()
+
+
+def mock_repo(path, *files: str) -> str:
+    os.makedirs(path, exist_ok=True)
+    git(path, 'init', '--quiet', '--initial-branch=master')
+    for name in files or ('settings.json',):
+        with open(os.path.join(path, name), 'w', encoding='utf-8') as file:
+            file.write(name)
+        git(path, 'add', name)
+        git(path, 'commit', '--quiet', '-m', f'add {name}')
+    return str(path)
+
+
+def assert_native_refs(path):
+    """Native ref lists match what 'git for-each-ref' prints"""
+    assert bp_git.read_refs(path) is not None  # answered natively, not by the 'git' fallback
+    assert bp_git.ref_heads(path) == git_refs(path, 'refs/heads')
+    assert bp_git.ref_remotes(path) == git_refs(path, 'refs/remotes')
+    assert bp_git.ref_tags(path) == git_refs(path, 'refs/tags')
+
+
+# ------------------------ Working Directory Test Commands ------------------------
+
+
+@pytest.mark.parametrize('early_exit', [False, True])
+def test_work_dirty(tmp_path, monkeypatch, early_exit):
+    """Verify the output of 'work_dirty' function for each kind of change"""
+    monkeypatch.setattr(bp_git, '_DIRTY_EARLY_EXIT', early_exit)
+    mock_path = mock_repo(tmp_path / 'work', 'a.txt', 'b.txt')
+
+    def flags():
+        output = bp_git.work_dirty(mock_path, fast_status=False)
+        assert output.ok and output.clean == bp_git.work_status(mock_path)
+        assert output == bp_git.work_dirty(mock_path, fast_status=True)  # one 'git status' either way
+        return (output.clean, output.staged, output.modified, output.untracked)
+    assert flags() == (True, False, False, False)
+    (tmp_path / 'work' / 'new.txt').write_text('new')
+    assert flags() == (False, False, False, True)
+    (tmp_path / 'work' / 'a.txt').write_text('changed')
+    assert flags() == (False, False, True, True)
+    git(mock_path, 'add', 'a.txt')
+    if early_exit:
+        output = bp_git.work_dirty(mock_path, fast_status=False)
+        assert (output.method, output.staged, output.clean) == ('diff', True, False)
+    assert bp_git.work_dirty(mock_path, fast_status=True).staged
+    (tmp_path / 'work' / 'a.txt').write_text('changed again')
+    output = bp_git.work_dirty(mock_path, fast_status=True)
+    assert (output.method, output.staged, output.modified, output.untracked) == ('status', True, True, True)
+
+
+def test_work_dirty_unborn(tmp_path):
+    """Verify the output of 'work_dirty' function for a repository without commits"""
+    mock_path = str(tmp_path / 'empty')
+    git(tmp_path, 'init', '--quiet', mock_path)
+    output = bp_git.work_dirty(mock_path, fast_status=False)
+    assert (output.ok, output.clean, output.method) == (True, True, 'status')
+    (tmp_path / 'empty' / 'new.txt').write_text('new')
+    output = bp_git.work_dirty(mock_path, fast_status=False)
+    assert (output.clean, output.untracked) == (False, True)
+
+
+# ------------------------ Native Refs Test Commands ------------------------
+
+
+def test_read_refs(tmp_path):
+    """Verify the output of 'read_refs' function with packed and loose refs"""
+    mock_remote = str(tmp_path / 'remote.git')
+    git(tmp_path, 'init', '--quiet', '--bare', '--initial-branch=master', mock_remote)
+    mock_path = mock_repo(tmp_path / 'work', 'a.txt')
+    git(mock_path, 'remote', 'add', 'origin', mock_remote)
+    git(mock_path, 'push', '--quiet', 'origin', 'master')
+    git(mock_path, 'fetch', '--quiet', 'origin')
+    git(mock_path, 'remote', 'set-head', 'origin', 'master')  # symbolic refs/remotes/origin/HEAD
+    git(mock_path, 'branch', 'feature/x')
+    git(mock_path, 'branch', 'dev')
+    git(mock_path, 'tag', '-a', '-m', 'annotated', 'v1')
+    git(mock_path, 'tag', 'dev')  # same short name as a branch: both are ambiguous
+    git(mock_path, 'pack-refs', '--all')
+    assert not os.path.exists(os.path.join(mock_path, '.git', 'refs', 'heads', 'dev'))
+    assert_native_refs(mock_path)
+    assert {'heads/dev', 'tags/dev'} <= {*bp_git.ref_heads(mock_path), *bp_git.ref_tags(mock_path)}
+
+    # A loose ref wins over the packed one of the same name; new refs are loose
+    mock_repo(mock_path, 'b.txt')
+    git(mock_path, 'branch', 'loose')
+    git(mock_path, 'tag', 'v2')
+    assert os.path.isfile(os.path.join(mock_path, '.git', 'refs', 'heads', 'master'))
+    assert_native_refs(mock_path)
+    master = bp_git.read_refs(mock_path)['refs/heads/master']
+    assert master == (git(mock_path, 'rev-parse', 'refs/heads/master'), 'master')
+
+
+def test_read_head(tmp_path):
+    """Verify the output of 'read_head' function for branches, detached HEAD and unborn branches"""
+    mock_path = mock_repo(tmp_path / 'work', 'a.txt', 'b.txt')
+    assert bp_git.read_head(mock_path) == (git(mock_path, 'rev-parse', '--abbrev-ref', 'HEAD'),
+                                           git(mock_path, 'rev-parse', 'HEAD'))
+    git(mock_path, 'tag', 'master')  # an ambiguous branch name stays unambiguous for HEAD's full ref
+    assert bp_git.read_head(mock_path)[0] == git(mock_path, 'rev-parse', '--abbrev-ref', 'HEAD') == 'heads/master'
+    git(mock_path, 'checkout', '--quiet', '--detach', 'HEAD~1')
+    assert bp_git.read_head(mock_path) == ('HEAD', git(mock_path, 'rev-parse', 'HEAD'))
+    assert git(mock_path, 'rev-parse', '--abbrev-ref', 'HEAD') == 'HEAD'
+    git(mock_path, 'checkout', '--quiet', '--orphan', 'unborn')
+    assert bp_git.read_head(mock_path) == ('', '')
+    assert bp_git.ref_head(mock_path) == ''
+
+    mock_empty = str(tmp_path / 'empty')
+    git(tmp_path, 'init', '--quiet', mock_empty)
+    assert bp_git.read_head(mock_empty) == ('', '')
+    assert bp_git.read_refs(mock_empty) == {}
+
+
+def test_read_refs_bare(tmp_path):
+    """Verify the output of 'read_refs' function for a bare repository"""
+    mock_path = mock_repo(tmp_path / 'work', 'a.txt')
+    git(mock_path, 'branch', 'dev')
+    git(mock_path, 'tag', 'v1')
+    mock_bare = str(tmp_path / 'bare.git')
+    git(tmp_path, 'clone', '--quiet', '--bare', mock_path, mock_bare)
+    assert bp_git.git_dir(mock_bare) == mock_bare
+    assert_native_refs(mock_bare)
+    assert bp_git.read_head(mock_bare) == (git(mock_bare, 'rev-parse', '--abbrev-ref', 'HEAD'),
+                                           git(mock_bare, 'rev-parse', 'HEAD'))
+    assert bp_git.repo_exists(mock_bare, bare=True)
+
+
+# ------------------------ Session Test Commands ------------------------
+
+
+def test_session(tmp_path):
+    """Verify that an open session answers from its snapshot until a command changes the repository"""
+    mock_path = mock_repo(tmp_path / 'work', 'a.txt')
+    session = bp_git.open_session(mock_path)
+    try:
+        assert bp_git.get_session(mock_path) is session and bp_git.open_session(mock_path) is session
+        assert bp_git.ref_heads(mock_path) == ['master']
+        assert bp_git.work_status(mock_path)
+        # Changes made behind the session's back are not seen...
+        git(mock_path, 'branch', 'outside')
+        (tmp_path / 'work' / 'b.txt').write_text('b')
+        assert bp_git.ref_heads(mock_path) == ['master']
+        assert bp_git.work_status(mock_path)
+        # ...until a command of this module changes the repository
+        assert bp_git.branch_create(mock_path, 'dev') == (True, True)
+        assert bp_git.ref_heads(mock_path) == ['dev', 'master', 'outside']
+        assert not bp_git.work_status(mock_path)
+        assert session.status().entries
+        assert bp_git.work_commit(mock_path, 'add b.txt') == (True, True)
+        assert bp_git.work_status(mock_path)
+        assert session.status().oid == git(mock_path, 'rev-parse', 'HEAD')
+        assert bp_git.ref_head(mock_path) == 'master'
+    finally:
+        bp_git.close_session(mock_path)
+    assert bp_git.get_session(mock_path) is None
+
+
+# ------------------------ State Cache Test Commands ------------------------
+
+
+def age_file(path, seconds: float = 60.0):
+    """Moves the mtime of a file out of the racy window (see bp_git._RACY_SECONDS)"""
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_state_synced(tmp_path):
+    """Verify the output of 'is_synced' and 'mark_synced' functions after commits and remote pushes"""
+    (mock_path, mock_other) = mock_clones(tmp_path)
+    mock_remote = str(tmp_path / 'remote.git')
+    state = bp_git.load_state(mock_path)
+    assert state.branch == 'master' and state.head == git(mock_path, 'rev-parse', 'HEAD')
+    assert not bp_git.is_synced(mock_path, state, mock_remote)
+    assert bp_git.mark_synced(mock_path, state, mock_remote)
+    assert bp_git.is_synced(mock_path, bp_git.load_state(mock_path), mock_remote)
+    assert not bp_git.is_synced(mock_path, bp_git.load_state(mock_path), mock_remote, version='dev')
+    assert not bp_git.is_synced(mock_path, bp_git.load_state(mock_path), mock_remote, remote_alias='backup')
+
+    # A commit in the work repo changes its fingerprint
+    (tmp_path / 'work' / 'local.txt').write_text('local')
+    git(mock_path, 'add', 'local.txt')
+    git(mock_path, 'commit', '--quiet', '-m', 'local')
+    state = bp_git.load_state(mock_path)
+    assert state.head == git(mock_path, 'rev-parse', 'HEAD')
+    assert not bp_git.is_synced(mock_path, state, mock_remote)
+    git(mock_path, 'push', '--quiet', 'origin', 'master')
+    assert bp_git.mark_synced(mock_path, state, mock_remote)
+    assert bp_git.is_synced(mock_path, bp_git.load_state(mock_path), mock_remote)
+
+    # A push from another clone changes the remote's refs only
+    git(mock_other, 'pull', '--quiet', 'origin', 'master')
+    git(mock_other, 'tag', 'v1')
+    git(mock_other, 'push', '--quiet', 'origin', 'v1')
+    assert not bp_git.is_synced(mock_path, bp_git.load_state(mock_path), mock_remote)
+
+
+def test_state_version(tmp_path):
+    """Verify the output of 'load_state' function for a state file from another version, or a broken one"""
+    (mock_path, _) = mock_clones(tmp_path)
+    mock_remote = str(tmp_path / 'remote.git')
+    assert bp_git.mark_synced(mock_path, bp_git.load_state(mock_path), mock_remote)
+    state_path = os.path.join(mock_path, '.git', bp_git.STATE_FILE)
+    with open(state_path, encoding='utf-8') as file:
+        saved = json.load(file)
+    assert saved['version'] == bp_git._STATE_VERSION and saved['synced']['origin']
+    saved['version'] = bp_git._STATE_VERSION - 1
+    with open(state_path, 'w', encoding='utf-8') as file:
+        json.dump(saved, file)
+    state = bp_git.load_state(mock_path)
+    assert state.version == bp_git._STATE_VERSION and state.synced == {}
+    assert not bp_git.is_synced(mock_path, state, mock_remote)
+    with open(state_path, 'w', encoding='utf-8') as file:
+        file.write('{broken')
+    state = bp_git.load_state(mock_path)
+    assert state.synced == {} and state.head == git(mock_path, 'rev-parse', 'HEAD')
+
+
+def test_state_config(tmp_path, monkeypatch):
+    """Verify the output of 'load_state' function when '.git/config' changes, or is too recent to cache"""
+    (mock_path, _) = mock_clones(tmp_path)
+    config_path = os.path.join(mock_path, '.git', 'config')
+    run_subprocess = bp_git.sh.run_subprocess
+    commands = []
+
+    def record_run_subprocess(command, *args, **kwargs):
+        commands.append(command[:2])
+        return run_subprocess(command, *args, **kwargs)
+    monkeypatch.setattr(bp_git.sh, 'run_subprocess', record_run_subprocess)
+
+    # Inside the racy window the config is read on every load
+    assert bp_git.load_state(mock_path).remotes == {'origin': str(tmp_path / 'remote.git')}
+    assert bp_git.load_state(mock_path).config_stat == []
+    assert commands.count(['git', 'config']) == 2
+    # Once older, its stat answers
+    age_file(config_path)
+    assert bp_git.load_state(mock_path).config_stat
+    commands.clear()
+    assert bp_git.load_state(mock_path).remotes == {'origin': str(tmp_path / 'remote.git')}
+    assert commands == []
+    # A change to it (here with an mtime that is still old) reloads the remotes
+    git(mock_path, 'remote', 'add', 'backup', str(tmp_path / 'backup.git'))
+    age_file(config_path, 30.0)
+    state = bp_git.load_state(mock_path)
+    assert commands == [['git', 'config']]
+    assert state.remotes == {'origin': str(tmp_path / 'remote.git'), 'backup': str(tmp_path / 'backup.git')}
+
+
+def test_state_file_hash(tmp_path):
+    """Verify the output of 'state_file_hash' function inside and outside the racy window"""
+    mock_path = mock_repo(tmp_path / 'work', 'a.txt')
+    file_path = str(tmp_path / 'work' / 'a.txt')
+    state = bp_git.load_state(mock_path)
+    digest = bp_git.state_file_hash(state, file_path)
+    assert digest == bp_git.sh.hash_file(file_path)
+    assert file_path not in state.hashes  # too recent: its mtime could be reused by the next write
+    age_file(file_path)
+    assert bp_git.state_file_hash(state, file_path) == digest
+    assert state.hashes[file_path][2] == digest
+    assert bp_git.save_state(mock_path, state)
+    assert bp_git.load_state(mock_path).hashes[file_path][2] == digest
+
+    # Same size, new mtime: hashed again
+    (tmp_path / 'work' / 'a.txt').write_text('b.txt')
+    age_file(file_path, 30.0)
+    assert bp_git.state_file_hash(state, file_path) == bp_git.sh.hash_file(file_path) != digest
+    # A write inside the window drops the cached digest
+    (tmp_path / 'work' / 'a.txt').write_text('c.txt')
+    assert bp_git.state_file_hash(state, file_path) == bp_git.sh.hash_file(file_path)
+    assert file_path not in state.hashes
+
+
+# ------------------------ Multi-repository Test Commands ------------------------
+
+
+def mock_clones(tmp_path):
+    """Returns (work clone, other clone) of one bare remote, both on 'master' with one commit"""
+    mock_origin = mock_repo(tmp_path / 'origin', 'f.txt')
+    git(tmp_path, 'clone', '--quiet', '--bare', mock_origin, str(tmp_path / 'remote.git'))
+    for name in ('work', 'other'):
+        git(tmp_path, 'clone', '--quiet', str(tmp_path / 'remote.git'), str(tmp_path / name))
+    return (str(tmp_path / 'work'), str(tmp_path / 'other'))
+
+
+def test_sync_repository(tmp_path):
+    """Verify the output of 'sync_repository' function"""
+    (mock_path, mock_other) = mock_clones(tmp_path)
+    (tmp_path / 'other' / 'upstream.txt').write_text('upstream')
+    git(mock_other, 'add', 'upstream.txt')
+    git(mock_other, 'commit', '--quiet', '-m', 'upstream')
+    git(mock_other, 'push', '--quiet', 'origin', 'master')
+    (tmp_path / 'work' / 'local.txt').write_text('local')
+    git(mock_path, 'add', 'local.txt')
+    git(mock_path, 'commit', '--quiet', '-m', 'local')
+    # An untracked file does not hold the merge back
+    (tmp_path / 'work' / 'untracked.txt').write_text('untracked')
+    output = bp_git.sync_repository(mock_path, retries=0)
+    assert (output.status, output.branch, output.fetched, output.merged, output.pushed) == \
+        ('ok', 'master', True, True, True)
+    assert (tmp_path / 'work' / 'upstream.txt').exists()
+    assert git(mock_path, 'rev-parse', 'HEAD') == git(str(tmp_path / 'remote.git'), 'rev-parse', 'master')
+    # Used as a library (no mygit arguments), every step still runs
+    (output,) = bp_git.sync_repositories([mock_path], retries=0)
+    assert (output.status, output.merged, output.pushed) == ('ok', False, False)
+
+
+def test_sync_repository_dirty(tmp_path):
+    """Verify the output of 'sync_repository' function with uncommitted changes"""
+    (mock_path, _) = mock_clones(tmp_path)
+    (tmp_path / 'work' / 'f.txt').write_text('modified')
+    output = bp_git.sync_repository(mock_path, retries=0)
+    assert (output.status, output.detail) == ('skipped', 'dirty work-tree; fetched only')
+    git(mock_path, 'add', 'f.txt')
+    assert bp_git.sync_repository(mock_path, retries=0).status == 'skipped'
+    assert bp_git.sync_repository(str(tmp_path / 'origin'), retries=0).detail == "no 'origin' remote"
+
+
+def test_sync_repository_merge_abort(tmp_path):
+    """Verify the output of 'sync_repository' function when the merge stops on a conflict"""
+    (mock_path, mock_other) = mock_clones(tmp_path)
+    git(mock_other, 'rm', '--quiet', 'f.txt')
+    git(mock_other, 'commit', '--quiet', '-m', 'delete')
+    git(mock_other, 'push', '--quiet', 'origin', 'master')
+    (tmp_path / 'work' / 'f.txt').write_text('edited')  # modify/delete conflict, not resolved by '-X ours'
+    git(mock_path, 'commit', '--quiet', '-am', 'edit')
+    output = bp_git.sync_repository(mock_path, retries=0)
+    assert (output.status, output.detail) == ('failed', "merge of 'origin/master' failed; aborted")
+    assert not os.path.exists(os.path.join(mock_path, '.git', 'MERGE_HEAD'))
+    assert bp_git.work_dirty(mock_path).clean
+
+
+def test_sync_repository_retry(tmp_path, monkeypatch):
+    """Verify the output of 'sync_repository' function when a push fails with a network error"""
+    (mock_path, _) = mock_clones(tmp_path)
+    (tmp_path / 'work' / 'local.txt').write_text('local')
+    git(mock_path, 'add', 'local.txt')
+    git(mock_path, 'commit', '--quiet', '-m', 'local')
+    run_subprocess = bp_git.sh.run_subprocess
+    attempts = []
+
+    def flaky_run_subprocess(command, *args, **kwargs):
+        if command[:2] == ['git', 'push']:
+            attempts.append(command)
+            if len(attempts) == 1:
+                return subprocess.CompletedProcess(command, 128, '', 'fatal: Could not resolve host: example.com')
+        return run_subprocess(command, *args, **kwargs)
+    monkeypatch.setattr(bp_git.sh, 'run_subprocess', flaky_run_subprocess)
+    monkeypatch.setattr(bp_git.time, 'sleep', lambda seconds: None)
+    output = bp_git.sync_repository(mock_path, retries=1, backoff=0.0)
+    assert (output.status, output.pushed, len(attempts)) == ('ok', True, 2)
+    # Without retries the same error fails the repository
+    attempts.clear()
+    (tmp_path / 'work' / 'local.txt').write_text('local 2')
+    git(mock_path, 'commit', '--quiet', '-am', 'local 2')
+    output = bp_git.sync_repository(mock_path, retries=0)
+    assert (output.status, output.detail, len(attempts)) == ('failed', 'push failed', 1)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Common test logic for the pc_clean command"""
+
+# --- Backup Commands ---
+# backup_task
+
+import argparse
+import os
+import sys
+
+sys.path[:0] = [os.path.join(os.path.dirname(__file__), '..', '..'),
+                os.path.join(os.path.dirname(__file__), '..', '..', '..', 'commands')]
+
+import backup_boilerplate as backup  # noqa: E402
+import pc_clean  # noqa: E402
+
+# ------------------------ Backup Test Commands ------------------------
+
+
+def mock_game(tmp_path):
+    mock_source = tmp_path / 'source'
+    (mock_source / 'Screenshots').mkdir(parents=True)
+    (mock_source / 'settings.json').write_text('v1')
+    (mock_source / 'Screenshots' / 'shot1.png').write_text('shot1')
+    return mock_source
+
+
+def test_backup_task(tmp_path):
+    """Verify the output of 'backup_task' function"""
+    mock_source = mock_game(tmp_path)
+    pc_clean.ARGS = argparse.Namespace(test_run=False, archive='', copy_workers=1)
+    task = pc_clean.backup_task(str(mock_source), str(tmp_path / 'backup'), None, 'Screenshots')
+    assert task()
+    assert (tmp_path / 'backup' / 'Screenshots' / 'shot1.png').read_text() == 'shot1'
+    assert not (mock_source / 'Screenshots').exists()
+
+
+def test_backup_task_test_run(tmp_path):
+    """Verify the output of 'backup_task' function with '--test-run' in every mode"""
+    mock_source = mock_game(tmp_path)
+    store = backup.ContentStore(str(tmp_path / 'store'))
+    (tmp_path / 'backup').mkdir()  # the mirrored mode diffs against an existing backup
+    for (archive, mode_store) in (('', None), ('zip', None), ('', store)):
+        pc_clean.ARGS = argparse.Namespace(test_run=True, archive=archive, copy_workers=1)
+        task = pc_clean.backup_task(str(mock_source), str(tmp_path / 'backup'), None, 'Screenshots',
+                                    store=mode_store, tree_name='Games/mock')
+        assert task()
+        assert (mock_source / 'Screenshots' / 'shot1.png').exists()
+
+
+def test_backup_task_failed(tmp_path, monkeypatch):
+    """Verify the output of 'backup_task' function when the backup fails"""
+    mock_source = mock_game(tmp_path)
+    pc_clean.ARGS = argparse.Namespace(test_run=False, archive='', copy_workers=1)
+    monkeypatch.setattr(pc_clean.sh, 'sync_directory', lambda *args, **kwargs: False)
+    task = pc_clean.backup_task(str(mock_source), str(tmp_path / 'backup'), None, 'Screenshots')
+    assert not task()
+    assert (mock_source / 'Screenshots' / 'shot1.png').exists()
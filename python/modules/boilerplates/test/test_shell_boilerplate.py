@@ -7,11 +7,24 @@
 # Utility:          shift_directory, change_directory, list_differences, print_command
 # Process:          exit_process, fail_process, process_id, process_parent_id
 # Path:             current_path, expand_path, join_path, path_exists, path_dir, path_basename, path_filename
-# Directory:        list_directory, create_directory, delete_directory, copy_directory, sync_directory
-# File:             read_file, write_file, delete_file, rename_file, copy_file, hash_file, file_match, backup_file
+# Directory:        list_directory, create_directory, delete_directory, copy_directory, sync_directory, sync_manifest_path,
+#                   remove_empty_directories, walk_parallel, rsync_directory (native)
+# File:             read_file, write_file, read_bytes, write_bytes, delete_file, rename_file, copy_file, copy_files, hash_file, match_file, backup_file
 # Signal:           max_signal, handle_signal, send_signal
-# SubProcess:       run_subprocess, log_subprocess
+# SubProcess:       run_subprocess, run_subprocesses, run_subprocess_async, gather_subprocesses, log_subprocess
+# HashCache:        open_hash_cache
+# SyncMatcher:      selected, descend (against dirsync)
+# SyncMetrics:      to_dict (through sync_directory)
+# ShellSessionPool: run, close
 
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import dirsync
 import shell_boilerplate as sh
 
 # ------------------------ Global Test Commands ------------------------
@@ -91,6 +104,249 @@ def test_path_filename():
     assert output == "provision_python"
 
 
+# --- Directory Commands ---
+
+def test_sync_directory(tmp_path):
+    """Verify the output of 'sync_directory' function"""
+    mock_source = tmp_path / 'source'
+    mock_target = tmp_path / 'target'
+    for mock_file in ('settings.json', 'cache/data.bin', 'Screenshots/shot.png', 'notes.bak'):
+        (mock_source / mock_file).parent.mkdir(parents=True, exist_ok=True)
+        (mock_source / mock_file).write_text(mock_file)
+    mock_options = {'only': ['settings.json', 'Screenshots/*', r'.*\.bak$'], 'purge': True}
+    (mock_target / 'stale').mkdir(parents=True)
+    assert sh.sync_directory(str(mock_source), str(mock_target), options=mock_options)
+    output = sorted(path.relative_to(mock_target).as_posix() for path in mock_target.rglob('*'))
+    assert output == ['Screenshots', 'Screenshots/shot.png', 'settings.json']
+    (mock_source / 'settings.json').write_text('changed')
+    assert sh.sync_directory(str(mock_source), str(mock_target), options=mock_options)
+    assert (mock_target / 'settings.json').read_text() == 'changed'
+
+
+def test_sync_directory_manifest(tmp_path):
+    """Verify the output of 'sync_directory' function with a manifest"""
+    mock_source = tmp_path / 'source'
+    mock_target = tmp_path / 'target'
+    mock_source.mkdir()
+    (mock_source / 'settings.json').write_text('v1')
+    mock_manifest = sh.sync_manifest_path(str(mock_target))
+    mock_options = {'manifest': mock_manifest}
+    assert sh.sync_directory(str(mock_source), str(mock_target), options=mock_options)
+    assert mock_manifest == str(tmp_path / 'target.manifest.json')
+    assert 'settings.json' in sh.from_json((tmp_path / 'target.manifest.json').read_text())['entries']
+    (mock_source / 'settings.json').write_text('v2-longer')
+    assert sh.sync_directory(str(mock_source), str(mock_target), options=mock_options)
+    assert (mock_target / 'settings.json').read_text() == 'v2-longer'
+    # The manifest lists the target, but entries changed or removed behind its back are still synced
+    (mock_target / 'settings.json').unlink()
+    assert sh.sync_directory(str(mock_source), str(mock_target), options=mock_options)
+    assert (mock_target / 'settings.json').read_text() == 'v2-longer'
+    (mock_target / 'settings.json').write_text('edited in the target')
+    os.utime(mock_target / 'settings.json', ns=(1_000_000_000, 1_000_000_000))
+    assert sh.sync_directory(str(mock_source), str(mock_target), options=mock_options)
+    assert (mock_target / 'settings.json').read_text() == 'v2-longer'
+    # Directories remove_empty_directories removed are dropped from the manifest
+    (mock_target / 'empty').mkdir()
+    (mock_source / 'empty').mkdir()
+    assert sh.sync_directory(str(mock_source), str(mock_target), options=mock_options)
+    sh.remove_empty_directories(str(mock_target), manifest=mock_manifest)
+    assert 'empty' not in sh.from_json((tmp_path / 'target.manifest.json').read_text())['entries']
+
+
+def test_sync_directory_manifest_purge(tmp_path):
+    """Verify the output of 'sync_directory' function with a manifest and 'purge'"""
+    mock_source = tmp_path / 'source'
+    mock_target = tmp_path / 'target'
+    mock_source.mkdir()
+    (mock_source / 'settings.json').write_text('v1')
+    mock_options = {'purge': True, 'manifest': sh.sync_manifest_path(str(mock_target))}
+    assert sh.sync_directory(str(mock_source), str(mock_target), options=mock_options)
+    # Files added to the target outside the manifest are still purged
+    (mock_target / 'stray.txt').write_text('stray')
+    assert sh.sync_directory(str(mock_source), str(mock_target), options=mock_options)
+    assert sorted(path.name for path in mock_target.iterdir()) == ['settings.json']
+
+
+def test_sync_directory_metrics(tmp_path):
+    """Verify the output of 'sync_directory' function with metrics"""
+    mock_source = tmp_path / 'source'
+    mock_target = tmp_path / 'target'
+    (mock_source / 'sub').mkdir(parents=True)
+    for mock_file in ('a.txt', 'b.txt', 'sub/c.txt'):
+        (mock_source / mock_file).write_text(mock_file * 10)
+    metrics = sh.SyncMetrics(slowest_count=2)
+    assert sh.sync_directory(str(mock_source), str(mock_target), options={'metrics': metrics})
+    output = metrics.to_dict()
+    assert (output.files_scanned, output.dirs_scanned, output.files_copied) == (3, 2, 3)
+    assert output.bytes_written == 50 + 50 + 90
+    assert len(output.slowest) == 2 and set(output.seconds) == {'walk', 'compare', 'copy', 'cleanup'}
+    (mock_source / 'a.txt').write_text('A.TXT' * 10)  # same size, new mtime: compared by content
+    os.utime(mock_source / 'a.txt', ns=(1_000_000_000, 1_000_000_000))
+    metrics = sh.SyncMetrics()
+    assert sh.sync_directory(str(mock_source), str(mock_target), options={'metrics': metrics})
+    assert (metrics.counts['compared_stat'], metrics.counts['compared_content'], metrics.counts['files_copied']) == (2, 1, 1)
+
+
+def test_rsync_directory_native(tmp_path):
+    """Verify the output of 'rsync_directory' function with the native engine"""
+    mock_source = tmp_path / 'source'
+    mock_dest = tmp_path / 'dest'
+    for mock_file in ('settings.json', 'SavedVariables/addon.lua', 'logs/run.log', 'empty/.keep.log'):
+        (mock_source / mock_file).parent.mkdir(parents=True, exist_ok=True)
+        (mock_source / mock_file).write_text(mock_file)
+    (mock_dest / 'stale').mkdir(parents=True)
+    (mock_dest / 'stale' / 'old.txt').write_text('old')
+    (mock_dest / 'kept.log').write_text('excluded files are never deleted')
+    mock_save = bytearray(os.urandom(256 * 1024))
+    (mock_source / 'SavedVariables' / 'save.dat').write_bytes(mock_save)
+    output = sh.rsync_directory(f'{mock_source}{os.sep}', str(mock_dest), exclude=('*.log',), engine='native')
+    assert sorted(output[0]) == sorted(os.path.join(str(mock_dest), name) for name in
+                                       ('settings.json', 'SavedVariables/addon.lua', 'SavedVariables/save.dat'))
+    assert sorted(path.relative_to(mock_dest).as_posix() for path in mock_dest.rglob('*')) == [
+        'SavedVariables', 'SavedVariables/addon.lua', 'SavedVariables/save.dat', 'kept.log', 'settings.json']
+    assert sh.rsync_directory(f'{mock_source}{os.sep}', str(mock_dest), exclude=('*.log',), engine='native') == ([], [])
+    mock_save[1000:1005] = b'HELLO'  # a small in-place change is delta-transferred
+    (mock_source / 'SavedVariables' / 'save.dat').write_bytes(mock_save)
+    os.utime(mock_source / 'SavedVariables' / 'save.dat', (0, 0))  # same size, so only a new mtime marks it changed
+    output = sh.rsync_directory(f'{mock_source}{os.sep}', str(mock_dest), exclude=('*.log',), engine='native')
+    assert output == ([os.path.join(str(mock_dest), 'SavedVariables/save.dat')], [])
+    assert (mock_dest / 'SavedVariables' / 'save.dat').read_bytes() == bytes(mock_save)
+
+
+def test_rsync_directory_native_symlink(tmp_path):
+    """Verify the output of 'rsync_directory' function with the native engine for symlinks"""
+    mock_source = tmp_path / 'source'
+    mock_dest = tmp_path / 'dest'
+    mock_source.mkdir()
+    (mock_source / 'settings.json').write_text('settings')
+    (mock_source / 'current.json').symlink_to('settings.json')
+    output = sh.rsync_directory(f'{mock_source}{os.sep}', str(mock_dest), engine='native')
+    assert os.path.join(str(mock_dest), 'current.json') in output[0]
+    assert os.readlink(mock_dest / 'current.json') == 'settings.json'
+    assert sh.rsync_directory(f'{mock_source}{os.sep}', str(mock_dest), engine='native') == ([], [])
+    # 'cut' removes every synchronized non-directory from the source, symlinks included
+    sh.rsync_directory(f'{mock_source}{os.sep}', str(mock_dest), cut=True, engine='native')
+    assert list(mock_source.iterdir()) == []
+
+
+def test_walk_parallel(tmp_path):
+    """Verify the output of 'walk_parallel' function"""
+    for i in range(20):
+        (tmp_path / f'd{i % 4}' / f'sub{i % 3}').mkdir(parents=True, exist_ok=True)
+        (tmp_path / f'd{i % 4}' / f'sub{i % 3}' / f'file{i}.txt').write_text(str(i))
+    expected = sorted(path.relative_to(tmp_path).as_posix() for path in tmp_path.rglob('*'))
+    for max_workers in (1, 4):
+        output = [re_path for (rel_path, re_path, entry) in sh.walk_parallel(str(tmp_path), max_workers=max_workers)]
+        assert sorted(output) == expected
+        assert all(output.index(re_path.rsplit('/', 1)[0]) < output.index(re_path) for re_path in output if '/' in re_path)
+    output = sorted(re_path for (rel_path, re_path, entry) in
+                    sh.walk_parallel(str(tmp_path), descend=lambda re_path: re_path != 'd1', recurse=lambda re_path: '/' not in re_path,
+                                     prefetch=True))
+    assert output == ['d0', 'd0/sub0', 'd0/sub1', 'd0/sub2', 'd2', 'd2/sub0', 'd2/sub1', 'd2/sub2', 'd3', 'd3/sub0', 'd3/sub1', 'd3/sub2']
+    errors = []
+    assert list(sh.walk_parallel(str(tmp_path / 'missing'), onerror=errors.append)) == []
+    assert isinstance(errors[0], FileNotFoundError)
+
+
+def test_remove_empty_directories(tmp_path):
+    """Verify the output of 'remove_empty_directories' function"""
+    for mock_dir in ('empty/deeper/deepest', 'kept/empty', 'kept/full'):
+        (tmp_path / mock_dir).mkdir(parents=True)
+    (tmp_path / 'kept' / 'full' / 'file.txt').write_text('keep')
+    output = sh.remove_empty_directories(str(tmp_path), dry_run=True)
+    assert sorted(output.removed) == sorted(str(tmp_path / path) for path in ('empty', 'empty/deeper', 'empty/deeper/deepest', 'kept/empty'))
+    assert output.removed.index(str(tmp_path / 'empty/deeper/deepest')) < output.removed.index(str(tmp_path / 'empty'))
+    assert (tmp_path / 'empty').is_dir()
+    output = sh.remove_empty_directories(str(tmp_path))
+    assert len(output.removed) == 4 and output.failed == [] and output.scanned == 7
+    assert sorted(path.relative_to(tmp_path).as_posix() for path in tmp_path.rglob('*')) == ['kept', 'kept/full', 'kept/full/file.txt']
+
+
+# --- File Commands ---
+
+def test_write_bytes(tmp_path):
+    """Verify the output of 'write_bytes' and 'read_bytes' functions"""
+    mock_path = str(tmp_path / 'new' / 'data.bin')
+    assert sh.write_bytes(mock_path, b'\x00\xffdata')
+    assert sh.read_bytes(mock_path) == b'\x00\xffdata'
+    assert sh.write_bytes(mock_path, b'more', append=True)
+    os.chmod(mock_path, 0o600)
+    assert sh.write_bytes(mock_path, b'replaced', atomic=True)
+    assert os.listdir(tmp_path / 'new') == ['data.bin']  # no temporary file left behind
+    assert (os.stat(mock_path).st_mode & 0o777) == 0o600
+    with sh.read_bytes(mock_path, use_mmap=True) as output:
+        assert output[:] == b'replaced' and output.find(b'place') == 2
+    assert sh.read_bytes(str(tmp_path / 'missing.bin')) == b''
+
+
+def test_read_file(tmp_path):
+    """Verify the output of 'read_file' and 'write_file' functions"""
+    mock_path = str(tmp_path / 'sub' / 'mock.txt')
+    sh.write_file(mock_path, ['caf\xe9 ', 'line one\n', 'line two\n'])
+    assert sh.read_file(mock_path) == 'caf\xe9 line one\nline two'
+    assert sh.read_file(mock_path, oneline=True) == 'caf\xe9 line one'
+    (tmp_path / 'crlf.txt').write_bytes(b'1234\r\nnext\r\n')
+    assert sh.read_file(str(tmp_path / 'crlf.txt')) == '1234\nnext'
+    assert sh.read_file(str(tmp_path / 'crlf.txt'), oneline=True) == '1234'
+    assert sh.read_file(str(tmp_path / 'missing.txt')) == ''
+
+
+def test_copy_files(tmp_path):
+    """Verify the output of 'copy_files' function"""
+    mock_pairs = []
+    for i in range(5):
+        mock_source = tmp_path / 'source' / f'file{i}.txt'
+        mock_source.parent.mkdir(exist_ok=True)
+        mock_source.write_text(f'content {i}')
+        os.utime(mock_source, ns=(1_000_000_123, 1_000_000_123))
+        mock_pairs.append((str(mock_source), str(tmp_path / 'target' / f'file{i}.txt')))
+    output = sh.copy_files(mock_pairs + [(str(tmp_path / 'missing.txt'), str(tmp_path / 'target' / 'missing.txt'))], max_workers=3)
+    assert output == [True] * 5 + [False]
+    for (mock_source, mock_target) in mock_pairs:
+        assert open(mock_target).read() == open(mock_source).read()
+        assert os.stat(mock_target).st_mtime_ns == 1_000_000_123
+
+
+def test_hash_file(tmp_path):
+    """Verify the output of 'hash_file' function"""
+    mock_path = tmp_path / 'mock.txt'
+    mock_path.write_bytes(b'abc')
+    assert sh.hash_file(str(mock_path)) == 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'
+    assert sh.hash_file(str(mock_path), 'crc32') == '352441c2'
+    assert sh.hash_file(str(tmp_path / 'missing.txt')) == ''
+
+
+def test_match_file(tmp_path):
+    """Verify the output of 'match_file' function"""
+    mock_paths = [tmp_path / name for name in ('a.txt', 'b.txt', 'c.txt', 'd.txt')]
+    for (mock_path, content) in zip(mock_paths, (b'same', b'same', b'diff', b'longer')):
+        mock_path.write_bytes(content)
+    (path_a, path_b, path_c, path_d) = map(str, mock_paths)
+    assert sh.match_file(path_a, path_b)
+    assert not sh.match_file(path_a, path_c)
+    assert not sh.match_file(path_a, path_d)
+    assert sh.match_file(path_a, path_b, 'crc32')
+    assert not sh.match_file(path_a, str(tmp_path / 'missing.txt'))
+
+
+def test_open_hash_cache(tmp_path):
+    """Verify the output of 'open_hash_cache' function"""
+    mock_path = tmp_path / 'mock.txt'
+    mock_path.write_bytes(b'abc')
+    os.utime(mock_path, (0, 0))  # older than the racy window
+    hash_cache = sh.open_hash_cache(str(tmp_path / 'cache.sqlite3'))
+    try:
+        expected = sh.hash_file(str(mock_path))
+        assert hash_cache.misses == 1
+        assert sh.hash_file(str(mock_path)) == expected
+        assert hash_cache.hits == 1
+        mock_path.write_bytes(b'abd')
+        os.utime(mock_path, (0, 0))
+        assert sh.hash_file(str(mock_path)) != expected
+    finally:
+        sh.close_hash_cache()
+
+
 # --- JSON Commands ---
 
 def test_from_json():
@@ -111,3 +367,125 @@ def test_to_json():
 #     mock_path = "E:\\Repos\\pc-setup\\powershell\\provision_python.ps1"
 #     output = sh.is_json_parse(mock_path)
 #     assert output == "provision_python"
+
+
+# --- Process Commands ---
+
+def test_run_subprocesses():
+    """Verify the output of 'run_subprocesses' function"""
+    mock_commands = [['echo', str(i)] for i in range(6)]
+    output = sh.run_subprocesses(mock_commands, max_workers=3)
+    assert [process.stdout.strip() for process in output] == ['0', '1', '2', '3', '4', '5']
+    assert all(process.returncode == 0 for process in output)
+
+
+def test_run_subprocess_async():
+    """Verify the output of 'run_subprocess_async' function"""
+    streamed = []
+    output = asyncio.run(sh.run_subprocess_async(['echo', 'async'], on_output=lambda name, line: streamed.append((name, line))))
+    assert output.stdout.strip() == 'async'
+    assert output.returncode == 0
+    assert streamed == [('stdout', 'async\n')]
+
+
+def test_run_subprocess_async_timeout():
+    """Verify the output of 'run_subprocess_async' function when the timeout expires"""
+    try:
+        asyncio.run(sh.run_subprocess_async(['sleep', '5'], timeout=0.2))
+        assert False, 'expected subprocess.TimeoutExpired'
+    except subprocess.TimeoutExpired as e:
+        assert e.timeout == 0.2
+
+
+def test_gather_subprocesses():
+    """Verify the output of 'gather_subprocesses' function"""
+    mock_commands = [['echo', str(i)] for i in range(6)]
+    output = sh.gather_subprocesses(mock_commands, max_concurrency=3)
+    assert [process.stdout.strip() for process in output] == ['0', '1', '2', '3', '4', '5']
+    assert all(process.returncode == 0 for process in output)
+
+
+# ------------------------ SyncMatcher Class Test Commands ------------------------
+
+def test_sync_matcher_matches_dirsync(tmp_path):
+    """Verify 'select_entries' (SyncMatcher, with pruning) selects exactly what dirsync selects"""
+    mock_source = tmp_path / 'source'
+    mock_target = tmp_path / 'target'
+    mock_target.mkdir()
+    for mock_file in ('Screenshots/shot.png', 'Screenshots/old/shot.jpg', 'ScreenshotsBackup/x.png', 'settings.json',
+                      'snippets/a.json', 'cache/data.bin', 'cache/log/run.log', 'SavedVariables/x.lua',
+                      'AddOns/Addon/a.lua', 'logs/2024.txt', 'basic/global.ini', 'global.ini', 'FFXIV_CHR0040/x.dat',
+                      'notes.bak', 'a.b/c.txt', 'D3Prefs.txt'):
+        (mock_source / mock_file).parent.mkdir(parents=True, exist_ok=True)
+        (mock_source / mock_file).write_text(mock_file)
+    mock_corpus = [
+        {'only': ['Screenshots/*', 'D3Prefs.txt']},
+        {'only': ['Screenshots/*', r'.*\.txt$', 'SavedVariables/*', 'AddOns/*']},
+        {'only': ['screenshots/*', r'.*\.cfg$', r'.*\.dat$', 'FFXIV_CHR0040/*'], 'exclude': [r'.*/log.*']},
+        {'only': ['global.ini', 'basic/*']},
+        {'only': ['settings.json', 'snippets/*']},
+        {'only': [r'.*'], 'ignore': [r'.*\.bak$']},
+        {'only': [r'^a\.b/'], 'include': [r'a\.b/c']},
+        {'only': ['(?i)screenshots/.*']},
+        {'exclude': ['cache'], 'include': [r'cache/log/.*']},
+        {'exclude': ['cache/.*', 'logs$']},
+        {'exclude': ['Screenshots'], 'ignore': [r'.*\.bak$']},
+    ]
+    all_paths = {path.relative_to(mock_source).as_posix() for path in mock_source.rglob('*')}
+    for mock_options in mock_corpus:
+        syncer = dirsync.syncer.Syncer(str(mock_source), str(mock_target), 'diff', **mock_options)
+        # dirsync also adds mangled "ancestor" paths; only compare paths that exist
+        expected = {path.replace(os.sep, '/') for path in syncer._compare(str(mock_source), str(mock_target)).left_only}
+        output = {rel_path.replace(os.sep, '/') for (rel_path, _) in sh.select_entries(str(mock_source), mock_options)}
+        assert output == expected & all_paths, mock_options
+
+
+def test_sync_matcher_descend():
+    """Verify the output of 'SyncMatcher.descend' method"""
+    matcher = sh.sync_matcher({'only': ['settings.json', 'snippets/*']})
+    assert matcher is sh.sync_matcher({'only': ['settings.json', 'snippets/*']})
+    assert matcher.descend('snippets') and not matcher.descend('cache')
+    assert not sh.sync_matcher({'exclude': ['cache/.*']}).descend('cache')
+    assert sh.sync_matcher({'exclude': ['cache/.*'], 'include': ['cache/log/']}).descend('cache')
+    assert sh.sync_matcher({'exclude': [r'cache/.*\.log$']}).descend('cache')
+    assert sh.sync_matcher({'only': ['(?i)screenshots/.*']}).descend('Screenshots')
+
+
+# ------------------------ SubProcess Class Test Commands ------------------------
+
+
+def test_subprocess_stream_lines():
+    """Verify the output of 'SubProcess.stream_lines' method"""
+    mock_script = 'import sys\nfor i in range(100): print(i)\nprint("done", file=sys.stderr)'
+    process = sh.SubProcess([sys.executable, '-c', mock_script])
+    output = list(process.stream_lines(max_buffered=2))
+    assert [line for (stream, line) in output if stream == 'stdout'] == [str(i) for i in range(100)]
+    assert ('stderr', 'done') in output
+    assert process.rc == 0
+
+
+# ------------------------ ShellSessionPool Class Test Commands ------------------------
+
+
+def test_shell_session_pool():
+    """Verify the output of 'ShellSessionPool.run' and 'ShellSessionPool.close' methods"""
+    pool = sh.ShellSessionPool(size=1)
+    assert pool.run(['echo', 'warm']).stdout == 'warm\n'
+    assert pool.run(['echo', '$MOCK_VALUE'], env={'MOCK_VALUE': 'layered'}).stdout == 'layered\n'
+    # Every session is busy: the waiting caller must be released when the pool closes
+    results = []
+    busy = threading.Thread(target=lambda: results.append(pool.run(['sleep', '1'])))
+    busy.start()
+    deadline = time.monotonic() + 5
+    while (not pool._created or pool._idle) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool._created and not pool._idle
+    waiting = threading.Thread(target=lambda: results.append(pool.run(['echo', 'late'])))
+    waiting.start()
+    waiting.join(timeout=0.2)
+    assert waiting.is_alive() and not results  # blocked on the busy session
+    pool.close()
+    busy.join(timeout=5)
+    waiting.join(timeout=5)
+    assert not busy.is_alive() and not waiting.is_alive()
+    assert None in results and pool._created == 0
@@ -21,6 +21,7 @@ $pip_packages = @(
     'pyinstaller' # https://pyinstaller.org/en/stable
     'requests' # https://requests.readthedocs.io
     'watchdog'
+    'zstandard' # https://github.com/indygreg/python-zstandard (pc_clean --archive)
 
     # --- Projects ---
     # https://learn.microsoft.com/en-us/azure/developer/python/configure-local-development-environment
@@ -58,6 +59,7 @@ $python_user_boilerplate_modules = @(
     'azure_devops_boilerplate'
     'dotnet_boilerplate'
     'git_boilerplate'
+    'backup_boilerplate'
     # 'xml_boilerplate'
     # 'multiprocess_boilerplate'
     # 'daemon_boilerplate'